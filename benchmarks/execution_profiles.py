@@ -0,0 +1,70 @@
+"""
+Training and prediction throughput of the ModelV3 network per execution profile. Every profile runs in a fresh
+interpreter, because oneDNN and the TensorFlow thread pools are fixed when TensorFlow starts. Training samples/sec is
+measured over the epochs after the first (tracing and XLA compilation), prediction over the second predict call.
+
+    python benchmarks/execution_profiles.py [profile ...]
+"""
+import os
+import sys
+import json
+import time
+import subprocess
+
+ROWS = 100000
+EPOCHS = 3
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_profile(profile_name):
+    from main.execution_profile import ExecutionProfile
+    profile = ExecutionProfile.apply(profile_name)
+    import numpy as np
+    import tensorflow as tf
+    from main.model_train_v3 import ModelV3, N_CLASS
+    from main.feature_store import FeatureStore
+    from main.model_train_v3 import FEATURE_CONFIG, DROP_COLS
+
+    try: n_features = len(FeatureStore.feature_names(FEATURE_CONFIG, DROP_COLS))
+    except (OSError, FileNotFoundError): n_features = 60
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(ROWS, n_features)).astype("float32")
+    y = tf.keras.utils.to_categorical(rng.integers(0, N_CLASS, ROWS), N_CLASS)
+    ds_train = tf.data.Dataset.from_tensor_slices((x, y)).batch(profile.get("batch_size")).cache().prefetch(tf.data.AUTOTUNE)
+
+    normalizer = tf.keras.layers.Normalization(axis=-1, dtype="float32")
+    normalizer.adapt(x)
+    model = ModelV3._get_model(normalizer, jit_compile=profile.get("jit_compile"))
+    epoch_seconds = []
+
+    class EpochTimer(tf.keras.callbacks.Callback):
+        def on_epoch_begin(self, epoch, logs=None): self.start_time = time.perf_counter()
+        def on_epoch_end(self, epoch, logs=None): epoch_seconds.append(time.perf_counter() - self.start_time)
+
+    model.fit(ds_train, epochs=EPOCHS, callbacks=[EpochTimer()], verbose=0)
+    predict_seconds = []
+    for _ in range(2):
+        start_time = time.perf_counter()
+        model.predict(x, batch_size=profile.get("predict_batch_size"), verbose=0)
+        predict_seconds.append(time.perf_counter() - start_time)
+    return {"profile": profile_name, "train_samples_per_sec": round(ROWS * (EPOCHS - 1) / sum(epoch_seconds[1:])),
+            "predict_samples_per_sec": round(ROWS / predict_seconds[-1]), "first_epoch_s": round(epoch_seconds[0], 2)}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--worker":
+        sys.path.insert(0, REPOSITORY_PATH)
+        os.chdir(REPOSITORY_PATH)
+        print(json.dumps(run_profile(sys.argv[2])))
+        sys.exit(0)
+    profile_names = sys.argv[1:] or list(json.load(open(os.path.join(REPOSITORY_PATH, "config/execution_profiles.json"))).keys())
+    print("profile".ljust(16), "train samples/s".rjust(16), "predict samples/s".rjust(18), "first epoch".rjust(12))
+    for profile_name in profile_names:
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", profile_name], cwd=REPOSITORY_PATH,
+                                env=dict(os.environ, TF_CPP_MIN_LOG_LEVEL="3"), capture_output=True, text=True)
+        if result.returncode != 0:
+            print(profile_name.ljust(16), "failed: ", result.stderr.strip().splitlines()[-1])
+            continue
+        row = json.loads(result.stdout.strip().splitlines()[-1])
+        print(profile_name.ljust(16), str(row["train_samples_per_sec"]).rjust(16), str(row["predict_samples_per_sec"]).rjust(18),
+              (str(row["first_epoch_s"]) + "s").rjust(12))
@@ -0,0 +1,165 @@
+"""
+Runtime and memory of every preprocessing step and the ingestion on synthetic bronze data of growing size. Size 1x is
+--leagues x --seasons x --teams (a double round robin per season), every scale multiplies the number of leagues. Each
+scale runs in a fresh work directory and each step in a fresh interpreter, wall time, cpu time, rows read and peak RSS
+(including the interpreter and its imports) are taken from the step's StageMetrics record. A step that fails or runs
+longer than --max-seconds is not run at the larger scales. After the first pass every finished step runs a second
+time on the silver and gold it wrote, like an incremental rerun on unchanged bronze, and has to write the same tables
+with the same columns and rows. The growth exponent
+log(t_large / t_small) / log(scale_large / scale_small) of the two largest measured scales tells how a step scales:
+~1 linear, ~2 quadratic. Steps with a known scaling limitation are listed below the table (KNOWN_LIMITATIONS).
+
+    python benchmarks/preprocessing_scale.py [--scales 1 5 20] [--steps player_elo relationships] [--max-seconds 600]
+"""
+import os
+import sys
+import json
+import glob
+import math
+import shutil
+import argparse
+import tempfile
+import subprocess
+import pyarrow.parquet as pq
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_PATH)
+from main.build_cache import STAGE_FILES
+from main.executor import PREPROCESS_TABLES, STAGE_DEPENDENCIES
+from main.stage_metrics import METRICS_PATH, METRICS_FILE
+from main.synthetic_data import SyntheticData
+
+STEPS = PREPROCESS_TABLES + ["ingestion"]
+# printed with the report, small scales are dominated by the interpreter and imports and hide these
+KNOWN_LIMITATIONS = {
+    "player_elo": "Preprocessor._player_elo rates row by row with iterrows and filters the whole player table per "
+                  "new row, the time per new row grows with the table, so the step turns quadratic at large scales "
+                  "and stays the slowest step on a first run",
+}
+
+
+def run_step(work_path, step, max_seconds):
+    try:
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", step], cwd=work_path,
+                                env=dict(os.environ, TF_CPP_MIN_LOG_LEVEL="3"), capture_output=True, text=True,
+                                timeout=max_seconds)
+    except subprocess.TimeoutExpired:
+        return {"step": step, "status": "timeout"}
+    if result.returncode != 0:
+        return {"step": step, "status": "failed: " + (result.stderr.strip().splitlines() or ["?"])[-1]}
+    with open(os.path.join(work_path, METRICS_PATH, METRICS_FILE), 'r') as metrics_file:
+        records = [json.loads(line) for line in metrics_file if line.strip() != ""]
+    return [record for record in records if record["step"] == "stage." + step][-1]
+
+
+def output_tables(work_path, step):
+    # columns and rows of every parquet file the step writes
+    tables = dict()
+    for output_path in STAGE_FILES[step][1]:
+        for file_path in sorted(glob.glob(os.path.join(work_path, output_path, "**", "*.parquet"), recursive=True)):
+            metadata = pq.read_metadata(file_path)
+            tables[os.path.relpath(file_path, work_path)] = (metadata.schema.to_arrow_schema().names, metadata.num_rows)
+    return tables
+
+
+def rerun_step(work_path, step, max_seconds):
+    first_tables = output_tables(work_path, step)
+    result = run_step(work_path, step, max_seconds)
+    if result["status"] != "ok": return result
+    second_tables = output_tables(work_path, step)
+    changed = [path for path in sorted(set(first_tables) | set(second_tables))
+               if first_tables.get(path) != second_tables.get(path)]
+    if len(changed) > 0: return {"step": step, "status": "failed: second run changed " + ", ".join(changed)}
+    return result
+
+
+def run_scale(scale, steps, args, skip):
+    work_path = tempfile.mkdtemp(prefix="krake_paul_scale_")
+    try:
+        shutil.copytree(os.path.join(REPOSITORY_PATH, "config"), os.path.join(work_path, "config"))
+        os.makedirs(os.path.join(work_path, "job_bookmark"))
+        rows = SyntheticData.generate(leagues=args.leagues * scale, seasons=args.seasons, teams=args.teams,
+                                      seed=args.seed, bronze_path=os.path.join(work_path, "data", "bronze"))
+        results = dict()
+        for step in steps:
+            # dropped at an earlier scale, or a step it reads from did not finish at this one
+            if step in skip or any(results.get(upstream, {}).get("status", "ok") != "ok" for upstream in STAGE_DEPENDENCIES[step]):
+                results[step] = {"step": step, "status": "skipped"}
+                continue
+            results[step] = run_step(work_path, step, args.max_seconds)
+            if results[step]["status"] != "ok": skip.add(step)
+            print("scale ", scale, "x ", step.ljust(18), results[step]["status"],
+                  str(round(results[step].get("wall_seconds", 0), 2)) + "s", flush=True)
+        for step in [step for step in steps if results[step]["status"] == "ok"]:
+            rerun = rerun_step(work_path, step, args.max_seconds)
+            results[step]["second_run"] = rerun["status"]
+            results[step]["second_run_seconds"] = rerun.get("wall_seconds")
+            print("scale ", scale, "x ", step.ljust(18), "second run", rerun["status"],
+                  str(round(rerun.get("wall_seconds", 0), 2)) + "s", flush=True)
+        return rows, results
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+
+
+def growth_exponent(scales, seconds):
+    measured = [(scale, value) for scale, value in zip(scales, seconds) if value is not None and value > 0]
+    if len(measured) < 2: return None
+    (small_scale, small_seconds), (large_scale, large_seconds) = measured[-2], measured[-1]
+    return math.log(large_seconds / small_seconds) / math.log(large_scale / small_scale)
+
+
+def print_report(scales, steps, results, bronze_rows):
+    print("\nbronze player_stats rows: ", ", ".join(str(scale) + "x=" + str(bronze_rows[scale]["player_stats"]) for scale in scales))
+    header = "step".ljust(18) + "".join(("s@" + str(scale) + "x").rjust(10) for scale in scales)
+    header += "".join(("mb@" + str(scale) + "x").rjust(10) for scale in scales) + "exponent".rjust(10) + "  second run"
+    print(header)
+    for step in steps:
+        seconds, peaks = [], []
+        for scale in scales:
+            result = results[scale][step]
+            ok = result["status"] == "ok"
+            seconds.append(result["wall_seconds"] if ok else None)
+            peaks.append(result["peak_rss_bytes"] / 2 ** 20 if ok else None)
+        line = step.ljust(18)
+        line += "".join((str(round(value, 2)) if value is not None else results[scale][step]["status"].split(":")[0]).rjust(10)
+                        for scale, value in zip(scales, seconds))
+        line += "".join((str(round(value)) if value is not None else "-").rjust(10) for value in peaks)
+        exponent = growth_exponent(scales, seconds)
+        line += (str(round(exponent, 2)) if exponent is not None else "-").rjust(10)
+        second_runs = [str(scale) + "x " + results[scale][step]["second_run"] for scale in scales
+                       if results[scale][step].get("second_run", "ok") != "ok"]
+        print(line + "  " + ("; ".join(second_runs) if len(second_runs) > 0 else "ok"))
+    for step in [step for step in steps if step in KNOWN_LIMITATIONS]:
+        print("note: ", step, ": ", KNOWN_LIMITATIONS[step])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--worker":
+        from main.executor import Executor
+        Executor(force=True).execute([sys.argv[2]])
+        sys.exit(0)
+    parser = argparse.ArgumentParser(description="preprocessing runtime and memory on synthetic data of growing size")
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 5, 20])
+    parser.add_argument("--steps", nargs="+", default=STEPS, choices=STEPS,
+                        help="steps to measure, the steps they depend on run too")
+    parser.add_argument("--leagues", type=int, default=1, help="leagues at 1x")
+    parser.add_argument("--seasons", type=int, default=2)
+    parser.add_argument("--teams", type=int, default=10, help="teams per league")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-seconds", type=int, default=600, help="per step, slower steps are dropped at larger scales")
+    parser.add_argument("--output", default=None, help="also write the results as json lines to this file")
+    args = parser.parse_args()
+
+    from main.executor import Executor
+    needed = set(step for selected in args.steps for step in Executor().plan(until=selected))
+    steps = [step for step in Executor().plan(["preprocess", "ingestion"]) if step in needed]
+    scales = sorted(args.scales)
+    skip, results, bronze_rows = set(), dict(), dict()
+    for scale in scales:
+        bronze_rows[scale], results[scale] = run_scale(scale, steps, args, skip)
+    print_report(scales, steps, results, bronze_rows)
+    if args.output is not None:
+        with open(args.output, 'a') as output_file:
+            for scale in scales:
+                for result in results[scale].values():
+                    output_file.write(json.dumps(dict(result, scale=scale, bronze_rows=bronze_rows[scale])) + "\n")
@@ -0,0 +1,40 @@
+"""
+Startup time per stage: every stage's imports run in a fresh interpreter, the wall time is the best of REPEAT runs
+minus the bare interpreter start.
+
+    python benchmarks/startup_time.py
+"""
+import os
+import subprocess
+import sys
+import time
+
+REPEAT = 3
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGE_IMPORTS = {"cli": "import main.executor",
+                 "scrape_kicker": "from main.kicker_scraper import KickerScraper",
+                 "scrape_fifa": "from main.fifa_scraper import FifaScraper",
+                 "preprocess": "from main.preprocessor import Preprocessor",
+                 "ingestion": "from main.ingestor import Ingestor",
+                 "train": "from main.model_train_v3 import ModelV3; from main.input_pipeline import InputPipeline",
+                 "predict (numpy)": "from main.model_train_v3 import ModelV3; from main.numpy_model import NumpyModel",
+                 "predict (tensorflow)": "from main.model_train_v3 import ModelV3; import tensorflow",
+                 "evaluate": "from main.betmaker import BetMaker"}
+
+
+def run_seconds(statement):
+    best = None
+    for _ in range(REPEAT):
+        start_time = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], cwd=REPOSITORY_PATH, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    interpreter_seconds = run_seconds("pass")
+    print("interpreter start ", round(interpreter_seconds * 1000), "ms")
+    for stage, statement in STAGE_IMPORTS.items():
+        print(stage.ljust(22), str(round((run_seconds(statement) - interpreter_seconds) * 1000)).rjust(6), "ms")
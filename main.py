@@ -1,5 +1,31 @@
-from main.executor import Executor
+import os
+import argparse
+from main.executor import Executor, STAGE_DEPENDENCIES, PREPROCESS_TABLES, MODELS
+from main.execution_profile import PROFILE_ENV
 
 if __name__ == "__main__":
-    executor = Executor()
-    executor.execute()
+    stage_names = list(STAGE_DEPENDENCIES.keys()) + ["preprocess"]
+    parser = argparse.ArgumentParser(description="krake paul: scrape, preprocess, ingest, train, predict and evaluate")
+    parser.add_argument("stages", nargs="*", default=None,
+                        help="run only these stages (default: predict), one of " + ", ".join(stage_names))
+    parser.add_argument("--only", nargs="+", default=None, help="same as the positional stages")
+    parser.add_argument("--until", default=None, help="run this stage and every stage upstream of it")
+    parser.add_argument("--jobs", type=int, default=1, help="independent stages run in this many processes at once")
+    parser.add_argument("--force", action="store_true", help="rerun stages whose inputs did not change")
+    parser.add_argument("--models", nargs="+", default=["v4"], choices=MODELS, help="models to train or predict")
+    parser.add_argument("--tables", nargs="+", default=PREPROCESS_TABLES, choices=PREPROCESS_TABLES,
+                        help="tables run by the preprocess stage")
+    parser.add_argument("--start-year", type=int, default=13)
+    parser.add_argument("--end-year", type=int, default=24)
+    parser.add_argument("--profile", default=None,
+                        help="execution profile from config/execution_profiles.json for training and prediction")
+    args = parser.parse_args()
+    args.stages = args.stages or args.only
+    for stage in (args.stages or []) + ([args.until] if args.until is not None else []):
+        if stage not in stage_names: parser.error("unknown stage " + stage + ", choose from " + ", ".join(stage_names))
+    if args.stages and args.until is not None: parser.error("give either stages or --until")
+    if args.until == "preprocess": parser.error("--until takes a single stage, e.g. --until relationships")
+
+    if args.profile is not None: os.environ[PROFILE_ENV] = args.profile
+    executor = Executor(args.start_year, args.end_year, args.models, args.tables, args.force)
+    executor.execute(args.stages or None, args.until, args.jobs)
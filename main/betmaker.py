@@ -1,17 +1,27 @@
-import requests
-from bs4 import BeautifulSoup
 import json
 import time
+import itertools
 from datetime import datetime
 import pandas as pd
 import numpy as np
-from sklearn import linear_model
-import hashlib
 pd.options.mode.chained_assignment = None  # default='warn'
 from tqdm import tqdm
 import glob
-import Levenshtein
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.csv as pv
+from rapidfuzz import fuzz, utils
+from .fuzzy_matcher import FuzzyMatcher
+from .job_bookmark import JobBookmark
+from .stage_metrics import StageMetrics
 
+BACKTEST_CONFIG = './config/backtest.json'
+# strategies simulated at once, bounds the (strategies, bets) arrays
+STRATEGY_CHUNK = 256
+FUT_TEXT_COLUMNS = ["Div", "Country", "League", "Season", "Date", "Time", "HomeTeam", "AwayTeam", "Home", "Away",
+                    "FTR", "HTR", "Res", "Referee"]
 
 class BetMaker:
 
@@ -19,9 +29,96 @@ class BetMaker:
         self.load_timestamp = str(datetime.now())
 
     @classmethod
-    def evaluate_bets(cls):
-        #cls._load_fut_data()
-        cls._match_bets()
+    @StageMetrics.step
+    def evaluate_bets(cls, backtest_config_path=BACKTEST_CONFIG):
+        cls._load_fut_data()
+        backtest_config = json.load(open(backtest_config_path, 'r'))
+        if len(glob.glob(backtest_config.get("predictions"))) == 0:
+            raise FileNotFoundError("backtest predictions " + backtest_config.get("predictions") + " not found, train the"
+                                    " model that writes them or change \"predictions\" in " + backtest_config_path)
+        df_bets = cls._match_bets(backtest_config.get("predictions"))
+        # the prediction files score every game, the games the model was trained or early stopped on are left out
+        split = backtest_config.get("split")
+        if split is not None:
+            from .input_pipeline import InputPipeline
+            in_split = InputPipeline._split_mask(df_bets["game_id"].to_numpy(), split, backtest_config.get("test_size"),
+                                                 backtest_config.get("validation_size", 0.0))
+            print("backtesting the ", split, " split: ", int(in_split.sum()), " of ", len(in_split), " matched games")
+            df_bets = df_bets[in_split]
+        df_bets = df_bets.sort_values(by=["kick_off_date", "game_id"], kind="mergesort")
+        odds = df_bets[backtest_config.get("odds_columns")].apply(pd.to_numeric, errors="coerce").to_numpy()
+        outcomes = np.select([df_bets["home_goals"] > df_bets["away_goals"], df_bets["home_goals"] == df_bets["away_goals"]],
+                             [0, 1], 2)
+        df_backtest = cls.backtest(df_bets[backtest_config.get("prediction_columns")].to_numpy(), odds, outcomes,
+                                   df_bets["league_code"].to_numpy(), backtest_config.get("edge_thresholds"),
+                                   backtest_config.get("stakings"), backtest_config.get("league_filters"),
+                                   max_stake=backtest_config.get("max_stake"))
+        df_backtest.insert(0, "split", "all" if split is None else split)
+        print(df_backtest.sort_values(by=["roi"], ascending=False).head(10).to_string(index=False))
+        cls._write_parquet(df_backtest, './data/gold/backtest/backtest.parquet')
+        return df_backtest
+
+    @classmethod
+    @StageMetrics.step
+    def backtest(cls, probabilities, odds, outcomes, league_codes, edge_thresholds, stakings, league_filters,
+                 max_stake=0.25, return_curves=False):
+        """
+        Simulates every combination of edge threshold, staking and league filter over games in chronological order.
+        probabilities and odds are (games, outcomes) arrays, outcomes holds the index of the realised outcome. On each
+        game the outcome with the largest edge p * odds - 1 is bet once the edge reaches the threshold. A flat stake is
+        a share of the starting bankroll, a Kelly stake the given fraction of the Kelly share of the current bankroll
+        (capped at max_stake), so Kelly bankrolls compound as a cumulative product of the bet returns.
+        """
+        probabilities = np.asarray(probabilities, dtype="float64")
+        odds = np.asarray(odds, dtype="float64")
+        valid = np.isfinite(odds).all(axis=1) & (odds > 1).all(axis=1) & np.isfinite(probabilities).all(axis=1)
+        odds = np.where(valid[:, None], odds, 2.0)
+        edges = np.where(valid[:, None], probabilities * odds - 1, -np.inf)
+        pick = np.argmax(edges, axis=1)
+        rows = np.arange(len(pick))
+        edge = edges[rows, pick]
+        won = pick == np.asarray(outcomes)
+        unit_return = np.where(won, odds[rows, pick] - 1, -1.0)
+        kelly_share = np.where(valid, np.clip(edge / (odds[rows, pick] - 1), 0, None), 0.0)
+
+        strategies = list(itertools.product(edge_thresholds, stakings, league_filters))
+        league_masks = {str(league_filter): np.ones(len(pick), dtype=bool) if league_filter is None
+                        else np.isin(league_codes, league_filter) for league_filter in league_filters}
+        metric_list = []
+        curve_list = []
+        for chunk_start in range(0, len(strategies), STRATEGY_CHUNK):
+            chunk = strategies[chunk_start:chunk_start + STRATEGY_CHUNK]
+            threshold = np.array([edge_threshold for edge_threshold, _, _ in chunk])[:, None]
+            is_kelly = np.array([staking[0] == "kelly" for _, staking, _ in chunk])[:, None]
+            stake_value = np.array([staking[1] for _, staking, _ in chunk], dtype="float64")[:, None]
+            bet = (edge[None, :] >= threshold) & np.stack([league_masks[str(league_filter)] for _, _, league_filter in chunk])
+            stake = np.where(bet, np.where(is_kelly, np.minimum(stake_value * kelly_share[None, :], max_stake), stake_value), 0.0)
+
+            bankroll = np.where(is_kelly, np.exp(np.cumsum(np.log1p(stake * unit_return[None, :]), axis=1)),
+                                1 + np.cumsum(stake * unit_return[None, :], axis=1))
+            bankroll_before = np.concatenate([np.ones((len(chunk), 1)), bankroll[:, :-1]], axis=1)
+            turnover = np.where(is_kelly, stake * bankroll_before, stake).sum(axis=1)
+            peak = np.maximum.accumulate(np.maximum(bankroll, 1.0), axis=1)
+            final_bankroll = bankroll[:, -1] if len(pick) > 0 else np.ones(len(chunk))
+            bets = bet.sum(axis=1)
+            metric_list.append(pd.DataFrame({
+                "edge_threshold": threshold[:, 0],
+                "staking": np.where(is_kelly[:, 0], "kelly", "flat"),
+                "stake": stake_value[:, 0],
+                "league_filter": ["all" if league_filter is None else ",".join(league_filter) for _, _, league_filter in chunk],
+                "bets": bets,
+                "hit_rate": (bet & won[None, :]).sum(axis=1) / np.maximum(bets, 1),
+                "turnover": turnover,
+                "profit": final_bankroll - 1,
+                "roi": (final_bankroll - 1) / np.where(turnover > 0, turnover, np.nan),
+                "max_drawdown": (1 - bankroll / peak).max(axis=1, initial=0.0),
+                "final_bankroll": final_bankroll}))
+            if return_curves: curve_list.append(bankroll.astype("float32"))
+
+        df_backtest = pd.concat(metric_list, ignore_index=True)
+        print("backtested ", len(strategies), " strategies on ", int(valid.sum()), " games with odds")
+        if return_curves: return df_backtest, np.concatenate(curve_list)
+        return df_backtest
 
 
     @classmethod
@@ -35,110 +132,188 @@ class BetMaker:
             print(base_path, " was None")
             return None
         df = pd.concat(df_list)
+        StageMetrics.count_read(len(df.index), sum(os.path.getsize(file) for file in files))
         print("finished reading ", base_path, " with ", len(df.index), " records")
         return df
 
     @classmethod
     def _write_parquet(cls, df, file_path):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
         df = df.drop_duplicates()
         df["modify_timestamp"] = str(datetime.now())
         df.to_parquet(file_path, index=False)
+        StageMetrics.count_write(len(df.index), os.path.getsize(file_path))
         print("finished writing ", file_path, " with ", len(df.index), " records")
 
     @classmethod
-    def _read_csv(cls, base_path):
-        files = glob.glob(base_path, recursive=True)
-        df_list = []
-        for file in files:
+    @StageMetrics.step
+    def _load_fut_data(cls, load_type="latest"):
+        # every csv becomes its own silver parquet file, a csv is only read again when its size or mtime changed
+        file_signatures = JobBookmark.get_data_scraped("fut_data_loader")
+        if load_type == "full" or len(file_signatures) == 0:
+            shutil.rmtree('./data/silver/fut_data/', ignore_errors=True)
+            JobBookmark.delete_bookmark("fut_data_loader")
+            file_signatures = dict()
+        files = sorted(glob.glob('./data/bronze/fut_data/**/*.csv', recursive=True))
+        changed_files = [file for file in files if file_signatures.get(file) != cls._file_signature(file)]
+        print("loading ", len(changed_files), " of ", len(files), " fut_data csv files")
+
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as thread_pool:
+            for file, df_fut_data in zip(changed_files, thread_pool.map(cls._read_fut_csv, changed_files)):
+                if df_fut_data is None: continue
+                cls._write_parquet(df_fut_data, './data/silver/fut_data/' + os.path.relpath(file, './data/bronze/fut_data/')
+                                   .replace(os.sep, "_").replace(".csv", ".parquet"))
+                JobBookmark.update_bookmark("fut_data_loader", file, cls._file_signature(file))
+
+    @classmethod
+    def _read_fut_csv(cls, file):
+        # text columns are declared, arrow infers the odds as doubles and skips malformed rows
+        parse_options = pv.ParseOptions(invalid_row_handler=lambda row: "skip")
+        convert_options = pv.ConvertOptions(column_types={column: pa.string() for column in FUT_TEXT_COLUMNS},
+                                            null_values=["", "NA", "N/A", "#N/A", "-"], strings_can_be_null=True)
+        try:
             try:
-                df_tmp = pd.read_csv(file, header=0, on_bad_lines='skip', encoding_errors='replace')
-                df_list.append(df_tmp)
-            except pd.errors.EmptyDataError:
-                print("EmptyDataError for ", file)
-            except Exception as e:
-                print("Error for ", file, " : ", e)
-        if len(df_list) == 0:
-            print(base_path, " was None")
+                table = pv.read_csv(file, parse_options=parse_options, convert_options=convert_options)
+            except pa.ArrowInvalid:
+                # older seasons are latin-1 encoded
+                table = pv.read_csv(file, read_options=pv.ReadOptions(encoding="latin1"), parse_options=parse_options,
+                                    convert_options=convert_options)
+        except (pa.ArrowInvalid, OSError) as e:
+            print("Error for ", file, " : ", e)
             return None
-        df = pd.concat(df_list, axis=0, ignore_index=True)
-        print("finished reading ", base_path, " with ", len(df.index), " records")
-        return df
+        keep = [index for index, column in enumerate(table.column_names) if column.strip() != ""]
+        df_fut_data = table.select(keep).to_pandas()
+        df_fut_data = df_fut_data.loc[:, ~df_fut_data.columns.duplicated()]
+
+        numeric_columns = [column for column in df_fut_data.columns
+                           if column not in FUT_TEXT_COLUMNS and not pd.api.types.is_numeric_dtype(df_fut_data[column])]
+        df_fut_data[numeric_columns] = df_fut_data[numeric_columns].apply(pd.to_numeric, errors="coerce")
+        if "Season" in df_fut_data.columns: df_fut_data["Season"] = df_fut_data["Season"].str.split("/").str[0]
+        df_fut_data = df_fut_data.rename(columns={column: column.lower().replace(" ", "_").replace(":", "")
+                                                  for column in df_fut_data.columns})
+        return df_fut_data
 
     @classmethod
-    def _load_fut_data(cls):
-        df_fut_data = cls._read_csv('./data/bronze/fut_data/**/*.csv')
-        df_fut_data["Season"] = df_fut_data["Season"].str.split("/")[0]
-        df_fut_data["BbAH"] = df_fut_data["BbAH"].str.extract('(\d+)', expand=False).astype(float)
-        df_fut_data["BbAHh"] = df_fut_data["BbAHh"].str.extract('(\d+)', expand=False).astype(float)
-        df_fut_data["PSCH"] = df_fut_data["PSCH"].str.extract('(\d+)', expand=False).astype(float)
-        df_fut_data["B365CH"] = df_fut_data["B365CH"].str.extract('(\d+)', expand=False).astype(float)
-        df_fut_data["BWCA"] = df_fut_data["BWCA"].str.extract('(\d+)', expand=False).astype(float)
-        cols = df_fut_data.columns
-        for column in cols:
-            df_fut_data = df_fut_data.rename(columns={column: column.lower().replace(" ","_").replace(":","")})
-        cls._write_parquet(df_fut_data, './data/silver/fut_data/fut_data.parquet')
-        return
+    def _file_signature(cls, file):
+        file_stat = os.stat(file)
+        return str(file_stat.st_size) + "_" + str(file_stat.st_mtime_ns)
 
     @classmethod
-    def _match_bets(cls):
-        df_predictions = cls._read_parquet('./data/gold/predictions/model_predictions_v3.parquet')
-        df_match_info = cls._read_parquet('./data/silver/match_info/*')[["game_id","kick_off_date"]]
+    @StageMetrics.step
+    def _match_bets(cls, predictions_path='./data/gold/predictions/model_predictions_v3.parquet'):
+        df_predictions = cls._read_parquet(predictions_path)
+        df_fixtures = cls._kicker_fixtures()
+        df_fut_data = cls._fut_fixtures(cls._read_parquet('./data/silver/fut_data/*'))
 
+        # team names are resolved once per (league, name) through the alias table, then fixtures are hash joined
+        # on (league, kick-off date, home team, away team)
+        df_team_alias = cls._team_alias(df_fixtures, df_fut_data)[["league_code", "fut_team", "kicker_team"]]
+        df_fut_data = df_fut_data.merge(df_team_alias.rename(columns={"fut_team": "home", "kicker_team": "home_team"}),
+                                        on=["league_code", "home"], how="inner")
+        df_fut_data = df_fut_data.merge(df_team_alias.rename(columns={"fut_team": "away", "kicker_team": "away_team"}),
+                                        on=["league_code", "away"], how="inner")
+        df_matched = df_fixtures.merge(df_fut_data, on=["league_code", "kick_off_date", "home_team", "away_team"],
+                                       how="inner").drop(columns=["home_team", "away_team"])
+        print("matched ", len(df_matched.index), " of ", len(df_fixtures.index), " kicker games to odds")
 
-        df_match_info['kick_off_date'] = df_match_info['kick_off_date'].dt.date
+        df_bets = df_predictions.merge(df_matched, on=["game_id"], how="inner")
+        cls._write_parquet(df_bets, './data/gold/matched_bets/matched_bets.parquet')
+        return df_bets
 
-        df_predictions = df_predictions.merge(df_match_info, on=["game_id"], how="inner")
+    @classmethod
+    def _kicker_fixtures(cls):
+        df_match_info = cls._read_parquet('./data/silver/match_info/*')[["game_id", "kick_off_date", "league_code"]]
+        df_team_elo = cls._read_parquet('./data/silver/team_elo/*')[["game_id", "home_team", "away_team"]]
+        df_fixtures = df_match_info.merge(df_team_elo, on=["game_id"], how="inner")
+        df_fixtures["kick_off_date"] = df_fixtures["kick_off_date"].dt.normalize()
+        return df_fixtures
 
-        df_fut_data = cls._read_parquet('./data/silver/fut_data/*')
+    @classmethod
+    def _fut_fixtures(cls, df_fut_data):
+        # main league files name the league by "div" and the teams "hometeam"/"awayteam",
+        # the extra league files by "country" + "league" and "home"/"away"
+        mapping_leagues_fut = json.load(open('./config/mapping_leagues_fut.json', 'r'))
+        league_code = pd.Series(None, index=df_fut_data.index, dtype=object)
+        if "div" in df_fut_data.columns:
+            league_code = df_fut_data["div"].map(mapping_leagues_fut.get("div"))
+        if "country" in df_fut_data.columns and "league" in df_fut_data.columns:
+            country_league = df_fut_data["country"].astype(str) + "|" + df_fut_data["league"].astype(str)
+            league_code = league_code.fillna(country_league.map(mapping_leagues_fut.get("country_league")))
+        df_fut_data["league_code"] = league_code
 
-        df_fut_data["kick_off_date"] = pd.to_datetime(df_fut_data["date"], format='mixed')
-        df_fut_data["kick_off_date"] = df_fut_data["kick_off_date"].dt.date
-        df_fut_data["game_id_string"] = df_fut_data["league"].astype(str) + df_fut_data["kick_off_date"].astype(str) + df_fut_data["home"].astype(str) + df_fut_data["away"].astype(str)
-        print(df_fut_data["game_id_string"])
+        for indicator in ["home", "away"]:
+            if indicator not in df_fut_data.columns: df_fut_data[indicator] = None
+            if indicator + "team" in df_fut_data.columns:
+                df_fut_data[indicator] = df_fut_data[indicator].fillna(df_fut_data[indicator + "team"])
+            df_fut_data[indicator] = df_fut_data[indicator].str.strip()
 
-        #df_fut_data["game_id_fut"] = str(hashlib.md5(df_fut_data["game_id_string"]).hexdigest())
-        df_fut_data['game_id_fut'] = [hashlib.md5(val.encode('utf-8')).hexdigest() for val in df_fut_data['game_id_string']]
-        df_fut_data = df_fut_data.drop_duplicates('game_id_fut')
-        #print(df_fut_data.groupby(["league"]).count().reset_index())
+        df_fut_data["kick_off_date"] = pd.to_datetime(df_fut_data["date"], format='mixed', dayfirst=True,
+                                                      errors='coerce').dt.normalize()
+        df_fut_data = df_fut_data[df_fut_data["league_code"].notnull() & df_fut_data["kick_off_date"].notnull()]
+        df_fut_data["game_id_fut"] = pd.util.hash_pandas_object(
+            df_fut_data[["league_code", "kick_off_date", "home", "away"]], index=False).values
+        return df_fut_data.drop_duplicates('game_id_fut')
 
-        print(df_fut_data["game_id_fut"])
+    @classmethod
+    def _team_alias(cls, df_fixtures, df_fut_data, threshold=80):
+        df_team_alias = cls._read_parquet('./data/silver/team_alias/*')
+        df_kicker_teams = pd.concat([df_fixtures[["league_code", "home_team"]].rename(columns={"home_team": "kicker_team"}),
+                                     df_fixtures[["league_code", "away_team"]].rename(columns={"away_team": "kicker_team"})]
+                                    ).dropna().drop_duplicates()
+        df_fut_teams = pd.concat([df_fut_data[["league_code", "home"]].rename(columns={"home": "fut_team"}),
+                                  df_fut_data[["league_code", "away"]].rename(columns={"away": "fut_team"})]
+                                 ).dropna().drop_duplicates()
+        if df_team_alias is not None:
+            df_team_alias = df_team_alias.drop(columns=["modify_timestamp"], errors="ignore")
+            df_fut_teams = df_fut_teams.merge(df_team_alias[["league_code", "fut_team"]], on=["league_code", "fut_team"],
+                                              how="left", indicator=True)
+            df_fut_teams = df_fut_teams[df_fut_teams["_merge"] == "left_only"].drop(columns=["_merge"])
+        if len(df_fut_teams.index) == 0:
+            if df_team_alias is None: return pd.DataFrame(columns=["league_code", "fut_team", "kicker_team", "score"])
+            return df_team_alias
 
-        return
+        print("resolving ", len(df_fut_teams.index), " new team names")
+        alias_list = [] if df_team_alias is None else [df_team_alias]
+        for league_code, df_league_teams in df_fut_teams.groupby("league_code"):
+            kicker_teams = df_kicker_teams.loc[df_kicker_teams["league_code"] == league_code, "kicker_team"].tolist()
+            match_index, match_score = FuzzyMatcher.best_matches(df_league_teams["fut_team"].tolist(), kicker_teams,
+                                                                 threshold=threshold, scorer=fuzz.WRatio,
+                                                                 processor=utils.default_process)
+            found = match_index >= 0
+            alias_list.append(pd.DataFrame({"league_code": league_code,
+                                            "fut_team": df_league_teams["fut_team"].to_numpy()[found],
+                                            "kicker_team": np.array(kicker_teams, dtype=object)[match_index[found]],
+                                            "score": match_score[found]}))
+        df_team_alias = pd.concat(alias_list, ignore_index=True)
+        df_team_alias = pd.concat([df_team_alias, cls._team_alias_from_fixtures(df_fixtures, df_fut_data, df_team_alias)],
+                                  ignore_index=True)
+        # unresolved names are not cached, so they are retried once the kicker side knows the team
+        cls._write_parquet(df_team_alias, './data/silver/team_alias/team_alias.parquet')
+        return df_team_alias
 
     @classmethod
-    def _fuzzy_merge(cls, df_matches_kicker, df_matches_fut, threshold=85):
-        mapping_list = []
-        df_matches_kicker = df_matches_kicker[["game_id","kick_off_date","home_team","away_team"]]
-        matches_kicker = df_matches_kicker.to_dict('records')
-
-
-        df_matches_fut = df_matches_fut.to_list()
-
-        for kicker_player in tqdm(players_kicker):
-            kicker_name = kicker_player.get("player_name")
-            appearances = kicker_player.get("count")
-            if kicker_name is None: continue
-            max_score = -1
-            max_name = ''
-            for fifa_name in players_fifa:
-                if fifa_name is None: continue
-                score = Levenshtein.ratio(kicker_name, fifa_name) * 100
-                if (score > threshold) & (score > max_score):
-                    # print(score)
-                    max_name = fifa_name
-                    max_score = score
-                    if score == 100: break
-            if max_name == '':
-                mapping_list.append({"kicker_name": kicker_name, "fifa_name": None, "score": None, "appearances":appearances})
-            else:
-                mapping_list.append({"kicker_name": kicker_name, "fifa_name": max_name, "score": max_score, "appearances":appearances})
-
-        for kicker_player in tqdm(mapping_list):
-            if kicker_player.get("fifa_name") is not None: continue
-            for fifa_name in players_fifa:
-                kicker_split = kicker_player.get("kicker_name").split(" ")
-                last_name = kicker_split[len(kicker_split)-1]
-                if last_name == fifa_name:
-                    kicker_player["fifa_name"] = last_name
-
-        return pd.DataFrame(mapping_list).sort_values(by=["appearances"], ascending = False)
+    def _team_alias_from_fixtures(cls, df_fixtures, df_fut_data, df_team_alias, min_games=2):
+        # names fuzzy matching could not resolve (e.g. "Bayern Munich") are taken from the kicker games played on the
+        # same date in the same league against an opponent that is already resolved
+        df_alias = df_team_alias[["league_code", "fut_team", "kicker_team"]]
+        df_fut_games = df_fut_data[["league_code", "kick_off_date", "home", "away"]]
+        df_fut_games = df_fut_games.merge(df_alias.rename(columns={"fut_team": "home", "kicker_team": "home_team"}),
+                                          on=["league_code", "home"], how="left")
+        df_fut_games = df_fut_games.merge(df_alias.rename(columns={"fut_team": "away", "kicker_team": "away_team"}),
+                                          on=["league_code", "away"], how="left")
+        candidate_list = []
+        for indicator, opponent in [("home", "away"), ("away", "home")]:
+            df_open = df_fut_games[df_fut_games[indicator + "_team"].isnull() & df_fut_games[opponent + "_team"].notnull()]
+            df_open = df_open[["league_code", "kick_off_date", indicator, opponent + "_team"]].merge(
+                df_fixtures[["league_code", "kick_off_date", indicator + "_team", opponent + "_team"]],
+                on=["league_code", "kick_off_date", opponent + "_team"], how="inner")
+            candidate_list.append(df_open.rename(columns={indicator: "fut_team", indicator + "_team": "kicker_team"})[
+                                      ["league_code", "fut_team", "kicker_team"]])
+        df_candidates = pd.concat(candidate_list)
+        df_candidates = df_candidates.groupby(["league_code", "fut_team", "kicker_team"]).size().reset_index(name="games")
+        df_candidates["score"] = 100 * df_candidates["games"] / df_candidates.groupby(["league_code", "fut_team"])[
+            "games"].transform("sum")
+        df_candidates = df_candidates[df_candidates["games"] >= min_games].sort_values(by=["games"], ascending=False)
+        df_candidates = df_candidates.drop_duplicates(["league_code", "fut_team"]).drop(columns=["games"])
+        print("resolved ", len(df_candidates.index), " team names from fixtures")
+        return df_candidates
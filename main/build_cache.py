@@ -0,0 +1,122 @@
+import os
+import hashlib
+from .job_bookmark import JobBookmark
+
+# bump to rerun every stage once, e.g. after changing the stage declarations below
+CACHE_VERSION = 1
+SILVER_PATH = './data/silver/'
+MODEL_CODE = ["./main/model_train_v1.py", "./main/model_train_v2.py", "./main/model_train_v3.py",
+              "./main/model_train_v4.py", "./main/input_pipeline.py", "./main/numpy_model.py", "./main/feature_store.py"]
+# stage: (paths it reads, paths it writes), the code and config a stage runs count as inputs. A stage that reads its
+# own previous output (player_mapping, player_elo, evaluate) only lists it as output. Scrapers are never skipped.
+STAGE_FILES = {
+    "coaches": (["./data/bronze/coaches", "./main/preprocessor.py"], [SILVER_PATH + "coaches"]),
+    "match_info": (["./data/bronze/match_info", "./main/preprocessor.py"], [SILVER_PATH + "match_info"]),
+    "team_stats": (["./data/bronze/team_stats", "./main/preprocessor.py"], [SILVER_PATH + "team_stats"]),
+    "player_stats": (["./data/bronze/player_stats", "./main/preprocessor.py"], [SILVER_PATH + "player_stats"]),
+    "player_ratings": (["./data/bronze/player_ratings", "./main/preprocessor.py"], [SILVER_PATH + "player_ratings"]),
+    "team_elo": ([SILVER_PATH + "team_stats", "./main/preprocessor.py", "./main/elo_calculator.py"],
+                 [SILVER_PATH + "team_elo"]),
+    "team_lin_regs": ([SILVER_PATH + "team_stats", SILVER_PATH + "match_info", SILVER_PATH + "team_elo",
+                       "./main/preprocessor.py", "./main/regression_engine.py", "./main/group_executor.py"],
+                      [SILVER_PATH + "team_profiles_lin_reg", SILVER_PATH + "team_profiles_latest"]),
+    "player_mapping": ([SILVER_PATH + "player_stats", SILVER_PATH + "player_ratings", "./main/preprocessor.py",
+                        "./main/fuzzy_matcher.py", "./config/mapping_players_manual.json"],
+                       [SILVER_PATH + "player_mapping", SILVER_PATH + "player_mapping_fifa_names"]),
+    "team_fifa_rating": ([SILVER_PATH + "player_mapping", SILVER_PATH + "player_stats", SILVER_PATH + "player_ratings",
+                          "./main/preprocessor.py"],
+                         [SILVER_PATH + "team_ratings", SILVER_PATH + "fifa_rating_cube"]),
+    "referee_profiles": ([SILVER_PATH + "match_info", SILVER_PATH + "player_stats", SILVER_PATH + "team_stats",
+                          SILVER_PATH + "team_elo", "./main/preprocessor.py", "./main/regression_engine.py",
+                          "./main/group_executor.py"],
+                         [SILVER_PATH + "referee_profiles", SILVER_PATH + "referee_profiles_latest"]),
+    "coach_elo": ([SILVER_PATH + "match_info", SILVER_PATH + "coaches", SILVER_PATH + "team_stats",
+                   "./main/preprocessor.py", "./main/elo_calculator.py"], [SILVER_PATH + "coach_elo"]),
+    "player_elo": ([SILVER_PATH + "match_info", SILVER_PATH + "player_stats", SILVER_PATH + "team_stats",
+                    "./main/preprocessor.py", "./main/elo_calculator.py"], [SILVER_PATH + "player_elo"]),
+    "relationships": ([SILVER_PATH + "match_info", SILVER_PATH + "coaches", SILVER_PATH + "player_stats",
+                       "./main/preprocessor.py", "./main/relationship_engine.py"],
+                      [SILVER_PATH + "relationships", SILVER_PATH + "relationship_pairs"]),
+    "ingestion": ([SILVER_PATH + table for table in ["match_info", "coach_elo", "referee_profiles", "team_stats",
+                                                     "team_profiles_lin_reg", "player_elo", "relationships", "team_elo"]]
+                  + ["./main/ingestor.py", "./main/feature_store.py", "./config/mapping_features_v3.json"],
+                  ["./data/gold/feature_store", "./data/gold/model_ingestion"]),
+    "search": (["./data/gold/feature_store", SILVER_PATH + "match_info", "./main/model_search.py",
+                "./config/model_search.json"] + MODEL_CODE, ["./data/gold/model_search"]),
+    "train": (["./data/gold/feature_store", "./main/training_run.py", "./main/execution_profile.py",
+               "./config/execution_profiles.json"] + MODEL_CODE, ["./models"]),
+    "predict": (["./data/gold/feature_store", "./models", SILVER_PATH + "team_elo", SILVER_PATH + "team_stats",
+                 "./main/prediction_cache.py"] + MODEL_CODE, ["./data/gold/predictions"]),
+    "evaluate": (["./data/gold/predictions", "./data/bronze/fut_data", SILVER_PATH + "match_info",
+                  SILVER_PATH + "team_elo", "./main/betmaker.py", "./main/fuzzy_matcher.py", "./config/backtest.json",
+                  "./config/mapping_leagues_fut.json"],
+                 [SILVER_PATH + "fut_data", SILVER_PATH + "team_alias", "./data/gold/matched_bets",
+                  "./data/gold/backtest"])}
+
+
+class BuildCache:
+    """
+    Make-style skipping of pipeline stages. After a stage succeeds, the md5 of every file it read and wrote is kept in
+    job_bookmark/stage_cache_<stage>.json together with the stage version (cache version and stage parameters). A stage
+    is skipped while its inputs, its outputs and its version match that record, so a rerun only pays for the stages
+    downstream of a change. Files whose size and mtime did not change are not hashed again.
+    """
+
+    @classmethod
+    def is_fresh(cls, stage, version):
+        record = JobBookmark.get_data_scraped(cls._job_name(stage))
+        if record.get("version") != cls._version_key(version): return False
+        input_paths, output_paths = STAGE_FILES[stage]
+        for paths, recorded in [(input_paths, record.get("inputs")), (output_paths, record.get("outputs"))]:
+            if recorded is None: return False
+            current = cls._fingerprints(paths, recorded)
+            if {path: entry[2] for path, entry in current.items()} != {path: entry[2] for path, entry in recorded.items()}:
+                return False
+        return True
+
+    @classmethod
+    def record(cls, stage, version):
+        job_name = cls._job_name(stage)
+        record = JobBookmark.get_data_scraped(job_name)
+        input_paths, output_paths = STAGE_FILES[stage]
+        JobBookmark.update_bookmark(job_name, "inputs", cls._fingerprints(input_paths, record.get("inputs") or dict()))
+        JobBookmark.update_bookmark(job_name, "outputs", cls._fingerprints(output_paths, record.get("outputs") or dict()))
+        JobBookmark.update_bookmark(job_name, "version", cls._version_key(version))
+
+    @classmethod
+    def _fingerprints(cls, paths, known):
+        # path: [size, mtime_ns, md5], the md5 of a known file is reused while its size and mtime are unchanged
+        fingerprints = dict()
+        for file in cls._files(paths):
+            file_stat = os.stat(file)
+            known_entry = known.get(file)
+            if known_entry is not None and known_entry[0] == file_stat.st_size and known_entry[1] == file_stat.st_mtime_ns:
+                fingerprints[file] = known_entry
+            else:
+                fingerprints[file] = [file_stat.st_size, file_stat.st_mtime_ns, cls._md5(file)]
+        return fingerprints
+
+    @classmethod
+    def _files(cls, paths):
+        files = []
+        for path in paths:
+            if os.path.isfile(path): files.append(path)
+            for root, dir_names, file_names in os.walk(path):
+                dir_names[:] = sorted(dir_name for dir_name in dir_names if dir_name != "__pycache__")
+                files += [os.path.join(root, file_name) for file_name in sorted(file_names)]
+        return files
+
+    @classmethod
+    def _md5(cls, file):
+        md5 = hashlib.md5()
+        with open(file, 'rb') as open_file:
+            for chunk in iter(lambda: open_file.read(1 << 20), b""): md5.update(chunk)
+        return md5.hexdigest()
+
+    @classmethod
+    def _version_key(cls, version):
+        return str(CACHE_VERSION) + "|" + str(version)
+
+    @classmethod
+    def _job_name(cls, stage):
+        return "stage_cache_" + stage
@@ -1,5 +1,3 @@
-import requests
-from bs4 import BeautifulSoup
 import json
 import time
 from datetime import datetime
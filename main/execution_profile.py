@@ -0,0 +1,44 @@
+import os
+import sys
+import json
+
+PROFILE_CONFIG = './config/execution_profiles.json'
+# main.py --profile sets this, so stage processes started by the Executor use the same profile
+PROFILE_ENV = 'KRAKE_PAUL_PROFILE'
+DEFAULT_PROFILE = 'default'
+
+
+class ExecutionProfile:
+    """
+    CPU execution settings shared by the model classes: XLA compilation, TensorFlow intra/inter-op threads, oneDNN,
+    training and prediction batch sizes and the Keras precision policy. Profiles are read from
+    config/execution_profiles.json, a thread count of 0 keeps the TensorFlow default.
+
+    oneDNN and OMP_NUM_THREADS are read when TensorFlow is imported and the thread pools are fixed on the first op,
+    so apply has to run before the first TensorFlow import of the process.
+    """
+
+    @classmethod
+    def load(cls, profile_name=None):
+        if profile_name is None: profile_name = os.environ.get(PROFILE_ENV, DEFAULT_PROFILE)
+        profiles = json.load(open(PROFILE_CONFIG, 'r'))
+        if profile_name not in profiles:
+            raise ValueError("unknown execution profile " + profile_name + ", choose from " + ", ".join(profiles.keys()))
+        return dict(profiles[profile_name], name=profile_name)
+
+    @classmethod
+    def apply(cls, profile_name=None):
+        profile = cls.load(profile_name)
+        if "tensorflow" not in sys.modules:
+            os.environ['TF_ENABLE_ONEDNN_OPTS'] = "1" if profile.get("onednn") else "0"
+            if profile.get("intra_op_threads") > 0: os.environ['OMP_NUM_THREADS'] = str(profile.get("intra_op_threads"))
+        import tensorflow as tf
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(profile.get("intra_op_threads"))
+            tf.config.threading.set_inter_op_parallelism_threads(profile.get("inter_op_threads"))
+        except RuntimeError:
+            # the TensorFlow runtime of this process is already running with its thread pools
+            print("execution profile ", profile.get("name"), " threads not applied, TensorFlow already initialized")
+        tf.keras.mixed_precision.set_global_policy(profile.get("precision"))
+        print("execution profile=", profile.get("name"))
+        return profile
@@ -1,34 +1,153 @@
-from .kicker_scraper import KickerScraper
-from .fifa_scraper import FifaScraper
-from .job_bookmark import JobBookmark
-from .preprocessor import Preprocessor
-
-from .ingestor import Ingestor
-from .model_train_v1 import ModelV1
-from .model_train_v2 import ModelV2
-from .model_train_v3 import ModelV3
-
-from .betmaker import BetMaker
-
-
-from multiprocessing import Pool
+from multiprocessing import Pool, get_context
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import importlib
+import time
 import os
 import json
-class Executor:
+from .build_cache import BuildCache, STAGE_FILES
+from .execution_profile import PROFILE_ENV
+from .group_executor import PROCESSES_ENV
+from .stage_metrics import StageMetrics
+
+# stage name: Executor method, the stage modules are imported on first use
+STAGES = {"scrape_kicker": "_scrape_kicker_data_multiprocessing",
+          "scrape_fifa": "_scrape_fifa_rating_data",
+          "ingestion": "_ingestion",
+          "search": "_search",
+          "train": "_train",
+          "predict": "_predict",
+          "evaluate": "_evaluate"}
+PREPROCESS_TABLES = ["coaches", "match_info", "team_stats", "player_stats", "player_ratings", "team_elo",
+                     "team_lin_regs", "player_mapping", "team_fifa_rating", "referee_profiles", "coach_elo", "player_elo",
+                     "relationships"]
+# stage: stages whose output it reads, every preprocessing table is a stage of its own and "preprocess" stands for
+# all of them. Stages are listed in a valid execution order.
+STAGE_DEPENDENCIES = {"scrape_kicker": [],
+                      "scrape_fifa": [],
+                      "coaches": ["scrape_kicker"],
+                      "match_info": ["scrape_kicker"],
+                      "team_stats": ["scrape_kicker"],
+                      "player_stats": ["scrape_kicker"],
+                      "player_ratings": ["scrape_fifa"],
+                      "team_elo": ["team_stats"],
+                      "team_lin_regs": ["team_stats", "match_info", "team_elo"],
+                      "player_mapping": ["player_stats", "player_ratings"],
+                      "team_fifa_rating": ["player_mapping", "player_stats", "player_ratings"],
+                      "referee_profiles": ["match_info", "player_stats", "team_stats", "team_elo"],
+                      "coach_elo": ["match_info", "coaches", "team_stats"],
+                      "player_elo": ["match_info", "player_stats", "team_stats"],
+                      "relationships": ["match_info", "coaches", "player_stats"],
+                      "ingestion": ["match_info", "coach_elo", "referee_profiles", "team_stats", "team_lin_regs",
+                                    "player_elo", "relationships", "team_elo"],
+                      "search": ["ingestion"],
+                      "train": ["ingestion"],
+                      "predict": ["train"],
+                      "evaluate": ["predict"]}
+MODELS = ["v1", "v2", "v3", "v4"]
 
-    def execute(self):
-        self.start_year = 13
-        self.end_year = 24
-        #self._scrape_kicker_data_multiprocessing()
-        #self._scrape_fifa_rating_data()
-        #self._preprocess()
-        #self._ingestion()
-        #self._train()
-        self._predict()
-        #self._evaluate()
 
+class Executor:
+
+    def __init__(self, start_year=13, end_year=24, models=None, tables=None, force=False):
+        self.start_year = start_year
+        self.end_year = end_year
+        self.models = models if models is not None else ["v4"]
+        self.tables = tables if tables is not None else PREPROCESS_TABLES
+        # force: run stages even when their inputs, outputs and version match the last successful run
+        self.force = force
+
+    def execute(self, stages=None, until=None, jobs=1):
+        plan = self.plan(stages, until)
+        run_id = StageMetrics.start_run()
+        print("stage plan: ", ", ".join(plan), ", run ", run_id)
+        start_time = time.perf_counter()
+        try:
+            if jobs == 1: timings = [self._run_stage(stage) for stage in plan]
+            else: timings = self._run_parallel(plan, jobs)
+        finally:
+            StageMetrics.write_textfile(run_id)
+        self._print_timings(timings, time.perf_counter() - start_time)
+
+    def plan(self, stages=None, until=None):
+        # until: the stage and everything upstream of it, stages: only the given stages
+        if until is not None:
+            selected = {until}
+            for stage in reversed(list(STAGE_DEPENDENCIES.keys())):
+                if stage in selected: selected.update(STAGE_DEPENDENCIES[stage])
+        else:
+            if stages is None: stages = ["predict"]
+            selected = set()
+            for stage in stages: selected.update(self.tables if stage == "preprocess" else [stage])
+        return [stage for stage in STAGE_DEPENDENCIES.keys() if stage in selected]
+
+    def _run_parallel(self, plan, jobs):
+        # every stage runs in a fresh process once the stages it depends on (within the plan) have finished
+        pending = list(plan)
+        running = dict()
+        timings = []
+        failed = []
+        # stages running at once share the cores, every stage process gets its share as worker budget
+        processes = max(1, os.cpu_count() // jobs)
+        print("stage jobs=", jobs, " worker processes per stage=", processes)
+        with ProcessPoolExecutor(jobs, mp_context=get_context("spawn"), max_tasks_per_child=1,
+                                 initializer=Executor._init_stage_process, initargs=(processes,)) as pool:
+            while len(running) > 0 or (len(pending) > 0 and len(failed) == 0):
+                if len(failed) == 0:
+                    blocked = set(pending) | set(running.values())
+                    for stage in [stage for stage in pending if blocked.isdisjoint(STAGE_DEPENDENCIES[stage])]:
+                        pending.remove(stage)
+                        running[pool.submit(self._run_stage, stage)] = stage
+                finished, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    try:
+                        timings.append(future.result())
+                    except Exception as e:
+                        print("stage ", stage, " failed: ", repr(e))
+                        failed.append(stage)
+        if len(failed) > 0:
+            self._print_timings(timings, None)
+            raise RuntimeError("stages failed: " + ", ".join(failed) + ", not started: " + ", ".join(pending))
+        return timings
+
+    @staticmethod
+    def _init_stage_process(processes):
+        os.environ[PROCESSES_ENV] = str(processes)
+
+    def _run_stage(self, stage):
+        start_time = time.time()
+        cached = stage in STAGE_FILES
+        skipped = cached and not self.force and BuildCache.is_fresh(stage, self._stage_version(stage))
+        with StageMetrics.measure("stage." + stage, skipped=skipped) as metrics:
+            if skipped: print("skipping stage ", stage, ", inputs and version unchanged")
+            elif stage in PREPROCESS_TABLES: self._preprocess_table(stage)
+            else: getattr(self, STAGES[stage])()
+        if cached and not skipped: BuildCache.record(stage, self._stage_version(stage))
+        print("finished stage ", stage, " in ", round(metrics["wall_seconds"], 2), "s")
+        return {"stage": stage, "start": start_time, "seconds": metrics["wall_seconds"],
+                "cpu_seconds": metrics["cpu_seconds"], "peak_rss_bytes": metrics["peak_rss_bytes"], "pid": os.getpid(),
+                "skipped": skipped}
+
+    def _stage_version(self, stage):
+        if stage in ["search", "train", "predict"]:
+            return {"models": sorted(self.models), "profile": os.environ.get(PROFILE_ENV)}
+        return None
+
+    def _print_timings(self, timings, wall_seconds):
+        if len(timings) == 0: return
+        first_start = min(timing["start"] for timing in timings)
+        print("stage".ljust(18), "start".rjust(9), "seconds".rjust(9), "cpu".rjust(9), "peak_mb".rjust(9))
+        for timing in sorted(timings, key=lambda timing: timing["start"]):
+            print(timing["stage"].ljust(18), str(round(timing["start"] - first_start, 2)).rjust(9),
+                  str(round(timing["seconds"], 2)).rjust(9), str(round(timing["cpu_seconds"], 2)).rjust(9),
+                  str(round(timing["peak_rss_bytes"] / 2 ** 20)).rjust(9), " skipped" if timing["skipped"] else "")
+        if wall_seconds is not None:
+            print("finished ", len(timings), " stages in ", round(wall_seconds, 2), "s, ",
+                  round(sum(timing["seconds"] for timing in timings), 2), "s summed over stages")
 
     def _scrape_kicker_data(self, load_type="latest"):
+        from .kicker_scraper import KickerScraper
+        from .job_bookmark import JobBookmark
         if load_type == "full":
             KickerScraper.delete_bronze_data()
             JobBookmark.delete_bookmark("kicker_scraper")
@@ -38,6 +157,8 @@ class Executor:
             print("finished ", league, " scraping")
 
     def _scrape_fifa_rating_data(self, load_type="latest"):
+        from .fifa_scraper import FifaScraper
+        from .job_bookmark import JobBookmark
         if load_type == "full":
             FifaScraper.delete_bronze_data()
             JobBookmark.delete_bookmark("fifa_scraper")
@@ -47,12 +168,14 @@ class Executor:
             print("finished year ", year, " scraping")
 
     def _scrape_kicker_data_multiprocessing(self, load_type="latest"):
+        from .fifa_scraper import FifaScraper
+        from .job_bookmark import JobBookmark
         if load_type == "full":
             FifaScraper.delete_bronze_data()
             JobBookmark.delete_bookmark("fifa_scraper")
         job_list = []
         for league in json.load(open('./config/mapping_leagues.json', 'r')).keys():
-            job_list.append({"league":league, "start_season":13, "end_season":24})
+            job_list.append({"league":league, "start_season":self.start_year, "end_season":self.end_year})
 
         print("cpu_count=", os.cpu_count())
         if os.cpu_count() == 1:
@@ -63,39 +186,42 @@ class Executor:
             pool.map(self._execute_kicker_scraping_sub_job, job_list)  # process data_inputs iterable with pool
 
     def _execute_kicker_scraping_sub_job(self, job_entry):
+        from .kicker_scraper import KickerScraper
         kicker_scraper = KickerScraper(job_entry.get("league"), job_entry.get("start_season"), job_entry.get("end_season"))
         kicker_scraper.scrape()
         print("finished ", job_entry.get("league"), " scraping")
 
-    def _preprocess(self):
-        print("starting preprocessing")
-        #Preprocessor.preprocess_table("coaches")
-        #Preprocessor.preprocess_table("match_info")
-        #Preprocessor.preprocess_table("team_stats")
-        #Preprocessor.preprocess_table("player_stats")
-        #Preprocessor.preprocess_table("player_ratings")
-        #Preprocessor.preprocess_table("team_elo")
-        #Preprocessor.preprocess_table("team_lin_regs")
-        #Preprocessor.preprocess_table("player_mapping")
-        #Preprocessor.preprocess_table("team_fifa_rating")
-        #Preprocessor.preprocess_table("referee_profiles")
-        #Preprocessor.preprocess_table("player_elo")
-        #Preprocessor.preprocess_table("relationships")
-
+    def _preprocess_table(self, table_name):
+        from .preprocessor import Preprocessor
+        Preprocessor.preprocess_table(table_name)
 
     def _ingestion(self):
+        from .ingestor import Ingestor
         Ingestor.create_ingestion_data()
 
+    def _search(self):
+        from .model_search import ModelSearch
+        for model_name in self.models:
+            # the multi-head ModelV4 has no single label for the walk-forward folds
+            if hasattr(self._model_class(model_name), "_dataset_kwargs"): ModelSearch.search(model_name)
+            else: print("model ", model_name, " has no model search")
 
     def _train(self):
-        #ModelV1.train()
-        #ModelV2.train()
-        ModelV3.train()
+        for model_name in self.models:
+            self._model_class(model_name).train()
 
     def _predict(self):
-        #ModelV1.train()
-        #ModelV2.train()
-        ModelV3.predict()
+        for model_name in self.models:
+            model_class = self._model_class(model_name)
+            # ModelV2 has no prediction output
+            if hasattr(model_class, "predict"): model_class.predict()
+            else: print("model ", model_name, " has no predict")
 
     def _evaluate(self):
+        from .betmaker import BetMaker
         BetMaker.evaluate_bets()
+
+    @classmethod
+    def _model_class(cls, model_name):
+        module = importlib.import_module(".model_train_" + model_name, __package__)
+        return getattr(module, "Model" + model_name.upper())
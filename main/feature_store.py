@@ -0,0 +1,110 @@
+import json
+import hashlib
+import glob
+import os
+from datetime import datetime
+import pandas as pd
+import numpy as np
+import pyarrow.parquet as pq
+from .stage_metrics import StageMetrics
+
+FEATURE_STORE_PATH = './data/gold/feature_store/'
+# silver tables the gold features are built from
+SOURCE_TABLES = ["match_info", "coach_elo", "referee_profiles", "team_stats", "team_profiles_lin_reg", "player_elo",
+                 "relationships", "team_elo"]
+# bump when the feature code in Ingestor changes, so features built by the old code are not served anymore
+FEATURE_CODE_VERSION = 2
+
+
+class FeatureStore:
+    """
+    Gold features per game_id and feature version, only games whose silver rows changed are rebuilt on update.
+    """
+
+    @classmethod
+    def feature_version(cls, feature_config_path):
+        feature_columns = json.load(open(feature_config_path, 'r'))
+        version_string = json.dumps(feature_columns, sort_keys=True) + str(FEATURE_CODE_VERSION)
+        return hashlib.md5(version_string.encode('utf-8')).hexdigest()[:12]
+
+    @classmethod
+    def features_path(cls, version):
+        return FEATURE_STORE_PATH + version + "/features.parquet"
+
+    @classmethod
+    def feature_names(cls, feature_config_path, drop_cols):
+        schema = pq.read_schema(cls.features_path(cls.feature_version(feature_config_path)))
+        return [name for name in schema.names if name not in drop_cols]
+
+    @classmethod
+    @StageMetrics.step
+    def read_features(cls, feature_config_path, columns=None):
+        version = cls.feature_version(feature_config_path)
+        return cls._read_parquet(cls.features_path(version), columns=columns)
+
+    @classmethod
+    @StageMetrics.step
+    def update(cls, feature_config_path, build_features):
+        feature_columns = json.load(open(feature_config_path, 'r'))
+        version = cls.feature_version(feature_config_path)
+        version_path = FEATURE_STORE_PATH + version + "/"
+
+        df_source_hashes = cls._source_hashes()
+        df_stored_hashes = cls._read_parquet(version_path + "source_hashes.parquet")
+        df_features = cls._read_parquet(cls.features_path(version))
+        if df_stored_hashes is None or df_features is None:
+            changed_game_ids = df_source_hashes["game_id"]
+            df_features = None
+        else:
+            df_compare = df_source_hashes.merge(df_stored_hashes, on=["game_id"], how="left", suffixes=("", "_stored"))
+            changed = (df_compare["source_hash"] != df_compare["source_hash_stored"]).fillna(True)
+            changed_game_ids = df_compare.loc[changed, "game_id"]
+            df_features = df_features[df_features["game_id"].isin(df_source_hashes["game_id"]) &
+                                      ~df_features["game_id"].isin(changed_game_ids)]
+
+        print("feature store version=", version, " games to build=", len(changed_game_ids))
+        if len(changed_game_ids) > 0:
+            df_new_features = build_features(feature_columns, game_ids=changed_game_ids.tolist())
+            if df_features is None: df_features = df_new_features
+            else: df_features = pd.concat([df_features, df_new_features], ignore_index=True)
+        if df_features is None:
+            print("feature store version=", version, " has no stored features and no source games, nothing written")
+            return version
+
+        cls._write_parquet(df_features, cls.features_path(version))
+        cls._write_parquet(df_source_hashes, version_path + "source_hashes.parquet")
+        manifest = {"version": version, "feature_config": feature_config_path,
+                    "feature_code_version": FEATURE_CODE_VERSION, "columns": list(df_features.columns),
+                    "games": len(df_features.index), "latest_update": str(datetime.now())}
+        with open(version_path + "manifest.json", 'w') as fp:
+            json.dump(manifest, fp)
+        return version
+
+    @classmethod
+    def _source_hashes(cls):
+        # order independent hash of all silver rows of a game: sum of the row hashes (mod 2^64), salted per table
+        game_id_list = []
+        row_hash_list = []
+        for table_name in SOURCE_TABLES:
+            salt = np.uint64(int(hashlib.md5(table_name.encode('utf-8')).hexdigest()[:16], 16))
+            for file in glob.glob('./data/silver/' + table_name + '/*'):
+                df_table = pd.read_parquet(file).drop(columns=["modify_timestamp"], errors="ignore")
+                StageMetrics.count_read(len(df_table.index), os.path.getsize(file))
+                game_id_list.append(df_table["game_id"].to_numpy())
+                row_hash_list.append(pd.util.hash_pandas_object(df_table, index=False).to_numpy() ^ salt)
+        if len(game_id_list) == 0: return pd.DataFrame({"game_id": [], "source_hash": pd.array([], dtype="Int64")})
+        game_codes, game_ids = pd.factorize(np.concatenate(game_id_list))
+        source_hash = np.zeros(len(game_ids), dtype="uint64")
+        np.add.at(source_hash, game_codes, np.concatenate(row_hash_list))
+        return pd.DataFrame({"game_id": game_ids, "source_hash": pd.array(source_hash.view("int64"), dtype="Int64")})
+
+    @classmethod
+    def _read_parquet(cls, base_path, columns=None):
+        # Ingestor imports FeatureStore, features are read and written like the other gold tables
+        from .ingestor import Ingestor
+        return Ingestor._read_parquet(base_path, columns=columns)
+
+    @classmethod
+    def _write_parquet(cls, df, file_path):
+        from .ingestor import Ingestor
+        Ingestor._write_parquet(df, file_path)
@@ -0,0 +1,122 @@
+import json
+from datetime import datetime
+import pandas as pd
+import numpy as np
+from .ingestor import Ingestor
+from .preprocessor import Preprocessor
+from .relationship_engine import RelationshipEngine
+
+DEFAULT_ELO = 1300
+
+
+class FixtureFeatures:
+    """
+    Feature vectors of upcoming fixtures (team, referee, coaches, lineups, kick_off) from the latest silver state.
+    """
+
+    def __init__(self, feature_config_path='./config/mapping_features_v3.json'):
+        self.load_timestamp = str(datetime.now())
+        self.feature_columns = json.load(open(feature_config_path, 'r'))
+        self.team_elo = self._latest_team_elo()
+        self.coach_elo = self._latest_elo(Preprocessor._read_parquet('./data/silver/coach_elo/*'), "coach")
+        df_player_elo = Preprocessor._read_parquet('./data/silver/player_elo/*')[["player_name", "kick_off_date", "new_player_elo"]]
+        self.player_elo = df_player_elo.sort_values(by=["kick_off_date"], kind="mergesort").groupby(
+            "player_name")["new_player_elo"].last()
+        self.team_profiles = Preprocessor._read_parquet('./data/silver/team_profiles_latest/*').set_index("team_name")
+        self.referee_profiles = Preprocessor._read_parquet('./data/silver/referee_profiles_latest/*').set_index("referee")
+        df_match_info = Preprocessor._read_parquet('./data/silver/match_info/*')[["league_code", "match_day", "kick_off_date"]]
+        self.next_match_day = df_match_info.sort_values(by=["kick_off_date"], kind="mergesort").groupby(
+            "league_code")["match_day"].last() + 1
+
+        df_pairs = Preprocessor._read_parquet('./data/silver/relationship_pairs/*')
+        self.person_names = pd.Index(pd.unique(pd.concat([df_pairs["person_a"], df_pairs["person_b"]])))
+        self.relationship_engine = RelationshipEngine.from_pairs(
+            self.person_names.get_indexer(df_pairs["person_a"]), self.person_names.get_indexer(df_pairs["person_b"]),
+            df_pairs["games_together"].to_numpy(), len(self.person_names))
+
+    def assemble_one(self, fixture):
+        return self.assemble(pd.DataFrame([fixture]))
+
+    def assemble(self, df_fixtures):
+        df_fixtures = df_fixtures.reset_index(drop=True)
+        kick_off = pd.to_datetime(df_fixtures["kick_off"])
+        game_id = df_fixtures["game_id"] if "game_id" in df_fixtures.columns else df_fixtures.index.to_series()
+        match_day = self.next_match_day.reindex(df_fixtures["league_code"]).to_numpy()
+        if "match_day" in df_fixtures.columns: match_day = df_fixtures["match_day"].fillna(pd.Series(match_day)).to_numpy()
+
+        # columns in the order of Ingestor._join_features
+        feature = {"game_id": game_id.to_numpy(), "kick_off_time": kick_off.dt.strftime('%H:%M'),
+                   "match_day": match_day, "weekday": kick_off.dt.dayofweek.to_numpy()}
+        for indicator in ["home", "away"]:
+            feature[indicator + "_coach_elo"] = self._lookup(self.coach_elo, df_fixtures[indicator + "_coach"], DEFAULT_ELO)
+        for column in self.feature_columns.get("df_referee_profiles"):
+            if column == "game_id": continue
+            feature[column] = self.referee_profiles[column].reindex(df_fixtures["referee"]).to_numpy()
+        for indicator in ["home", "away"]:
+            df_profiles = self.team_profiles.reindex(df_fixtures[indicator + "_team"])
+            feature["kick_off_date_" + indicator] = kick_off.to_numpy()
+            for regression_type in self.feature_columns.get("reg_cols"):
+                for parameter in ["_intercept", "_coefficient"]:
+                    feature[regression_type + parameter + "_" + indicator] = df_profiles[regression_type + parameter].to_numpy()
+        relationships_home, relationships_away = self._relationships(df_fixtures)
+        feature["relationships_home"] = relationships_home
+        feature["relationships_away"] = relationships_away
+        feature["relationships_diff"] = relationships_home - relationships_away
+        for indicator in ["home", "away"]:
+            feature[indicator + "_elo"] = self._lookup(self.team_elo, df_fixtures[indicator + "_team"], DEFAULT_ELO)
+        df_player_elo = self._lineups(df_fixtures)
+        df_player_elo["player_elo"] = self._lookup(self.player_elo, df_player_elo["player_name"], DEFAULT_ELO)
+        df_player_elo = df_player_elo.groupby(["fixture", "indicator"])["player_elo"].agg(["mean", "std"])
+        for indicator in ["home", "away"]:
+            df_side = df_player_elo.xs(indicator, level="indicator").reindex(df_fixtures.index)
+            feature["player_elo_mean_" + indicator] = df_side["mean"].to_numpy()
+            feature["player_elo_stdev_" + indicator] = df_side["std"].to_numpy()
+
+        df_feature = pd.DataFrame(feature)
+        df_feature = Ingestor._encode_features(Ingestor._derive_features(df_feature, self.feature_columns))
+        if len(df_feature.index) < len(df_fixtures.index):
+            print("fixtures without complete state=", len(df_fixtures.index) - len(df_feature.index))
+        return df_feature
+
+    def _relationships(self, df_fixtures):
+        df_lineups = self._lineups(df_fixtures)
+        df_coaches = pd.concat([pd.DataFrame({"fixture": df_fixtures.index, "name": df_fixtures[indicator + "_coach"],
+                                              "indicator": indicator}) for indicator in ["home", "away"]])
+        df_people = pd.concat([df_coaches.dropna(subset=["name"]), df_lineups.rename(columns={"player_name": "name"})])
+        df_people = df_people.drop_duplicates(["fixture", "name", "indicator"]).sort_values(by=["fixture"], kind="mergesort")
+
+        person_codes = self.person_names.get_indexer(df_people["name"])
+        # people without an earlier game get codes after the known people
+        unknown = person_codes < 0
+        person_codes[unknown] = len(self.person_names) + pd.factorize(df_people["name"].to_numpy()[unknown])[0]
+        relationships_home, relationships_away = self.relationship_engine.score(
+            df_people["fixture"].to_numpy(), person_codes, (df_people["indicator"] == "home").to_numpy(),
+            (df_people["indicator"] == "away").to_numpy())
+        n_fixtures = len(df_fixtures.index)
+        return np.pad(relationships_home, (0, n_fixtures - len(relationships_home))), \
+               np.pad(relationships_away, (0, n_fixtures - len(relationships_away)))
+
+    @classmethod
+    def _lineups(cls, df_fixtures):
+        df_lineups = pd.concat([pd.DataFrame({"fixture": df_fixtures.index, "player_name": df_fixtures[indicator + "_lineup"],
+                                              "indicator": indicator}) for indicator in ["home", "away"]])
+        df_lineups = df_lineups.explode("player_name").dropna(subset=["player_name"])
+        return Preprocessor._clean_kicker_name_string(df_lineups)
+
+    @classmethod
+    def _lookup(cls, df_state, keys, default):
+        return df_state.reindex(keys).fillna(default).to_numpy()
+
+    @classmethod
+    def _latest_team_elo(cls):
+        df_team_elo = Preprocessor._read_parquet('./data/silver/team_elo/*')
+        # team elos are ordered by season and matchday like in Preprocessor._get_latest_elo
+        df_team_elo["kick_off_date"] = df_team_elo["season_start"].astype(int) * 100 + df_team_elo["matchday"].astype(int)
+        return cls._latest_elo(df_team_elo, "team")
+
+    @classmethod
+    def _latest_elo(cls, df_elo, name_column):
+        # Elo of every team or coach after its last game
+        df_elo = pd.concat([pd.DataFrame({"name": df_elo[indicator + "_" + name_column], "elo": df_elo["new_" + indicator + "_elo"],
+                                          "kick_off_date": df_elo["kick_off_date"]}) for indicator in ["home", "away"]])
+        return df_elo.sort_values(by=["kick_off_date"], kind="mergesort").groupby("name")["elo"].last()
@@ -0,0 +1,51 @@
+import numpy as np
+from rapidfuzz import process, fuzz
+from tqdm import tqdm
+
+MAX_MATRIX_CELLS = 20000000
+
+
+class FuzzyMatcher:
+    """
+    Best fuzzy match for every query name among a list of choices, scored with rapidfuzz on all cores.
+
+    With the plain ratio scorer choices are blocked by name length: ratio = 1 - indel_distance / (len_a + len_b)
+    and the indel distance is at least the length difference, so choices outside the length window can never
+    score above the threshold. Other scorers and processors score all choices. Ties keep the first choice in list
+    order, like the sequential scan did.
+    """
+
+    @classmethod
+    def best_matches(cls, queries, choices, threshold=85, scorer=fuzz.ratio, processor=None, length_blocking=True):
+        queries = list(queries)
+        choices = list(choices)
+        match_index = np.full(len(queries), -1, dtype="int64")
+        match_score = np.full(len(queries), np.nan)
+        if len(queries) == 0 or len(choices) == 0: return match_index, match_score
+
+        query_lengths = np.array([len(query) for query in queries])
+        choice_lengths = np.array([len(choice) for choice in choices])
+        if not length_blocking or scorer is not fuzz.ratio or processor is not None:
+            query_blocks = [(np.arange(len(queries)), np.arange(len(choices)))]
+        else:
+            query_blocks = []
+            cut = threshold / 100
+            for length in np.unique(query_lengths):
+                candidates = np.flatnonzero((choice_lengths >= np.floor(length * cut / (2 - cut))) &
+                                            (choice_lengths <= np.ceil(length * (2 - cut) / cut)))
+                query_blocks.append((np.flatnonzero(query_lengths == length), candidates))
+
+        for query_idx, candidate_idx in tqdm(query_blocks):
+            if len(candidate_idx) == 0: continue
+            candidate_names = [choices[c] for c in candidate_idx]
+            chunk_size = max(1, MAX_MATRIX_CELLS // len(candidate_idx))
+            for start in range(0, len(query_idx), chunk_size):
+                chunk_idx = query_idx[start:start + chunk_size]
+                scores = process.cdist([queries[q] for q in chunk_idx], candidate_names, scorer=scorer,
+                                       processor=processor, score_cutoff=threshold, dtype=np.float64, workers=-1)
+                best = np.argmax(scores, axis=1)
+                best_score = scores[np.arange(len(chunk_idx)), best]
+                found = best_score > threshold
+                match_index[chunk_idx[found]] = candidate_idx[best[found]]
+                match_score[chunk_idx[found]] = best_score[found]
+        return match_index, match_score
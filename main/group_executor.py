@@ -0,0 +1,81 @@
+import os
+import tempfile
+from multiprocessing import Pool
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+
+BATCHES_PER_PROCESS = 4
+# worker processes a stage may start, set by the Executor when several stages run at once
+PROCESSES_ENV = 'KRAKE_PAUL_STAGE_PROCESSES'
+
+
+class GroupExecutor:
+    """
+    Runs a per-entity feature builder (team, referee, ...) over independent groups in worker processes.
+    Groups are packed into batches of whole groups and handed to the workers as Arrow IPC files (on /dev/shm when
+    available) instead of pickled DataFrames. Results come back the same way and are concatenated in batch order.
+    """
+
+    @classmethod
+    def apply(cls, df, group_col, func, func_kwargs=None, processes=None):
+        if func_kwargs is None: func_kwargs = dict()
+        if processes is None: processes = cls.process_budget()
+        df = df[df[group_col].notnull()]
+        batches = cls._split_batches(df, group_col, processes)
+        if processes <= 1 or len(batches) <= 1:
+            return func(df, **func_kwargs)
+
+        shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        with tempfile.TemporaryDirectory(dir=shm_dir) as tmp_dir:
+            job_list = []
+            for b, df_batch in enumerate(batches):
+                path = os.path.join(tmp_dir, "batch_" + str(b) + ".arrow")
+                cls._write_ipc(df_batch, path)
+                job_list.append({"path": path, "func": func, "func_kwargs": func_kwargs})
+
+            print("group executor processes=", processes, " batches=", len(job_list))
+            with Pool(processes) as pool:
+                result_paths = pool.map(cls._execute_batch, job_list)
+            df_result = pd.concat([cls._read_ipc(path) for path in result_paths], ignore_index=True)
+        return df_result
+
+    @classmethod
+    def process_budget(cls):
+        return max(1, int(os.environ.get(PROCESSES_ENV, os.cpu_count())))
+
+    @classmethod
+    def _split_batches(cls, df, group_col, processes):
+        # whole groups are packed in sorted key order, so every batch is a contiguous range of groups
+        codes, _ = pd.factorize(df[group_col], sort=True)
+        if len(codes) == 0: return [df]
+        group_sizes = np.bincount(codes)
+        target_rows = max(1, int(np.ceil(len(codes) / (max(processes, 1) * BATCHES_PER_PROCESS))))
+        group_batch = (np.cumsum(group_sizes) - group_sizes) // target_rows
+        batch_ids = group_batch[codes]
+        order = np.argsort(batch_ids, kind="stable")
+        df = df.iloc[order]
+        bounds = np.flatnonzero(np.diff(batch_ids[order])) + 1
+        starts = np.concatenate([[0], bounds])
+        ends = np.concatenate([bounds, [len(order)]])
+        return [df.iloc[start:end] for start, end in zip(starts, ends)]
+
+    @classmethod
+    def _execute_batch(cls, job_entry):
+        df_batch = cls._read_ipc(job_entry.get("path"))
+        df_result = job_entry.get("func")(df_batch, **job_entry.get("func_kwargs"))
+        result_path = job_entry.get("path").replace(".arrow", "_result.arrow")
+        cls._write_ipc(df_result, result_path)
+        return result_path
+
+    @classmethod
+    def _write_ipc(cls, df, path):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    @classmethod
+    def _read_ipc(cls, path):
+        with pa.memory_map(path, "r") as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
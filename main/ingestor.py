@@ -1,19 +1,15 @@
-import requests
-from bs4 import BeautifulSoup
 import json
 import time
 from datetime import datetime
 import pandas as pd
 import numpy as np
-from sklearn import linear_model
-from .elo_calculator import EloCalculator
+from .feature_store import FeatureStore
+from .stage_metrics import StageMetrics
 
 pd.options.mode.chained_assignment = None  # default='warn'
 from tqdm import tqdm
 import glob
-import Levenshtein
-import tensorflow as tf
-from sklearn.preprocessing import LabelEncoder
+import os
 
 class Ingestor:
 
@@ -21,100 +17,127 @@ class Ingestor:
         self.load_timestamp = str(datetime.now())
 
     @classmethod
-    def create_ingestion_data(cls):
-        feature_columns = json.load(open('./config/mapping_features_v3.json', 'r'))
-
-        df_match_info = cls._read_parquet('./data/silver/match_info/*')[feature_columns.get("df_match_info")]
-
-        df_coach_elo = cls._read_parquet('./data/silver/coach_elo/*')[feature_columns.get("df_coach_elo")].rename(columns={"home_elo": "home_coach_elo", "away_elo": "away_coach_elo"})
-
-        df_referee_profiles = cls._read_parquet('./data/silver/referee_profiles/*')[feature_columns.get("df_referee_profiles")]
-
-        df_match_stats = cls._read_parquet('./data/silver/team_stats/*').groupby(['game_id']).agg(total_corners=('corners', np.sum)).reset_index()
-
-
-        df_team_profiles_lin_reg = cls._read_parquet('./data/silver/team_profiles_lin_reg/*').drop(columns=["team_name"])
-        df_team_profiles_lin_reg_home = df_team_profiles_lin_reg[df_team_profiles_lin_reg["indicator"]=="home"].drop(columns=["indicator"])
-        df_team_profiles_lin_reg_away = df_team_profiles_lin_reg[df_team_profiles_lin_reg["indicator"]=="away"].drop(columns=["indicator"])
+    @StageMetrics.step
+    def create_ingestion_data(cls, feature_config_path='./config/mapping_features_v3.json'):
+        FeatureStore.update(feature_config_path, cls.build_features)
+        df_feature = FeatureStore.read_features(feature_config_path)
+        cls._write_parquet(df_feature, './data/gold/model_ingestion/model_ingestion.parquet')
 
-        for column in df_team_profiles_lin_reg_home.columns:
-            if column in ["game_id","indicator"]: continue
-            df_team_profiles_lin_reg_home = df_team_profiles_lin_reg_home.rename(columns={column:column+"_home"})
-            df_team_profiles_lin_reg_away = df_team_profiles_lin_reg_away.rename(columns={column:column+"_away"})
+    @classmethod
+    def build_features(cls, feature_columns, game_ids=None):
+        df_feature = cls._join_features(feature_columns, game_ids)
+        df_feature = cls._derive_features(df_feature, feature_columns)
+        return cls._encode_features(df_feature)
 
-        df_player_elo = cls._read_parquet('./data/silver/player_elo/*')[feature_columns.get("df_player_elo")]
+    @classmethod
+    @StageMetrics.step
+    def _join_features(cls, feature_columns, game_ids=None):
+        # the match day filter and the column projections are pushed into the reads, every other table is only read
+        # for the remaining games and all tables are joined on a sorted game_id index
+        match_info_filters = [("match_day", ">=", 5)]
+        if game_ids is not None: match_info_filters.append(("game_id", "in", list(game_ids)))
+        df_match_info = cls._read_parquet('./data/silver/match_info/*', columns=feature_columns.get("df_match_info"),
+                                          filters=match_info_filters)
+        game_filter = [("game_id", "in", df_match_info["game_id"].drop_duplicates().tolist())]
+
+        df_coach_elo = cls._read_parquet('./data/silver/coach_elo/*', columns=feature_columns.get("df_coach_elo"),
+                                         filters=game_filter).rename(columns={"home_elo": "home_coach_elo", "away_elo": "away_coach_elo"})
+
+        df_referee_profiles = cls._read_parquet('./data/silver/referee_profiles/*',
+                                                columns=feature_columns.get("df_referee_profiles"), filters=game_filter)
+
+        df_match_stats = cls._read_parquet('./data/silver/team_stats/*', columns=["game_id", "corners"],
+                                           filters=game_filter).groupby(['game_id']).agg(total_corners=('corners', "sum"))
+
+        df_team_profiles_lin_reg = cls._read_parquet('./data/silver/team_profiles_lin_reg/*', filters=game_filter).drop(columns=["team_name"])
+        df_team_profiles_lin_reg_home = cls._indicator_suffix(df_team_profiles_lin_reg, "home")
+        df_team_profiles_lin_reg_away = cls._indicator_suffix(df_team_profiles_lin_reg, "away")
+
+        df_player_elo = cls._read_parquet('./data/silver/player_elo/*', columns=feature_columns.get("df_player_elo"),
+                                          filters=game_filter)
         df_player_elo = df_player_elo.groupby(['game_id', 'indicator']).agg(
-            player_elo_mean=('old_player_elo', np.mean),
+            player_elo_mean=('old_player_elo', "mean"),
             player_elo_stdev=('old_player_elo', np.std)).reset_index()
-        df_player_elo_home = df_player_elo[df_player_elo["indicator"] == "home"].drop(columns=["indicator"])
-        df_player_elo_away = df_player_elo[df_player_elo["indicator"] == "away"].drop(columns=["indicator"])
-        for column in df_player_elo_home.columns:
-            if column in ["game_id"]: continue
-            df_player_elo_home = df_player_elo_home.rename(columns={column: column+"_home"})
-            df_player_elo_away = df_player_elo_away.rename(columns={column: column+"_away"})
-
-
-        df_relationships = cls._read_parquet('./data/silver/relationships/*')
-        df_team_elo = cls._read_parquet('./data/silver/team_elo/*')[feature_columns.get("df_team_elo")]
+        df_player_elo_home = cls._indicator_suffix(df_player_elo, "home")
+        df_player_elo_away = cls._indicator_suffix(df_player_elo, "away")
+
+        df_relationships = cls._read_parquet('./data/silver/relationships/*', filters=game_filter)
+        df_team_elo = cls._read_parquet('./data/silver/team_elo/*', columns=feature_columns.get("df_team_elo"),
+                                        filters=game_filter)
+        df_team_elo["outcome"] = np.where(df_team_elo["home_goals"] < df_team_elo["away_goals"], 2,
+                                          np.where(df_team_elo["home_goals"] > df_team_elo["away_goals"], 0, 1))
+        df_team_elo = df_team_elo.drop(columns=["home_goals", "away_goals"])
+
+        df_feature_list = [df_coach_elo, df_referee_profiles, df_team_profiles_lin_reg_home,
+                           df_team_profiles_lin_reg_away, df_relationships, df_team_elo, df_player_elo_home,
+                           df_player_elo_away, df_match_stats]
+        df_feature_list = [df if df.index.name == "game_id" else df.set_index("game_id") for df in df_feature_list]
+        df_feature = df_match_info.set_index("game_id").sort_index()
+        for df in df_feature_list:
+            df_feature = df_feature.join(df.sort_index(), how="inner")
+        return df_feature.reset_index()
 
-        df_team_elo["goal_diff"] = df_team_elo["home_goals"] - df_team_elo["away_goals"]
-        df_team_elo['outcome'] = np.where(df_team_elo['goal_diff'] < 0, 2,
-                                            np.where(df_team_elo['goal_diff'] > 0, 0, 1))
-
-
-
-        df_team_elo = df_team_elo.drop(columns=["home_goals","away_goals","goal_diff"])
-
-        df_feature = df_match_info.merge(df_coach_elo, on = ["game_id"], how = "inner")
-        df_feature = df_feature.merge(df_referee_profiles, on=["game_id"], how="inner")
-        df_feature = df_feature.merge(df_team_profiles_lin_reg_home, on=["game_id"], how="inner")
-        df_feature = df_feature.merge(df_team_profiles_lin_reg_away, on=["game_id"], how="inner")
-        df_feature = df_feature.merge(df_relationships, on=["game_id"], how="inner")
-        df_feature = df_feature.merge(df_team_elo, on=["game_id"], how="inner")
-        df_feature = df_feature.merge(df_player_elo_home, on=["game_id"], how="inner")
-        df_feature = df_feature.merge(df_player_elo_away, on=["game_id"], how="inner")
-        df_feature = df_feature.merge(df_match_stats, on=["game_id"], how="inner")
-
-        df_feature['corner_over_11_5'] = np.where(df_feature['total_corners'] > 11.5, 1, 0)
-        df_feature['corner_over_10_5'] = np.where(df_feature['total_corners'] > 10.5, 1, 0)
-        df_feature['corner_over_9_5'] = np.where(df_feature['total_corners'] > 9.5, 1, 0)
-        df_feature['corner_over_8_5'] = np.where(df_feature['total_corners'] > 8.5, 1, 0)
+    @classmethod
+    def _indicator_suffix(cls, df, indicator):
+        df = df[df["indicator"] == indicator].drop(columns=["indicator"])
+        return df.rename(columns={column: column + "_" + indicator for column in df.columns if column != "game_id"})
 
+    @classmethod
+    @StageMetrics.step
+    def _derive_features(cls, df_feature, feature_columns):
+        # all derived columns are computed into one block, the inputs they replace are dropped in one go
+        derived = dict()
+        if "total_corners" in df_feature.columns:
+            for corner_line in ["11_5", "10_5", "9_5", "8_5"]:
+                derived["corner_over_" + corner_line] = np.where(
+                    df_feature["total_corners"] > float(corner_line.replace("_", ".")), 1, 0)
+
+        elo_diff = {"home": df_feature["home_elo"] - df_feature["away_elo"],
+                    "away": df_feature["away_elo"] - df_feature["home_elo"]}
+        drop_columns = []
         for regression_type in feature_columns.get("reg_cols"):
             for indicator in ["home", "away"]:
-                if indicator == "home": df_feature["exp_"+regression_type+"_"+indicator] = (df_feature[regression_type+"_coefficient_"+indicator] * (df_feature["home_elo"] - df_feature["away_elo"])) + df_feature[regression_type+"_intercept_"+indicator]
-                if indicator == "away": df_feature["exp_"+regression_type+"_"+indicator] = (df_feature[regression_type+"_coefficient_"+indicator] * (df_feature["away_elo"] - df_feature["home_elo"])) + df_feature[regression_type+"_intercept_"+indicator]
-                df_feature = df_feature.drop(columns=[regression_type+"_coefficient_"+indicator, regression_type+"_intercept_"+indicator])
+                coefficient = regression_type + "_coefficient_" + indicator
+                intercept = regression_type + "_intercept_" + indicator
+                derived["exp_" + regression_type + "_" + indicator] = (df_feature[coefficient] * elo_diff.get(indicator)) + df_feature[intercept]
+                drop_columns += [coefficient, intercept]
 
-        df_feature["kick_off_seconds"] = df_feature["kick_off_time"].str.split(":").str[0].astype(float) + df_feature["kick_off_time"].str.split(":").str[0].astype(float) * 60
-        df_feature = df_feature.drop(columns=feature_columns.get("drop"))
-        for column in df_feature.columns:
-            df_feature = df_feature[df_feature[column].notna()]
+        kick_off_hour = df_feature["kick_off_time"].str.split(":").str[0].astype(float)
+        derived["kick_off_seconds"] = kick_off_hour + kick_off_hour * 60
+        drop_columns += [column for column in feature_columns.get("drop") if column in df_feature.columns]
 
-        #df_feature["outcome"] = tf.keras.utils.to_categorical(df_feature["outcome"])
-
-        df_feature["weekday"] = tf.keras.utils.to_categorical(df_feature["weekday"].factorize()[0])
-        df_feature["kick_off_date_home"] = pd.to_numeric(df_feature["kick_off_date_home"])
-        df_feature = df_feature[df_feature["match_day"]>=5]
-        cls._write_parquet(df_feature, './data/gold/model_ingestion/model_ingestion.parquet')
+        df_feature = pd.concat([df_feature.drop(columns=list(dict.fromkeys(drop_columns))),
+                                pd.DataFrame(derived, index=df_feature.index)], axis=1)
+        return df_feature.dropna()
 
+    @classmethod
+    @StageMetrics.step
+    def _encode_features(cls, df_feature):
+        # the weekday is encoded per game (day of week of the kick-off), so games built separately stay comparable
+        kick_off_date = pd.to_datetime(df_feature["kick_off_date_home"])
+        df_feature["weekday"] = kick_off_date.dt.dayofweek
+        df_feature["kick_off_date_home"] = pd.to_numeric(kick_off_date)
+        return df_feature
 
     @classmethod
-    def _read_parquet(cls, base_path):
+    def _read_parquet(cls, base_path, columns=None, filters=None):
         files = glob.glob(base_path)
         df_list = []
         for file in files:
-            df_tmp = pd.read_parquet(file)
+            df_tmp = pd.read_parquet(file, columns=columns, filters=filters)
             df_list.append(df_tmp)
         if len(df_list) == 0:
             print(base_path, " was None")
             return None
         df = pd.concat(df_list)
+        StageMetrics.count_read(len(df.index), sum(os.path.getsize(file) for file in files))
         print("finished reading ", base_path, " with ", len(df.index), " records")
         return df
 
     @classmethod
     def _write_parquet(cls, df, file_path):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
         df = df.drop_duplicates()
         df.to_parquet(file_path, index=False)
+        StageMetrics.count_write(len(df.index), os.path.getsize(file_path))
         print("finished writing ", file_path, " with ", len(df.index), " records")
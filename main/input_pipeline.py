@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import tensorflow as tf
+
+BATCH_SIZE = 32
+READ_BATCH_ROWS = 65536
+SHUFFLE_BUFFER = 100000
+TEST_BUCKETS = 1000
+
+
+class InputPipeline:
+    """
+    Streams gold features from parquet record batches into a tf.data.Dataset, so training, evaluation and prediction
+    never hold the whole table in pandas. Record batches become float32 matrices in one step, labels are one-hot
+    encoded in a parallel map, and the rows are shuffled, batched and prefetched. Every epoch streams the parquet file
+    again unless a cache path is given.
+
+    Rows are assigned to the train, validation or test split by a hash of their game_id, which keeps the split stable
+    between runs and feature versions.
+    """
+
+    @classmethod
+    def dataset(cls, path, feature_names, label_column=None, n_class=None, label_fn=None, heads=None, split=None,
+                test_size=0.3, validation_size=0.0, shuffle=False, batch_size=BATCH_SIZE, cache_path=None):
+        # heads: {output name: (label column, n_class, label_fn)} for models with one output per target
+        if label_column is not None: label_specs = [(label_column, n_class, label_fn)]
+        elif heads is not None: label_specs = list(heads.values())
+        else: label_specs = []
+        label_columns = [label_spec[0] for label_spec in label_specs]
+        columns = list(dict.fromkeys(feature_names + ["game_id"] + label_columns))
+
+        def record_batches():
+            for record_batch in pq.ParquetFile(path).iter_batches(batch_size=READ_BATCH_ROWS, columns=columns):
+                x = np.column_stack([record_batch.column(name).to_numpy(zero_copy_only=False)
+                                     for name in feature_names]).astype("float32")
+                keep = cls._split_mask(record_batch.column("game_id").to_numpy(zero_copy_only=False), split, test_size,
+                                       validation_size)
+                if len(label_specs) == 0:
+                    yield x[keep]
+                    continue
+                labels = []
+                for column, _, column_label_fn in label_specs:
+                    y = record_batch.column(column).to_numpy(zero_copy_only=False)
+                    if column_label_fn is not None: y = column_label_fn(y)
+                    labels.append(y[keep].astype("int32"))
+                yield x[keep], tuple(labels)
+
+        x_spec = tf.TensorSpec(shape=(None, len(feature_names)), dtype=tf.float32)
+        if len(label_specs) == 0:
+            ds = tf.data.Dataset.from_generator(record_batches, output_signature=x_spec)
+        else:
+            label_spec = tuple(tf.TensorSpec(shape=(None,), dtype=tf.int32) for _ in label_specs)
+            ds = tf.data.Dataset.from_generator(record_batches, output_signature=(x_spec, label_spec))
+            ds = ds.map(lambda x, y: (x, cls._one_hot(y, label_specs, heads)), num_parallel_calls=tf.data.AUTOTUNE)
+
+        # an empty cache path caches in memory, a file path keeps datasets larger than RAM on disk
+        if cache_path is not None: ds = ds.cache(cache_path)
+        ds = ds.unbatch()
+        if shuffle: ds = ds.shuffle(SHUFFLE_BUFFER, reshuffle_each_iteration=True)
+        return ds.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+    @classmethod
+    def _one_hot(cls, labels, label_specs, heads):
+        labels = [tf.one_hot(y, label_spec[1]) for y, label_spec in zip(labels, label_specs)]
+        if heads is None: return labels[0]
+        return dict(zip(heads.keys(), labels))
+
+    @classmethod
+    def features_only(cls, ds):
+        return ds.map(lambda x, y: x, num_parallel_calls=tf.data.AUTOTUNE)
+
+    @classmethod
+    def _split_mask(cls, game_ids, split, test_size, validation_size=0.0):
+        if split is None: return np.ones(len(game_ids), dtype=bool)
+        bucket = pd.util.hash_array(game_ids.astype(object)) % TEST_BUCKETS
+        test_end = int(test_size * TEST_BUCKETS)
+        validation_end = test_end + int(validation_size * TEST_BUCKETS)
+        if split == "test": return bucket < test_end
+        if split == "validation": return (bucket >= test_end) & (bucket < validation_end)
+        return bucket >= validation_end
@@ -0,0 +1,138 @@
+import os
+import json
+import itertools
+import importlib
+import tempfile
+from multiprocessing import get_context
+import pandas as pd
+import numpy as np
+from .feature_store import FeatureStore
+from .group_executor import GroupExecutor
+from .preprocessor import Preprocessor
+from .stage_metrics import StageMetrics
+
+SEARCH_CONFIG = './config/model_search.json'
+
+
+class ModelSearch:
+    """
+    Walk-forward validation by season and grid search over the _get_model architecture of ModelV1-V3.
+    """
+
+    @classmethod
+    @StageMetrics.step
+    def search(cls, model_name, search_config_path=SEARCH_CONFIG, processes=None):
+        search_config = json.load(open(search_config_path, 'r'))
+        model_module = cls._model_module(model_name)
+        model_class = getattr(model_module, "Model" + model_name.upper())
+        dataset_kwargs = model_class._dataset_kwargs()
+        label_column = dataset_kwargs.get("label_column")
+        feature_names = FeatureStore.feature_names(model_module.FEATURE_CONFIG, model_module.DROP_COLS)
+
+        df_features = FeatureStore.read_features(model_module.FEATURE_CONFIG,
+                                                 columns=list(dict.fromkeys(feature_names + ["game_id", label_column])))
+        df_seasons = Preprocessor._read_parquet('./data/silver/match_info/*')[["game_id", "season_start"]]
+        df_features = df_features.merge(df_seasons.drop_duplicates(["game_id"]), on=["game_id"], how="inner")
+        season = df_features["season_start"].astype(int).to_numpy()
+        labels = df_features[label_column].to_numpy()
+        if dataset_kwargs.get("label_fn") is not None: labels = dataset_kwargs.get("label_fn")(labels)
+        from .input_pipeline import InputPipeline
+        # the same game_id validation split the model is early stopped on in train
+        early_stopping = InputPipeline._split_mask(df_features["game_id"].to_numpy(), "validation", 0.0,
+                                                   model_module.VALIDATION_SIZE)
+
+        validation_seasons = cls._walk_forward_seasons(season, search_config.get("folds"),
+                                                       search_config.get("min_train_seasons"))
+        grid = search_config.get("grid")
+        candidates = [dict(zip(grid.keys(), values)) for values in itertools.product(*grid.values())]
+        threads = search_config.get("threads_per_worker")
+        if processes is None: processes = max(1, GroupExecutor.process_budget() // threads)
+        print("model search model=", model_name, " candidates=", len(candidates), " validation seasons=",
+              validation_seasons, " processes=", processes)
+
+        # every (candidate, fold) runs in a spawned worker, the features are handed over as memory mapped .npy files
+        shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        with tempfile.TemporaryDirectory(dir=shm_dir) as tmp_dir:
+            arrays = {"x": df_features[feature_names].to_numpy(dtype="float32"), "y": labels.astype("int32"),
+                      "season": season, "early_stopping": early_stopping}
+            for name, array in arrays.items(): np.save(os.path.join(tmp_dir, name + ".npy"), array)
+            job_list = [{"data_path": tmp_dir, "model_name": model_name, "n_class": dataset_kwargs.get("n_class"),
+                         "candidate": candidate, "season": validation_season,
+                         "run_name": "model_search_" + model_name + "_" + str(candidate_index) + "_" + str(validation_season)}
+                        for candidate_index, candidate in enumerate(candidates) for validation_season in validation_seasons]
+            with get_context("spawn").Pool(processes, initializer=cls._init_worker, initargs=(threads,)) as pool:
+                result_list = pool.map(cls._run_job, job_list, chunksize=1)
+
+        df_report = cls._report(pd.DataFrame(result_list), list(grid.keys()))
+        print(df_report.to_string(index=False))
+        Preprocessor._write_parquet(df_report, './data/gold/model_search/model_search_' + model_name + '.parquet')
+        return df_report
+
+    @classmethod
+    def _walk_forward_seasons(cls, season, folds, min_train_seasons):
+        seasons = np.unique(season)
+        validation_seasons = seasons[min_train_seasons:][-folds:]
+        if len(validation_seasons) == 0:
+            raise ValueError("not enough seasons for walk-forward validation: " + str(seasons.tolist()))
+        return validation_seasons.tolist()
+
+    @classmethod
+    def _init_worker(cls, threads):
+        os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    @classmethod
+    def _run_job(cls, job_entry):
+        import tensorflow as tf
+        from .training_run import TrainingRun
+        x, y, season, early_stopping = [np.load(os.path.join(job_entry.get("data_path"), name + ".npy"), mmap_mode="r")
+                                        for name in ["x", "y", "season", "early_stopping"]]
+        train = (season < job_entry.get("season")) & ~early_stopping
+        early_stop = (season < job_entry.get("season")) & early_stopping
+        validate = season == job_entry.get("season")
+        if not early_stop.any():
+            raise ValueError("no early stopping rows before season " + str(job_entry.get("season")))
+        candidate = job_entry.get("candidate")
+        n_class = job_entry.get("n_class")
+
+        model_module = cls._model_module(job_entry.get("model_name"))
+        model_class = getattr(model_module, "Model" + job_entry.get("model_name").upper())
+        normalizer = tf.keras.layers.Normalization(axis=-1, dtype="float32")
+        normalizer.adapt(x[train])
+        model = model_class._get_model(normalizer, units=tuple(candidate.get("units")), dropout=candidate.get("dropout"))
+
+        ds_train, ds_early_stop, ds_validate = [
+            tf.data.Dataset.from_tensor_slices((x[mask], tf.keras.utils.to_categorical(y[mask], n_class)))
+            for mask in [train, early_stop, validate]]
+        ds_train = ds_train.shuffle(int(train.sum()))
+        ds_train, ds_early_stop, ds_validate = [ds.batch(candidate.get("batch_size"))
+                                                for ds in [ds_train, ds_early_stop, ds_validate]]
+
+        # the held out season is the test split of the run, so it is scored with the restored best weights
+        run_record = TrainingRun.fit(model, job_entry.get("run_name"), ds_train, ds_early_stop, ds_validate,
+                                     epochs=candidate.get("epochs"))
+        return dict(candidate, season=job_entry.get("season"), train_rows=int(train.sum()),
+                    validation_rows=int(validate.sum()), validation_loss=run_record["test_metrics"]["loss"],
+                    validation_accuracy=run_record["test_metrics"]["accuracy"], best_epoch=run_record["best_epoch"],
+                    train_seconds=run_record["wall_seconds"])
+
+    @classmethod
+    def _report(cls, df_results, candidate_columns):
+        df_results["units"] = df_results["units"].astype(str)
+        df_report = df_results.groupby(candidate_columns, sort=False).agg(
+            validation_loss_mean=("validation_loss", "mean"),
+            validation_loss_std=("validation_loss", "std"),
+            validation_accuracy_mean=("validation_accuracy", "mean"),
+            best_epoch_mean=("best_epoch", "mean"),
+            folds=("season", "size"),
+            train_seconds=("train_seconds", "sum")).reset_index()
+        df_report = df_report.sort_values(by=["validation_loss_mean"], kind="mergesort").reset_index(drop=True)
+        df_report.insert(0, "rank", np.arange(1, len(df_report.index) + 1))
+        return df_report
+
+    @classmethod
+    def _model_module(cls, model_name):
+        return importlib.import_module(".model_train_" + model_name, __package__)
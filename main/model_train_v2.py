@@ -1,5 +1,3 @@
-import requests
-from bs4 import BeautifulSoup
 import json
 import time
 from datetime import datetime
@@ -7,17 +5,23 @@ import pandas as pd
 import numpy as np
 import os
 import sys
-import tensorflow as tf
 import warnings
 warnings.filterwarnings('ignore')
-from sklearn.model_selection import train_test_split
 from tqdm import tqdm
 import glob
+from .feature_store import FeatureStore
+from .numpy_model import NumpyModel, KerasModel
+from .training_run import TrainingRun
+from .execution_profile import ExecutionProfile
+from .stage_metrics import StageMetrics
 
 N_CLASS = 2
 N_FEATURES = 0
 TEST_SIZE = 0.2
+VALIDATION_SIZE = 0.15
 EPOCHS = 100
+FEATURE_CONFIG = './config/mapping_features_v3.json'
+DROP_COLS = ["outcome", "game_id"]
 
 class ModelV2:
 
@@ -25,43 +29,46 @@ class ModelV2:
         self.load_timestamp = str(datetime.now())
 
     @classmethod
+    @StageMetrics.step
     def train(cls):
+        profile = ExecutionProfile.apply()
+        import tensorflow as tf
+        from .input_pipeline import InputPipeline
         os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
-        df_ingestion = cls._read_parquet('./data/gold/model_ingestion/*')
-        labels = df_ingestion["outcome"]
-        labels = tf.keras.utils.to_categorical(labels)
-
-        df_features = df_ingestion.drop(columns=["outcome"])
-        for column in df_features.columns:
-            df_features[column] = df_features[column].astype('float32')
-        N_FEATURES = len(df_features.columns)
-        #df_features = np.asarray(df_features).astype('float32')
-        normalizer = tf.keras.layers.Normalization(axis=-1)
-        normalizer.adapt(df_features)
-
-        x_train, x_test, y_train, y_test = train_test_split(
-            df_features, labels, test_size=TEST_SIZE
-        )
+        features_path = FeatureStore.features_path(FeatureStore.feature_version(FEATURE_CONFIG))
+        feature_names = FeatureStore.feature_names(FEATURE_CONFIG, DROP_COLS)
+        N_FEATURES = len(feature_names)
+        dataset_kwargs = dict(cls._dataset_kwargs(), test_size=TEST_SIZE, validation_size=VALIDATION_SIZE,
+                              batch_size=profile.get("batch_size"))
+        ds_train = InputPipeline.dataset(features_path, feature_names, split="train", shuffle=True, **dataset_kwargs)
+        ds_validation = InputPipeline.dataset(features_path, feature_names, split="validation", **dataset_kwargs)
+        ds_test = InputPipeline.dataset(features_path, feature_names, split="test", **dataset_kwargs)
+        normalizer = tf.keras.layers.Normalization(axis=-1, dtype="float32")
+        normalizer.adapt(InputPipeline.features_only(ds_train))
 
         print("N_CLASS=", N_CLASS)
         print("N_FEATURES=", N_FEATURES)
         print("TEST_SIZE=", TEST_SIZE)
+        print("VALIDATION_SIZE=", VALIDATION_SIZE)
         print("EPOCHS=", EPOCHS)
 
         # Get a compiled neural network
-        model = cls._get_model(normalizer)
+        model = cls._get_model(normalizer, jit_compile=profile.get("jit_compile"))
 
-        print(len(x_train))
-        print(len(y_train))
+        # Fit with early stopping on the validation split, a killed run resumes from its last epoch
+        TrainingRun.fit(model, "krake_paul_v2", ds_train, ds_validation, ds_test, epochs=EPOCHS)
 
-        # Fit model on training data
-        model.fit(x_train, y_train, epochs=EPOCHS)
+        # Save model to file
+        KerasModel.save(model, "./models/krake_paul_v2")
+        NumpyModel.export(model, "./models/krake_paul_v2.npz")
 
-        # Evaluate neural network performance
-        model.evaluate(x_test, y_test, verbose=2)
+    @classmethod
+    def _home_win(cls, outcome):
+        return (outcome == 0).astype("int32")
 
-        # Save model to file
-        model.save("./models/krake_paul_v2")
+    @classmethod
+    def _dataset_kwargs(cls):
+        return {"label_column": "outcome", "n_class": N_CLASS, "label_fn": cls._home_win}
 
     @classmethod
     def _read_parquet(cls, base_path):
@@ -74,6 +81,7 @@ class ModelV2:
             print(base_path, " was None")
             return None
         df = pd.concat(df_list)
+        StageMetrics.count_read(len(df.index), sum(os.path.getsize(file) for file in files))
         print("finished reading ", base_path, " with ", len(df.index), " records")
         return df
 
@@ -82,29 +90,28 @@ class ModelV2:
         df = df.drop_duplicates()
         df["modify_timestamp"] = str(datetime.now())
         df.to_parquet(file_path, index=False)
+        StageMetrics.count_write(len(df.index), os.path.getsize(file_path))
         print("finished writing ", file_path, " with ", len(df.index), " records")
 
 
     @classmethod
-    def _get_model(cls, normalizer):
+    def _get_model(cls, normalizer, units=(48, 24), dropout=0.5, jit_compile=False):
         """
         Returns a compiled convolutional neural network model. Assume that the
         `input_shape` of the first layer is `(IMG_WIDTH, IMG_HEIGHT, 3)`.
         The output layer should have `NUM_CATEGORIES` units, one for each category.
         """
+        import tensorflow as tf
 
-        model = tf.keras.Sequential([
-            normalizer,
-            tf.keras.layers.Dense(48, activation='relu'),
-            tf.keras.layers.Dropout(0.5),
-            tf.keras.layers.Dense(24, activation='relu'),
-            tf.keras.layers.Dropout(0.5),
-            tf.keras.layers.Dense(N_CLASS, activation="softmax")
-        ])
+        layers = [normalizer]
+        for layer_units in units:
+            layers += [tf.keras.layers.Dense(layer_units, activation='relu'), tf.keras.layers.Dropout(dropout)]
+        model = tf.keras.Sequential(layers + [tf.keras.layers.Dense(N_CLASS, activation="softmax", dtype="float32")])
 
         model.compile(optimizer='adam',
                       loss="binary_crossentropy",
-                      metrics=['accuracy'])
+                      metrics=['accuracy'],
+                      jit_compile=jit_compile)
 
 
         return model
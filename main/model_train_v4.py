@@ -0,0 +1,114 @@
+from datetime import datetime
+import numpy as np
+import os
+from .feature_store import FeatureStore
+from .training_run import TrainingRun
+from .execution_profile import ExecutionProfile
+from .numpy_model import KerasModel
+from .model_train_v1 import ModelV1
+from .prediction_cache import PredictionCache
+from .stage_metrics import StageMetrics
+
+TEST_SIZE = 0.3
+VALIDATION_SIZE = 0.15
+EPOCHS = 100
+FEATURE_CONFIG = './config/mapping_features_v3.json'
+DROP_COLS = ["game_id", "corner_over_11_5", "corner_over_10_5", "corner_over_9_5", "corner_over_8_5", "outcome",
+             "total_corners"]
+# output name: (label column, N_CLASS, loss)
+HEADS = {"outcome": ("outcome", 3, "categorical_crossentropy"),
+         "home_win": ("outcome", 2, "binary_crossentropy"),
+         "corner_over_11_5": ("corner_over_11_5", 2, "binary_crossentropy"),
+         "corner_over_10_5": ("corner_over_10_5", 2, "binary_crossentropy"),
+         "corner_over_9_5": ("corner_over_9_5", 2, "binary_crossentropy"),
+         "corner_over_8_5": ("corner_over_8_5", 2, "binary_crossentropy")}
+
+
+class ModelV4:
+    """
+    One shared trunk with a softmax head per target of ModelV1-V3, the default model.
+    """
+
+    def __init__(self):
+        self.load_timestamp = str(datetime.now())
+
+    @classmethod
+    @StageMetrics.step
+    def train(cls):
+        profile = ExecutionProfile.apply()
+        import tensorflow as tf
+        from .input_pipeline import InputPipeline
+        os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+        features_path = FeatureStore.features_path(FeatureStore.feature_version(FEATURE_CONFIG))
+        feature_names = FeatureStore.feature_names(FEATURE_CONFIG, DROP_COLS)
+        dataset_kwargs = {"heads": cls._label_heads(), "test_size": TEST_SIZE, "validation_size": VALIDATION_SIZE,
+                          "batch_size": profile.get("batch_size")}
+        ds_train = InputPipeline.dataset(features_path, feature_names, split="train", shuffle=True, **dataset_kwargs)
+        ds_validation = InputPipeline.dataset(features_path, feature_names, split="validation", **dataset_kwargs)
+        ds_test = InputPipeline.dataset(features_path, feature_names, split="test", **dataset_kwargs)
+        normalizer = tf.keras.layers.Normalization(axis=-1, dtype="float32")
+        normalizer.adapt(InputPipeline.features_only(ds_train))
+
+        print("HEADS=", list(HEADS.keys()))
+        print("N_FEATURES=", len(feature_names))
+        print("TEST_SIZE=", TEST_SIZE)
+        print("VALIDATION_SIZE=", VALIDATION_SIZE)
+        print("EPOCHS=", EPOCHS)
+
+        model = cls._get_model(normalizer, jit_compile=profile.get("jit_compile"))
+        TrainingRun.fit(model, "krake_paul_v4", ds_train, ds_validation, ds_test, epochs=EPOCHS)
+        KerasModel.save(model, "./models/krake_paul_v4")
+
+    @classmethod
+    @StageMetrics.step
+    def predict(cls):
+        feature_names = FeatureStore.feature_names(FEATURE_CONFIG, DROP_COLS)
+        df_features = FeatureStore.read_features(FEATURE_CONFIG, columns=["game_id"] + feature_names)
+        prediction_columns = ["prediction_1", "prediction_X", "prediction_2"] + \
+                             ["prediction_" + head for head in HEADS.keys() if head != "outcome"]
+        # only new games and games with changed features are scored, unless the model changed
+        df_predictions = PredictionCache.predict("model_v4", PredictionCache.model_fingerprint("./models/krake_paul_v4.keras"),
+                                                 df_features, feature_names, cls._tensorflow_predict, prediction_columns)
+
+        df_match = ModelV1._read_parquet('./data/silver/team_elo/*')[["game_id","season_start","matchday","home_elo","away_elo","home_team","away_team","home_goals","away_goals"]]
+        df_predictions = df_match.merge(df_predictions, on=["game_id"], how="inner")
+        ModelV1._write_parquet(df_predictions, './data/gold/predictions/model_predictions_v4.parquet')
+
+    @classmethod
+    def _tensorflow_predict(cls, x):
+        profile = ExecutionProfile.apply()
+        predictions = KerasModel.load("./models/krake_paul_v4").predict(x, batch_size=profile.get("predict_batch_size"))
+        # 1/X/2 of the outcome head, then the positive class of every other head
+        return np.column_stack([predictions["outcome"]] +
+                               [predictions[head][:, 1] for head in HEADS.keys() if head != "outcome"])
+
+    @classmethod
+    def _label_heads(cls):
+        label_heads = dict()
+        for head, (label_column, n_class, _) in HEADS.items():
+            label_fn = cls._home_win if head == "home_win" else None
+            label_heads[head] = (label_column, n_class, label_fn)
+        return label_heads
+
+    @classmethod
+    def _home_win(cls, outcome):
+        return (outcome == 0).astype("int32")
+
+    @classmethod
+    def _get_model(cls, normalizer, units=(48, 24), dropout=0.5, jit_compile=False):
+        import tensorflow as tf
+        # same trunk as the _get_model of ModelV1-V3, with one head per target instead of a single output layer
+        inputs = tf.keras.Input(shape=(int(normalizer.mean.shape[-1]),))
+        trunk = normalizer(inputs)
+        for layer_units in units:
+            trunk = tf.keras.layers.Dense(layer_units, activation='relu')(trunk)
+            trunk = tf.keras.layers.Dropout(dropout)(trunk)
+        outputs = {head: tf.keras.layers.Dense(n_class, activation="softmax", dtype="float32", name=head)(trunk)
+                   for head, (_, n_class, _) in HEADS.items()}
+
+        model = tf.keras.Model(inputs=inputs, outputs=outputs)
+        model.compile(optimizer='adam',
+                      loss={head: loss for head, (_, _, loss) in HEADS.items()},
+                      metrics={head: ['accuracy'] for head in HEADS.keys()},
+                      jit_compile=jit_compile)
+        return model
@@ -0,0 +1,117 @@
+import os
+import numpy as np
+
+# model file paths without extension, see KerasModel
+MODEL_PATHS = {"v1": "./models/krake_paul_v1", "v2": "./models/krake_paul_v2", "v3": "./models/krake_paul_v3"}
+# keras.backend.epsilon(), the lower bound of the standard deviation in the Normalization layer
+NORMALIZATION_EPSILON = 1e-7
+
+
+class KerasModel:
+    """
+    Models are saved as <model path>.keras. SavedModel directories at <model path>, written by the Keras 2 models,
+    are loaded through a TFSMLayer, which Keras 3 needs for them.
+    """
+
+    @classmethod
+    def save(cls, model, model_path):
+        model.save(model_path + ".keras")
+
+    @classmethod
+    def load(cls, model_path):
+        import tensorflow as tf
+        if os.path.exists(model_path + ".keras"): return tf.keras.models.load_model(model_path + ".keras")
+        if not os.path.isdir(model_path): raise FileNotFoundError("no model at " + model_path + "(.keras)")
+        saved_model = tf.keras.layers.TFSMLayer(model_path, call_endpoint="serving_default")
+        # the serving signature has no feature width, the kernel of the first dense layer has
+        inputs = tf.keras.Input(shape=(int(saved_model.weights[0].shape[0]),))
+        outputs = saved_model(inputs)
+        if len(outputs) == 1: outputs = list(outputs.values())[0]
+        return tf.keras.Model(inputs=inputs, outputs=outputs)
+
+
+class NumpyModel:
+    """
+    TensorFlow free inference for the sequential dense models (Normalization, Dense, Dropout): the exporter writes
+    the normalization statistics and dense weights to a NumPy archive next to the model, the forward pass
+    reproduces the Keras probabilities in float32.
+    """
+
+    def __init__(self, mean, variance, kernels, biases, activations):
+        self.mean = mean
+        self.std = np.maximum(np.sqrt(variance), np.float32(NORMALIZATION_EPSILON))
+        self.kernels = kernels
+        self.biases = biases
+        self.activations = activations
+
+    @classmethod
+    def export_models(cls, model_paths=None):
+        if model_paths is None: model_paths = MODEL_PATHS
+        for model_name, model_path in model_paths.items():
+            if os.path.exists(model_path + ".keras"): cls.export(KerasModel.load(model_path), model_path + ".npz")
+            else: cls._export_saved_model(model_path, model_path + ".npz")
+            print("exported model ", model_name, " to ", model_path + ".npz")
+
+    @classmethod
+    def _export_saved_model(cls, model_path, file_path):
+        # Keras 3 can not rebuild the layers of a SavedModel, the arrays are taken from its variables and the
+        # activations are the ones of _get_model (relu hidden layers, softmax output), checked against the SavedModel
+        import tensorflow as tf
+        variables = {variable.name.split(":")[0]: variable.numpy() for variable in tf.saved_model.load(model_path).variables}
+        dense_layers = [name[:-len("/kernel")] for name in variables.keys() if name.endswith("/kernel")]
+        arrays = {"mean": variables["mean"].astype("float32").reshape(-1),
+                  "variance": variables["variance"].astype("float32").reshape(-1)}
+        for i, layer_name in enumerate(dense_layers):
+            arrays["kernel_" + str(i)] = variables[layer_name + "/kernel"].astype("float32")
+            arrays["bias_" + str(i)] = variables[layer_name + "/bias"].astype("float32")
+        activations = ["relu"] * (len(dense_layers) - 1) + ["softmax"]
+        np.savez(file_path, activations=np.array(activations), **arrays)
+
+        x = np.random.default_rng(0).normal(size=(64, len(arrays["mean"]))).astype("float32")
+        x = x * np.sqrt(arrays["variance"]) + arrays["mean"]
+        expected = np.asarray(KerasModel.load(model_path).predict(x, verbose=0))
+        if not np.allclose(cls.load(file_path).predict(x), expected, atol=1e-5):
+            os.remove(file_path)
+            raise ValueError("export of " + model_path + " does not reproduce the SavedModel")
+
+    @classmethod
+    def export(cls, model, file_path):
+        arrays = dict()
+        activations = []
+        for layer in model.layers:
+            layer_type = type(layer).__name__
+            if layer_type == "Normalization":
+                arrays["mean"] = np.asarray(layer.mean, dtype="float32").reshape(-1)
+                arrays["variance"] = np.asarray(layer.variance, dtype="float32").reshape(-1)
+            elif layer_type == "Dense":
+                kernel, bias = layer.get_weights()
+                arrays["kernel_" + str(len(activations))] = kernel.astype("float32")
+                arrays["bias_" + str(len(activations))] = bias.astype("float32")
+                activations.append(layer.get_config().get("activation"))
+            elif layer_type not in ["Dropout", "InputLayer"]:
+                raise ValueError("layer type " + layer_type + " can not be exported")
+        np.savez(file_path, activations=np.array(activations), **arrays)
+
+    @classmethod
+    def load(cls, file_path):
+        with np.load(file_path) as archive:
+            activations = archive["activations"].tolist()
+            kernels = [archive["kernel_" + str(i)] for i in range(len(activations))]
+            biases = [archive["bias_" + str(i)] for i in range(len(activations))]
+            return cls(archive["mean"], archive["variance"], kernels, biases, activations)
+
+    def predict(self, x):
+        x = (np.asarray(x, dtype="float32") - self.mean) / self.std
+        for kernel, bias, activation in zip(self.kernels, self.biases, self.activations):
+            x = self._activate(x @ kernel + bias, activation)
+        return x
+
+    @classmethod
+    def _activate(cls, x, activation):
+        if activation == "relu": return np.maximum(x, 0)
+        if activation == "softmax":
+            x = np.exp(x - x.max(axis=1, keepdims=True))
+            return x / x.sum(axis=1, keepdims=True)
+        if activation == "sigmoid": return 1 / (1 + np.exp(-x))
+        if activation == "linear": return x
+        raise ValueError("activation " + activation + " is not supported")
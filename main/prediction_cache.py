@@ -0,0 +1,54 @@
+import os
+import hashlib
+from datetime import datetime
+import pandas as pd
+import numpy as np
+from .stage_metrics import StageMetrics
+
+PREDICTION_CACHE_PATH = './data/gold/predictions/cache/'
+
+
+class PredictionCache:
+    """
+    Keeps the predictions of a model per game together with a hash of the game's feature row and the model's
+    fingerprint. Only rows whose features changed, new games, or all rows after the model changed are scored again,
+    the rest is taken from data/gold/predictions/cache/<cache_name>.parquet.
+    """
+
+    @classmethod
+    def model_fingerprint(cls, model_path):
+        # SavedModel directories ship a fingerprint.pb, exported files are hashed by content
+        if os.path.isdir(model_path): model_path = os.path.join(model_path, "fingerprint.pb")
+        md5 = hashlib.md5()
+        with open(model_path, 'rb') as model_file:
+            for chunk in iter(lambda: model_file.read(1 << 20), b""): md5.update(chunk)
+        return md5.hexdigest()
+
+    @classmethod
+    def predict(cls, cache_name, fingerprint, df_features, feature_names, predict_fn, prediction_columns):
+        cache_path = os.path.join(PREDICTION_CACHE_PATH, cache_name + ".parquet")
+        df_rows = pd.DataFrame({"game_id": df_features["game_id"].to_numpy(),
+                                "row_hash": pd.util.hash_pandas_object(df_features[feature_names], index=False).to_numpy()})
+
+        df_cache = pd.read_parquet(cache_path) if os.path.exists(cache_path) else None
+        if df_cache is not None: StageMetrics.count_read(len(df_cache.index), os.path.getsize(cache_path))
+        if df_cache is not None and (df_cache["fingerprint"] != fingerprint).any(): df_cache = None
+        if df_cache is None:
+            df_rows = df_rows.assign(**{column: np.nan for column in prediction_columns})
+            missing = np.ones(len(df_rows.index), dtype=bool)
+        else:
+            df_cache = df_cache[["game_id", "row_hash"] + prediction_columns].drop_duplicates(["game_id", "row_hash"])
+            df_rows = df_rows.merge(df_cache, on=["game_id", "row_hash"], how="left")
+            missing = df_rows[prediction_columns[0]].isna().to_numpy()
+
+        print("prediction cache ", cache_name, " scoring ", int(missing.sum()), " of ", len(df_rows.index), " rows")
+        if missing.any():
+            predictions = predict_fn(df_features.loc[missing, feature_names].to_numpy(dtype="float32"))
+            df_rows.loc[missing, prediction_columns] = np.asarray(predictions, dtype="float64")
+
+        df_rows["fingerprint"] = fingerprint
+        df_rows["modify_timestamp"] = str(datetime.now())
+        os.makedirs(PREDICTION_CACHE_PATH, exist_ok=True)
+        df_rows.to_parquet(cache_path, index=False)
+        StageMetrics.count_write(len(df_rows.index), os.path.getsize(cache_path))
+        return df_rows[["game_id"] + prediction_columns]
@@ -0,0 +1,169 @@
+import json
+import time
+import queue
+import threading
+import ipaddress
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from .execution_profile import ExecutionProfile
+from .numpy_model import MODEL_PATHS, KerasModel
+
+MAX_BATCH_SIZE = 4096
+MAX_WAIT_MS = 5
+MIN_PROBABILITY = 1e-9
+
+
+class MicroBatcher:
+    """
+    Collects concurrent prediction requests of one model for up to MAX_WAIT_MS (or MAX_BATCH_SIZE rows) and scores
+    them in a single model call.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def predict(self, x):
+        request = {"x": x, "done": threading.Event()}
+        self.queue.put(request)
+        request["done"].wait()
+        if request.get("error") is not None: raise request.get("error")
+        return request.get("y")
+
+    def _run(self):
+        while True:
+            request_list = [self.queue.get()]
+            rows = len(request_list[0]["x"])
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0: break
+                try:
+                    request = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                request_list.append(request)
+                rows += len(request["x"])
+
+            try:
+                y = self.predict_fn(np.concatenate([request["x"] for request in request_list]))
+                bounds = np.cumsum([len(request["x"]) for request in request_list])[:-1]
+                for request, y_request in zip(request_list, np.split(y, bounds)):
+                    request["y"] = y_request
+            except Exception as e:
+                for request in request_list: request["error"] = e
+            for request in request_list: request["done"].set()
+
+
+class PredictionService:
+    """
+    Long-running local prediction service: the models are loaded once and requests are micro-batched per model.
+
+    POST /predict with {"model": "v3", "features": [[...], ...]} (rows in the feature order the model was trained
+    on) returns {"model", "probabilities", "fair_odds"} with one row per feature row. The service only binds to
+    loopback addresses.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, model_paths=None, max_batch_size=MAX_BATCH_SIZE,
+                 max_wait_ms=MAX_WAIT_MS):
+        ExecutionProfile.apply()
+        if not ipaddress.ip_address(host).is_loopback: raise ValueError("prediction service only binds to loopback, host=" + host)
+        if model_paths is None: model_paths = MODEL_PATHS
+        self.host = host
+        self.port = port
+        self.batchers = dict()
+        self.input_widths = dict()
+        for model_name, model_path in model_paths.items():
+            try:
+                model = KerasModel.load(model_path)
+            except (OSError, ValueError) as e:
+                print("could not load model ", model_name, " from ", model_path, ": ", e)
+                continue
+            self.batchers[model_name] = MicroBatcher(self._predict_fn(model), max_batch_size, max_wait_ms)
+            self.input_widths[model_name] = int(model.inputs[0].shape[-1])
+            print("loaded model ", model_name, " from ", model_path)
+        if len(self.batchers) == 0: raise RuntimeError("none of the models " + ", ".join(model_paths.values()) + " could be loaded")
+
+    def predict(self, model_name, features):
+        x = np.asarray(features, dtype="float32")
+        if x.ndim != 2: raise ValueError("features have to be a list of rows")
+        # checked before batching, a malformed request must not fail the requests it would be batched with
+        if x.shape[1] != self.input_widths[model_name]:
+            raise ValueError("model " + model_name + " expects " + str(self.input_widths[model_name]) +
+                             " features per row, got " + str(x.shape[1]))
+        probabilities = self.batchers[model_name].predict(x)
+        fair_odds = 1 / np.maximum(probabilities, MIN_PROBABILITY)
+        return {"model": model_name, "probabilities": probabilities.tolist(), "fair_odds": fair_odds.tolist()}
+
+    def serve_forever(self):
+        server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        print("prediction service listening on ", self.host, ":", self.port, " models=", list(self.batchers.keys()))
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    def _handler(self):
+        service = self
+
+        class PredictionHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path == "/health": self._respond(200, {"status": "ok", "models": list(service.batchers.keys())})
+                else: self._respond(404, {"error": "unknown path " + self.path})
+
+            def do_POST(self):
+                if self.path != "/predict": return self._respond(404, {"error": "unknown path " + self.path})
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    if request.get("model") not in service.batchers:
+                        return self._respond(404, {"error": "unknown model " + str(request.get("model"))})
+                    self._respond(200, service.predict(request.get("model"), request.get("features")))
+                except (ValueError, TypeError) as e:
+                    self._respond(400, {"error": str(e)})
+                except Exception as e:
+                    self._respond(500, {"error": type(e).__name__ + ": " + str(e)})
+
+            def _respond(self, status, body):
+                body = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return PredictionHandler
+
+    @classmethod
+    def _predict_fn(cls, model):
+        return lambda x: np.asarray(model(x, training=False))
+
+
+class PredictionClient:
+    """
+    Test client for the prediction service, restricted to loopback addresses.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, timeout=10):
+        if not ipaddress.ip_address(host).is_loopback: raise ValueError("prediction client only connects to loopback, host=" + host)
+        self.base_url = "http://" + host + ":" + str(port)
+        self.timeout = timeout
+
+    def health(self):
+        with urllib.request.urlopen(self.base_url + "/health", timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def predict(self, model_name, features):
+        body = json.dumps({"model": model_name, "features": np.asarray(features, dtype="float32").tolist()}).encode('utf-8')
+        request = urllib.request.Request(self.base_url + "/predict", data=body,
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            result = json.loads(response.read())
+        return np.asarray(result.get("probabilities")), np.asarray(result.get("fair_odds"))
@@ -1,17 +1,48 @@
-import requests
-from bs4 import BeautifulSoup
 import json
 import time
 from datetime import datetime
 import pandas as pd
 import numpy as np
-from sklearn import linear_model
 from .elo_calculator import EloCalculator
+from .regression_engine import RegressionEngine
+from .group_executor import GroupExecutor
+from .fuzzy_matcher import FuzzyMatcher
+from .relationship_engine import RelationshipEngine
+from .stage_metrics import StageMetrics
 
 pd.options.mode.chained_assignment = None  # default='warn'
 from tqdm import tqdm
 import glob
-import Levenshtein
+import os
+
+RATING_CATEGORIES = {"ball_skills": ["ball_control", "dribbling"],
+                     "defense": ["slide_tackle", "stand_tackle"],
+                     "mental": ["aggression", "reactions", "att_position", "interceptions", "vision", "composure"],
+                     "passing": ["crossing", "short_pass", "long_pass"],
+                     "physical": ["acceleration", "stamina", "strength", "balance", "sprint_speed", "agility", "jumping"],
+                     "shooting": ["heading", "shot_power", "finishing", "long_shots", "curve", "fk_acc", "penalties", "volleys"],
+                     "goal_keeper": ["gk_positioning", "gk_diving", "gk_handling", "gk_kicking", "gk_reflexes"]}
+
+# pitch coordinates of the fifa positions, x from the own goal line (0) to the forward line (4), y from left (-1) to
+# right (1). A player's position is the mean over all preferred positions, goal keepers alone sit at (0, 0).
+POSITION_COORDINATES = {"GK": (0, 0), "CB": (1, 0), "LB": (1, -1), "RB": (1, 1), "LWB": (1.5, -1), "RWB": (1.5, 1),
+                        "CDM": (2, 0), "CM": (2.5, 0), "LM": (2.5, -1), "RM": (2.5, 1), "CAM": (3, 0), "LW": (3.5, -1),
+                        "RW": (3.5, 1), "CF": (3.5, 0), "ST": (4, 0)}
+
+# (output column, cube column, statistic) of the team rating aggregation, std is the population stdev (np.std)
+TEAM_RATING_AGGREGATIONS = [("players_captured", "gk", "size"),
+                            ("age_mean", "age", "mean"), ("age_stdev", "age", "std"),
+                            ("height_mean", "height", "mean"), ("height_stdev", "height", "std"),
+                            ("weight_mean", "weight", "mean"), ("weight_stdev", "weight", "std"),
+                            ("weak_foot__mean", "weak_foot", "mean"), ("skill_mean", "skill_moves", "mean"),
+                            ("position_x_mean", "position_x", "mean"), ("position_y_mean", "position_y", "mean"),
+                            ("ball_skills_mean", "ball_skills", "mean"), ("ball_skills_stdev", "ball_skills", "std"),
+                            ("defense_mean", "defense", "mean"), ("defense_stdev", "defense", "std"),
+                            ("mental_mean", "mental", "mean"), ("mental_stdev", "mental", "std"),
+                            ("passing_mean", "passing", "mean"), ("passing_stdev", "passing", "std"),
+                            ("physical_mean", "physical", "mean"), ("physical_stdev", "physical", "std"),
+                            ("shooting_mean", "shooting", "mean"), ("shooting_stdev", "shooting", "std"),
+                            ("goal_keeper_mean", "goal_keeper", "mean"), ("gk_captured", "gk", "sum")]
 
 
 class Preprocessor:
@@ -29,6 +60,7 @@ class Preprocessor:
         if table_name == "team_elo": cls._calculate_team_elos()
         if table_name == "team_lin_regs": cls._calculate_team_linear_regressions()
         if table_name == "player_mapping": cls._player_mapping_kicker_fifa()
+        if table_name == "team_fifa_rating": cls._team_fifa_rating()
         if table_name == "referee_profiles": cls._referee_profiles()
         if table_name == "coach_elo": cls._coach_elo()
         if table_name == "player_elo": cls._player_elo()
@@ -46,17 +78,21 @@ class Preprocessor:
             print(base_path, " was None")
             return None
         df = pd.concat(df_list)
+        StageMetrics.count_read(len(df.index), sum(os.path.getsize(file) for file in files))
         print("finished reading ", base_path, " with ", len(df.index), " records")
         return df
 
     @classmethod
     def _write_parquet(cls, df, file_path):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
         df = df.drop_duplicates()
         df["modify_timestamp"] = str(datetime.now())
         df.to_parquet(file_path, index=False)
+        StageMetrics.count_write(len(df.index), os.path.getsize(file_path))
         print("finished writing ", file_path, " with ", len(df.index), " records")
 
     @classmethod
+    @StageMetrics.step
     def _preprocess_coaches(cls):
         df_coaches = cls._read_parquet('./data/bronze/coaches/*')
         df_coaches["coach_name"] = df_coaches["coach_name"].str.split(pat="/").str[0].str.strip()
@@ -69,6 +105,7 @@ class Preprocessor:
         cls._write_parquet(df_coaches, './data/silver/coaches/coaches.parquet')
 
     @classmethod
+    @StageMetrics.step
     def _preprocess_match_info(cls):
         df_match_info = cls._read_parquet('./data/bronze/match_info/*')
         df_match_info["kick_off_time"] = df_match_info["kick_off_time"].str.replace(',', '').str.replace('.', '-')
@@ -81,6 +118,7 @@ class Preprocessor:
         cls._write_parquet(df_match_info, './data/silver/match_info/match_info.parquet')
 
     @classmethod
+    @StageMetrics.step
     def _preprocess_team_stats(cls):
         df_team_stats = cls._read_parquet('./data/bronze/team_stats/*')
         df_team_stats = df_team_stats.rename(columns={'dribble_reatio': 'dribble_ratio'})
@@ -103,12 +141,10 @@ class Preprocessor:
 
         df_team_stats["season_start"] = df_team_stats["season"].str.split(pat="-").str[0].str.strip()
 
-        df_elo = cls._calculate_elos(df_team_stats)
-
-        cls._write_parquet(df_elo, './data/silver/team_elo/team_elo.parquet')
         cls._write_parquet(df_team_stats, './data/silver/team_stats/team_stats.parquet')
 
     @classmethod
+    @StageMetrics.step
     def _preprocess_player_stats(cls):
         df_player_stats = cls._read_parquet('./data/bronze/player_stats/*')
         df_player_stats["cum_yellow_cards"] = df_player_stats["card_description"] \
@@ -132,6 +168,29 @@ class Preprocessor:
 
 
     @classmethod
+    @StageMetrics.step
+    def _preprocess_player_ratings(cls):
+        df_player_ratings = cls._read_parquet('./data/bronze/player_ratings/*')
+        df_player_ratings = cls._clean_fifa_name_string(df_player_ratings)
+        df_player_ratings["fifa"] = pd.to_numeric(df_player_ratings["fifa"], errors='coerce').astype('Int64')
+
+        # "183cm", "76kg", star counts and ratings are scraped as text
+        numeric_columns = ["age", "height", "weight", "weak_foot", "skill_moves"]
+        numeric_columns += [column for column_list in RATING_CATEGORIES.values() for column in column_list]
+        for column in numeric_columns:
+            df_player_ratings[column] = pd.to_numeric(
+                df_player_ratings[column].astype(str).str.extract(r'(\d+(?:\.\d+)?)')[0], errors='coerce')
+
+        position_columns = ["preferred_position_" + str(p) for p in range(1, 5)]
+        for axis, column in enumerate(["position_x", "position_y"]):
+            coordinates = {position: coordinate[axis] for position, coordinate in POSITION_COORDINATES.items()}
+            df_player_ratings[column] = df_player_ratings[position_columns].apply(
+                lambda positions: positions.str.strip().map(coordinates)).mean(axis=1)
+
+        cls._write_parquet(df_player_ratings, './data/silver/player_ratings/player_ratings.parquet')
+
+    @classmethod
+    @StageMetrics.step
     def _calculate_team_elos(cls):
         df_team_stats = cls._read_parquet('./data/silver/team_stats/*')
         goal_data = df_team_stats.groupby(["season_start", "match_day", "game_id", "indicator", "team_name"])[
@@ -167,7 +226,9 @@ class Preprocessor:
                            "away_goals": away_goals, "away_elo": old_away_elo, "new_away_elo": new_away_elo,
                            "away_team": away_team})
 
-        return pd.DataFrame(df_elo)
+        df_elo = pd.DataFrame(df_elo)
+        cls._write_parquet(df_elo, './data/silver/team_elo/team_elo.parquet')
+        return df_elo
 
     @classmethod
     def _get_latest_elo(cls, elo_dict, year, matchday, team_name):
@@ -187,6 +248,7 @@ class Preprocessor:
         return previous_elo
 
     @classmethod
+    @StageMetrics.step
     def _calculate_team_linear_regressions(cls):
         df_team_stats = cls._read_parquet('./data/silver/team_stats/*')
         df_match_info = cls._read_parquet('./data/silver/match_info/*')[["game_id", "kick_off_date"]]
@@ -212,181 +274,173 @@ class Preprocessor:
         lin_reg_cols = ["shots_on_goal", "distance", "total_passes", "pass_ratio", "crosses", "cross_ratio",
                         "dribblings", "dribble_ratio", "possession", "tackles", "tackle_ratio", "air_tackles",
                         "air_tackle_ratio", "fouls", "got_fouled", "offside", "corners", "elo_gain", "goals"]
-        reg_df_list = []
-
-        df_teams = df_team_stats.groupby('team_name')
-        df_teams_stat_list = [df_teams.get_group(x) for x in df_teams.groups]
-        for df_team_stat in tqdm(df_teams_stat_list):
-            df_team_stat = df_team_stat[df_team_stat["kick_off_date"].notnull()]
-            kick_off_dates = df_team_stat['kick_off_date'].drop_duplicates().sort_values(ascending=True).tolist()
-            for kick_off_date in kick_off_dates:
-                df_team_stat_pit = df_team_stat[df_team_stat["kick_off_date"] < kick_off_date]
-                df_team_stat_entry = df_team_stat[["game_id", "team_name", "indicator", "kick_off_date"]][
-                    df_team_stat["kick_off_date"] == kick_off_date]
-                for lin_reg_col in lin_reg_cols:
-                    df_team_stat_pit_col = df_team_stat_pit[df_team_stat_pit[lin_reg_col].notnull()]
-                    if len(df_team_stat_pit_col.index) <= 5:
-                        # print("skip")
-                        df_team_stat_entry[lin_reg_col + "_intercept"] = None
-                        df_team_stat_entry[lin_reg_col + "_coefficient"] = None
-                        continue
-
-                    first_matchday = df_team_stat_pit_col["kick_off_date"].min()
-                    last_matchday = df_team_stat_pit_col["kick_off_date"].max()
-                    df_team_stat_pit_col['total_days'] = (
-                            last_matchday - first_matchday + pd.to_timedelta(1, unit='D')).days
-                    df_team_stat_pit_col['day_since_first_kickoff'] = ((df_team_stat_pit_col[
-                                                                            "kick_off_date"] - first_matchday + pd.to_timedelta(
-                        1, unit='D')).dt.days.values)
-                    df_team_stat_pit_col['norm_weight'] = (
-                            df_team_stat_pit_col['day_since_first_kickoff'] / df_team_stat_pit_col['total_days'])
-
-                    # df_team_stat_pit_col["log_weight"] = np.log(df_team_stat_pit_col['norm_weight'])
-                    q = 2
-                    df_team_stat_pit_col["q_weight"] = (1 // 1.03 + (df_team_stat_pit_col['norm_weight'] ** q))
-                    # X = (df_team_stat_pit_col["kick_off_date"] - first_matchday).dt.days.values.reshape(-1, 1)
-
-                    X = df_team_stat_pit_col["elo_diff"].values.reshape((-1, 1))
-                    y = df_team_stat_pit_col[lin_reg_col]
-                    weights = df_team_stat_pit_col["norm_weight"]
-                    reg = linear_model.LinearRegression().fit(X, y, weights)
-                    # print("intercept=", reg.intercept_, " coefficient=", reg.coef_)
-                    df_team_stat_entry[lin_reg_col + "_intercept"] = reg.intercept_
-                    df_team_stat_entry[lin_reg_col + "_coefficient"] = reg.coef_[0]
-                    df_team_stat_entry[lin_reg_col + "_intercept"] = df_team_stat_entry[
-                        lin_reg_col + "_intercept"].round(6)
-                    df_team_stat_entry[lin_reg_col + "_coefficient"] = df_team_stat_entry[
-                        lin_reg_col + "_coefficient"].round(6)
-                reg_df_list.append(df_team_stat_entry)
-        df_lin_reg = pd.concat(reg_df_list)
+        df_lin_reg = GroupExecutor.apply(df_team_stats, "team_name", RegressionEngine.point_in_time,
+                                         {"group_col": "team_name", "y_cols": lin_reg_cols,
+                                          "entry_cols": ["game_id", "team_name", "indicator", "kick_off_date"]})
         cls._write_parquet(df_lin_reg, './data/silver/team_profiles_lin_reg/team_profiles_lin_reg.parquet')
+        cls._write_parquet(RegressionEngine.latest(df_team_stats, "team_name", lin_reg_cols),
+                           './data/silver/team_profiles_latest/team_profiles_latest.parquet')
 
     @classmethod
+    @StageMetrics.step
     def _player_mapping_kicker_fifa(cls):
         df_player_mapping = cls._read_parquet('./data/silver/player_mapping/*')
+        df_fifa_names_matched = cls._read_parquet('./data/silver/player_mapping_fifa_names/*')
 
         df_players_kicker = cls._read_parquet('./data/silver/player_stats/*')[["player_name"]]
         df_players_fifa = cls._read_parquet('./data/silver/player_ratings/*')[["name"]]
+        players_fifa = df_players_fifa["name"].dropna().drop_duplicates().to_list()
+
+        if df_player_mapping is None:
+            df_mapping = cls._fuzzy_merge(df_players_kicker, df_players_fifa)
+            df_mapping["confirmed"] = False
+        else:
+            df_player_mapping = df_player_mapping.drop(columns=["modify_timestamp"], errors="ignore").reset_index(drop=True)
+            if "confirmed" not in df_player_mapping.columns: df_player_mapping["confirmed"] = False
+            df_player_mapping["confirmed"] = df_player_mapping["confirmed"].fillna(False).astype(bool)
+
+            # stored mappings are only rematched against fifa names added since the last run (e.g. a new edition)
+            if df_fifa_names_matched is None: fifa_names_matched = set(players_fifa)
+            else: fifa_names_matched = set(df_fifa_names_matched["name"])
+            new_players_fifa = [name for name in players_fifa if name not in fifa_names_matched]
+            print("rematching stored players against ", len(new_players_fifa), " new fifa players")
+            df_mapping_list = [cls._rematch_player_mapping(df_player_mapping, new_players_fifa)]
+
+            # anti join: only kicker names without a stored mapping are matched against all fifa names
+            df_new_players = df_players_kicker[~df_players_kicker["player_name"].isin(df_player_mapping["kicker_name"])]
+            print("matching ", df_new_players["player_name"].nunique(), " new kicker players")
+            if len(df_new_players.index) > 0:
+                df_new_mapping = cls._fuzzy_merge(df_new_players, df_players_fifa)
+                df_new_mapping["confirmed"] = False
+                df_mapping_list.append(df_new_mapping)
+
+            df_mapping = pd.concat(df_mapping_list, ignore_index=True)
+            appearances = df_players_kicker.groupby(["player_name"]).size()
+            df_mapping["appearances"] = df_mapping["kicker_name"].map(appearances).fillna(0).astype(int)
+            df_mapping = df_mapping.sort_values(by=["appearances"], ascending=False)
+
+        df_mapping = cls._apply_manual_player_mapping(df_mapping)
+        cls._write_parquet(df_mapping, './data/silver/player_mapping/player_mapping.parquet')
+        cls._write_parquet(pd.DataFrame({"name": players_fifa}),
+                           './data/silver/player_mapping_fifa_names/player_mapping_fifa_names.parquet')
 
-        # filter out player mappes
-        if df_player_mapping is not None:
-            # @TODO: Identify what values are in TableB and not in TableA
-            print("anti join")
+    @classmethod
+    def _rematch_player_mapping(cls, df_player_mapping, new_players_fifa, threshold=85):
+        if len(new_players_fifa) == 0: return df_player_mapping
+        open_rows = ~df_player_mapping["confirmed"]
+        kicker_names = df_player_mapping.loc[open_rows, "kicker_name"]
+        match_index, match_score = FuzzyMatcher.best_matches(kicker_names.tolist(), new_players_fifa,
+                                                             threshold=threshold)
+        # a fuzzy match replaces a last name match and an earlier fuzzy match only if it scores higher
+        stored_score = df_player_mapping.loc[open_rows, "score"].to_numpy(dtype="float64", na_value=np.nan)
+        better = (match_index >= 0) & (np.isnan(stored_score) | (match_score > stored_score))
+        rows = kicker_names.index[better]
+        df_player_mapping.loc[rows, "fifa_name"] = np.array(new_players_fifa, dtype=object)[match_index[better]]
+        df_player_mapping.loc[rows, "score"] = match_score[better]
+
+        last_names = df_player_mapping["kicker_name"].str.split(" ").str[-1]
+        last_name_match = open_rows & df_player_mapping["fifa_name"].isnull() & last_names.isin(set(new_players_fifa))
+        df_player_mapping.loc[last_name_match, "fifa_name"] = last_names[last_name_match]
+        return df_player_mapping
 
-        df_players_kicker["player_name"] = df_players_kicker["player_name"]
-        df_players_fifa["name"] = df_players_fifa["name"]
-        df_fuzzy_matched = cls._fuzzy_merge(df_players_kicker, df_players_fifa)
-        cls._write_parquet(df_fuzzy_matched, './data/silver/player_mapping/player_mapping.parquet')
+    @classmethod
+    def _apply_manual_player_mapping(cls, df_mapping):
+        # manual overrides are confirmed and never rematched
+        manual_mapping = json.load(open('./config/mapping_players_manual.json', 'r'))
+        is_manual = df_mapping["kicker_name"].isin(list(manual_mapping.keys()))
+        df_mapping.loc[is_manual, "fifa_name"] = df_mapping.loc[is_manual, "kicker_name"].map(manual_mapping)
+        df_mapping.loc[is_manual, "score"] = None
+        df_mapping.loc[is_manual, "confirmed"] = True
+        return df_mapping
 
     @classmethod
     def _fuzzy_merge(cls, df_players_kicker, df_players_fifa, threshold=85):
-        mapping_list = []
         players_kicker = df_players_kicker.groupby(["player_name"]).size().reset_index(name="count")
-        players_kicker = players_kicker.to_dict('records')
-        players_fifa = df_players_fifa["name"].drop_duplicates().to_list()
-        for kicker_player in tqdm(players_kicker):
-            kicker_name = kicker_player.get("player_name")
-            appearances = kicker_player.get("count")
-            if kicker_name is None: continue
-            max_score = -1
-            max_name = ''
-            for fifa_name in players_fifa:
-                if fifa_name is None: continue
-                score = Levenshtein.ratio(kicker_name, fifa_name) * 100
-                if (score > threshold) & (score > max_score):
-                    # print(score)
-                    max_name = fifa_name
-                    max_score = score
-                    if score == 100: break
-            if max_name == '':
-                mapping_list.append({"kicker_name": kicker_name, "fifa_name": None, "score": None, "appearances":appearances})
-            else:
-                mapping_list.append({"kicker_name": kicker_name, "fifa_name": max_name, "score": max_score, "appearances":appearances})
-
-        for kicker_player in tqdm(mapping_list):
-            if kicker_player.get("fifa_name") is not None: continue
-            for fifa_name in players_fifa:
-                kicker_split = kicker_player.get("kicker_name").split(" ")
-                last_name = kicker_split[len(kicker_split)-1]
-                if last_name == fifa_name:
-                    kicker_player["fifa_name"] = last_name
-
-        return pd.DataFrame(mapping_list).sort_values(by=["appearances"], ascending = False)
+        players_fifa = df_players_fifa["name"].dropna().drop_duplicates().to_list()
+        match_index, match_score = FuzzyMatcher.best_matches(players_kicker["player_name"].tolist(), players_fifa,
+                                                             threshold=threshold)
+        fifa_names = np.array(players_fifa, dtype=object)
+        df_mapping = pd.DataFrame({"kicker_name": players_kicker["player_name"],
+                                   "fifa_name": np.where(match_index >= 0, fifa_names[match_index], None),
+                                   "score": match_score,
+                                   "appearances": players_kicker["count"]})
+
+        # no fuzzy match: fall back to an exact lookup of the last name
+        last_names = df_mapping["kicker_name"].str.split(" ").str[-1]
+        last_name_match = df_mapping["fifa_name"].isnull() & last_names.isin(set(players_fifa))
+        df_mapping.loc[last_name_match, "fifa_name"] = last_names[last_name_match]
+
+        return df_mapping.sort_values(by=["appearances"], ascending = False)
 
     @classmethod
+    @StageMetrics.step
     def _team_fifa_rating(cls):
-        df_player_mapping = cls._read_parquet('./data/silver/player_mapping/*')
-        df_players_kicker = cls._read_parquet('./data/silver/player_stats/*').rename(columns={'player_name': 'kicker_name','season_start':'fifa'})
-        df_players_fifa = cls._read_parquet('./data/silver/player_ratings/*').rename(columns={'name': 'fifa_name'})
-
-        df_players_kicker["fifa"] = df_players_kicker["fifa"].astype(str)
-        df_players_fifa["fifa"] = df_players_fifa["fifa"].astype(str)
+        df_player_mapping = cls._read_parquet('./data/silver/player_mapping/*')[["kicker_name", "fifa_name"]]
+        df_players_kicker = cls._read_parquet('./data/silver/player_stats/*')[
+            ['game_id', 'indicator', 'player_name', 'season_start', 'league_code']]
+        df_rating_cube = cls._fifa_rating_cube()
+
+        # lineups are joined to the cube on integer (player_id, edition) keys through a dense lookup table
+        fifa_names = pd.Index(df_rating_cube["fifa_name"].unique())
+        editions = np.sort(df_rating_cube["fifa"].unique())
+        if len(editions) == 0:
+            print("no fifa ratings in the rating cube, writing an empty team_ratings table")
+            cls._write_parquet(pd.DataFrame(columns=['game_id', 'indicator', 'league_code'] +
+                                                    [name for name, _, _ in TEAM_RATING_AGGREGATIONS]),
+                               './data/silver/team_ratings/team_ratings.parquet')
+            return
+        cube_lookup = np.full(len(fifa_names) * len(editions), -1, dtype="int64")
+        cube_lookup[fifa_names.get_indexer(df_rating_cube["fifa_name"]) * len(editions) +
+                    np.searchsorted(editions, df_rating_cube["fifa"])] = np.arange(len(df_rating_cube.index))
+
+        df_player_mapping = df_player_mapping[df_player_mapping["fifa_name"].notnull()]
+        df_player_mapping["player_id"] = fifa_names.get_indexer(df_player_mapping["fifa_name"])
+        kicker_player_ids = df_player_mapping[df_player_mapping["player_id"] >= 0].drop_duplicates(
+            "kicker_name").set_index("kicker_name")["player_id"]
+
+        player_ids = df_players_kicker["player_name"].map(kicker_player_ids).to_numpy(dtype="float64", na_value=-1)
+        season = pd.to_numeric(df_players_kicker["season_start"], errors="coerce").to_numpy(dtype="float64", na_value=-1)
+        edition_codes = np.minimum(np.searchsorted(editions, season), len(editions) - 1)
+        found = (player_ids >= 0) & (editions[edition_codes] == season)
+        cube_rows = np.full(len(player_ids), -1, dtype="int64")
+        cube_rows[found] = cube_lookup[player_ids[found].astype("int64") * len(editions) + edition_codes[found]]
+        found = cube_rows >= 0
+        print(found.sum(), " of ", len(found), " lineup entries with fifa ratings")
+
+        df_team_rating = df_rating_cube.drop(columns=["fifa_name", "fifa"]).iloc[cube_rows[found]].reset_index(drop=True)
+        df_keys = df_players_kicker.loc[found, ['game_id', 'indicator', 'league_code']].reset_index(drop=True)
+        df_team_rating_agg = pd.concat([df_keys, df_team_rating], axis=1).groupby(
+            ['game_id', 'indicator', 'league_code']).agg(["size", "sum", "mean", np.std])
+
+        df_team_rating_agg = pd.DataFrame({name: df_team_rating_agg[(column, statistic)]
+                                           for name, column, statistic in TEAM_RATING_AGGREGATIONS}).reset_index()
+        cls._write_parquet(df_team_rating_agg, './data/silver/team_ratings/team_ratings.parquet')
 
-        df_players_kicker = df_players_kicker[['game_id', 'indicator','kicker_name','fifa','league_code']]
+    @classmethod
+    @StageMetrics.step
+    def _fifa_rating_cube(cls):
+        df_players_fifa = cls._read_parquet('./data/silver/player_ratings/*').rename(columns={'name': 'fifa_name'})
+        df_players_fifa["fifa"] = pd.to_numeric(df_players_fifa["fifa"], errors="coerce")
+        df_players_fifa = df_players_fifa[df_players_fifa["fifa_name"].notnull() & df_players_fifa["fifa"].notnull()]
         df_players_fifa = df_players_fifa.drop_duplicates(['fifa_name', 'fifa'])
 
-
-        df_team_rating = df_players_kicker.merge(df_player_mapping, on=["kicker_name"], how="inner")
-        df_team_rating = df_team_rating.merge(df_players_fifa, on=["fifa_name","fifa"], how="inner")
-
-        df_team_rating = df_team_rating.drop(columns=["kicker_name"])
-        print(len(df_team_rating.index))
-
-        compile_cols_dict={"ball_skills":["ball_control","dribbling"],
-                           "defense":["slide_tackle", "stand_tackle"],
-                            "mental":["aggression", "reactions", "att_position", "interceptions", "vision", "composure"],
-                            "passing":["crossing", "short_pass", "long_pass"],
-                            "physical":["acceleration", "stamina", "strength", "balance", "sprint_speed", "agility", "jumping"],
-                            "shooting":["heading", "shot_power", "finishing", "long_shots", "curve", "fk_acc", "penalties", "volleys"],
-                            "goal_keeper":["gk_positioning", "gk_diving", "gk_handling", "gk_kicking", "gk_reflexes"]}
-
-        df_team_rating["gk"] = 1
-        #df_team_rating["def"] = 1
-        #df_team_rating["mid"] = 1
-        #df_team_rating["att"] = 1
-        df_team_rating.loc[df_team_rating["position_x"] != 0.00, "gk"] = 0
-        df_team_rating.loc[df_team_rating["position_y"] != 0.00, "gk"] = 0
-        df_team_rating.loc[df_team_rating["gk"] != 1, "goal_keeper"] = None
-
-        for category, column_list in compile_cols_dict.items():
-            df_team_rating[category] = 0
+        df_rating_cube = df_players_fifa[["fifa_name", "fifa", "age", "height", "weight", "weak_foot", "skill_moves",
+                                          "position_x", "position_y"]].reset_index(drop=True)
+        df_rating_cube["gk"] = ((df_players_fifa["position_x"] == 0.00) &
+                                (df_players_fifa["position_y"] == 0.00)).astype(int).to_numpy()
+        composites = {}
+        for category, column_list in RATING_CATEGORIES.items():
+            composite = 0
             for column in column_list:
-                df_team_rating[category] = df_team_rating[category] + df_team_rating[column]
-            df_team_rating[category] = df_team_rating[category]/ len(column_list)
-            df_team_rating = df_team_rating.drop(columns=column_list)
-
-        df_team_rating_agg = df_team_rating.groupby(['game_id','indicator','league_code']).agg(
-            players_captured=('fifa_name', np.count_nonzero),
-            age_mean=('age', np.mean),
-            age_stdev=('age', np.std),
-            height_mean=('height', np.mean),
-            height_stdev=('height', np.std),
-            weight_mean=('weight', np.mean),
-            weight_stdev=('weight', np.std),
-            weak_foot__mean=('weak_foot', np.mean),
-            skill_mean=('skill_moves', np.mean),
-            position_x_mean=('position_x', np.mean),
-            position_y_mean=('position_y', np.mean),
-            ball_skills_mean=('ball_skills', np.mean),
-            ball_skills_stdev=('ball_skills', np.std),
-            defense_mean=('defense', np.mean),
-            defense_stdev=('defense', np.std),
-            mental_mean=('mental', np.mean),
-            mental_stdev=('mental', np.std),
-            passing_mean=('passing', np.mean),
-            passing_stdev=('passing', np.std),
-            physical_mean=('physical', np.mean),
-            physical_stdev=('physical', np.std),
-            shooting_mean=('shooting', np.mean),
-            shooting_stdev=('shooting', np.std),
-            goal_keeper_mean=('goal_keeper', np.mean),
-            gk_captured=('gk', np.count_nonzero),
-        ).reset_index()
-
-        #print(df_team_rating_agg)
-        cls._write_parquet(df_team_rating_agg, './data/silver/team_ratings/team_ratings.parquet')
+                composite = composite + df_players_fifa[column].to_numpy(dtype="float64", na_value=np.nan)
+            composites[category] = composite / len(column_list)
+        df_rating_cube = pd.concat([df_rating_cube, pd.DataFrame(composites)], axis=1)
+
+        cls._write_parquet(df_rating_cube, './data/silver/fifa_rating_cube/fifa_rating_cube.parquet')
+        return df_rating_cube
 
     @classmethod
+    @StageMetrics.step
     def _referee_profiles(cls):
         df_match_info = cls._read_parquet('./data/silver/match_info/*')[["game_id","referee","kick_off_date"]]
 
@@ -420,58 +474,19 @@ class Preprocessor:
         df_referees["cards_away"] = df_referees["yellow_cards_away"] + df_referees["yellow_red_cards_away"]*1.7 + df_referees["red_cards_away"]*2
         df_referees["cards_diff"] = df_referees["cards_home"] - df_referees["cards_away"]
 
-        reg_df_list = []
         lin_reg_cols = ["cards_home","cards_away","cards_diff","goal_diff","hxa"]
-        df_referees = df_referees.groupby('referee')
-        df_referees_stat_list = [df_referees.get_group(x) for x in df_referees.groups]
-        for df_referee_stat in tqdm(df_referees_stat_list):
-            df_referee_stat = df_referee_stat[df_referee_stat["kick_off_date"].notnull()]
-            kick_off_dates = df_referee_stat['kick_off_date'].drop_duplicates().sort_values(ascending=True).tolist()
-            for kick_off_date in kick_off_dates:
-                df_referee_stat_pit = df_referee_stat[df_referee_stat["kick_off_date"] < kick_off_date]
-                df_referee_stat_entry = df_referee_stat[["game_id", "referee", "kick_off_date"]][
-                    df_referee_stat["kick_off_date"] == kick_off_date]
-                for lin_reg_col in lin_reg_cols:
-                    df_referee_stat_pit_col = df_referee_stat_pit[df_referee_stat_pit[lin_reg_col].notnull()]
-                    if len(df_referee_stat_pit.index) <= 5:
-                        # print("skip")
-                        df_referee_stat_entry[lin_reg_col + "_intercept"] = None
-                        df_referee_stat_entry[lin_reg_col + "_coefficient"] = None
-                        continue
-                    first_matchday = df_referee_stat_pit_col["kick_off_date"].min()
-                    last_matchday = df_referee_stat_pit_col["kick_off_date"].max()
-                    df_referee_stat_pit_col['total_days'] = (
-                            last_matchday - first_matchday + pd.to_timedelta(1, unit='D')).days
-                    df_referee_stat_pit_col['day_since_first_kickoff'] = ((df_referee_stat_pit_col[
-                                                                            "kick_off_date"] - first_matchday + pd.to_timedelta(
-                        1, unit='D')).dt.days.values)
-                    df_referee_stat_pit_col['norm_weight'] = (df_referee_stat_pit_col['day_since_first_kickoff'] / df_referee_stat_pit_col['total_days'])
-
-                    """
-                    # df_team_stat_pit_col["log_weight"] = np.log(df_team_stat_pit_col['norm_weight'])
-                    q = 2
-                    df_referee_stat_pit_col["q_weight"] = (1 // 1.03 + (df_referee_stat_pit_col['norm_weight'] ** q))
-                    # X = (df_team_stat_pit_col["kick_off_date"] - first_matchday).dt.days.values.reshape(-1, 1)
-                    """
-
-                    X = df_referee_stat_pit_col["elo_diff"].values.reshape((-1, 1))
-                    y = df_referee_stat_pit_col[lin_reg_col]
-                    weights = df_referee_stat_pit_col["norm_weight"]
-                    reg = linear_model.LinearRegression().fit(X, y, weights)
-                    # print("intercept=", reg.intercept_, " coefficient=", reg.coef_)
-                    df_referee_stat_entry[lin_reg_col + "_intercept"] = reg.intercept_
-                    df_referee_stat_entry[lin_reg_col + "_coefficient"] = reg.coef_[0]
-                    df_referee_stat_entry[lin_reg_col + "_intercept"] = df_referee_stat_entry[
-                        lin_reg_col + "_intercept"].round(6)
-                    df_referee_stat_entry[lin_reg_col + "_coefficient"] = df_referee_stat_entry[
-                        lin_reg_col + "_coefficient"].round(6)
-                reg_df_list.append(df_referee_stat_entry)
-        df_lin_reg = pd.concat(reg_df_list)
+        # referees are skipped on the number of earlier games, not on the number of non null values
+        df_lin_reg = GroupExecutor.apply(df_referees, "referee", RegressionEngine.point_in_time,
+                                         {"group_col": "referee", "y_cols": lin_reg_cols, "count_valid_only": False,
+                                          "entry_cols": ["game_id", "referee", "kick_off_date"]})
 
         # print(df_team_rating_agg)
         cls._write_parquet(df_lin_reg, './data/silver/referee_profiles/referee_profiles.parquet')
+        cls._write_parquet(RegressionEngine.latest(df_referees, "referee", lin_reg_cols, count_valid_only=False),
+                           './data/silver/referee_profiles_latest/referee_profiles_latest.parquet')
 
     @classmethod
+    @StageMetrics.step
     def _player_elo(cls):
         df_match_info = cls._read_parquet('./data/silver/match_info/*')[["game_id", "kick_off_date"]]
         df_player_stats = cls._read_parquet('./data/silver/player_stats/*')[["game_id", "player_name", "indicator"]]
@@ -489,11 +504,15 @@ class Preprocessor:
                                                                                                   ascending=True)
         goal_data = df_player_stats.merge(goal_data, on=["game_id"], how="inner")
 
-        df_player_elo = cls._read_parquet('./data/silver/player_elo/*')[["game_id", "player_name", "kick_off_date", "new_player_elo","opponnent_elo","old_player_elo"]]
+        # the earlier output is written back in full, so a rerun keeps indicator and goals for the ingestion
+        df_player_elo = cls._read_parquet('./data/silver/player_elo/*')
+        if df_player_elo is None: df_player_elo = pd.DataFrame(columns=["game_id", "kick_off_date", "player_name", "old_player_elo", "new_player_elo", "opponnent_elo", "home_goals", "away_goals", "indicator"])
 
         new_data = goal_data.merge(df_player_elo[["game_id", "player_name"]], on=["game_id","player_name"], how = 'outer', indicator = True)
 
-        goal_data = new_data[~(new_data._merge == 'both')]
+        # the outer merge orders by game_id, games are rated in kick off order so every player continues from his
+        # previous game
+        goal_data = new_data[new_data._merge == 'left_only'].sort_values(by=["kick_off_date", "game_id"], kind="stable")
 
         player_elo_dict = dict()
         for idx, row in tqdm(df_player_elo.iterrows()):
@@ -530,11 +549,12 @@ class Preprocessor:
                                  "away_goals": away_goals, "indicator": indicator})
             except KeyError:
                 pass
-            if new_player_elo is None:
+            if new_player_elo is not None:
                 continue
             df_player = goal_data.loc[goal_data['player_name'] == player_name]
             df_player['p_kick_off_date'] = df_player["kick_off_date"].shift(1)
-            last_game_date = df_player.loc[df_player['game_id'] == game_id]["p_kick_off_date"].iloc[0]
+            last_game_date = cls._last_game_date(player_elo_dict, player_name, kick_off_date,
+                                                 df_player.loc[df_player['game_id'] == game_id]["p_kick_off_date"].iloc[0])
             if player_elo_dict.get(player_name) is None: player_elo_dict[player_name] = dict()
             if player_elo_dict.get(player_name).get(last_game_date) is None:
                 player_elo_dict[player_name][last_game_date] = dict()
@@ -544,13 +564,11 @@ class Preprocessor:
 
             if indicator == "home": opponent_indicator = "away"
             else: opponent_indicator = "home"
+            # the opponnent_elo kept for the player's last game belongs to that game's opponent, it is not reused
             try:
                 opponnent_elo = game_elo_dict[game_id][opponent_indicator]
             except KeyError:
-                try:
-                    opponnent_elo = player_elo_dict[player_name][last_game_date]["opponnent_elo"]
-                except KeyError:
-                    opponnent_elo = None
+                opponnent_elo = None
 
             if opponnent_elo is None:
                 opponnent_elo = 0
@@ -559,7 +577,8 @@ class Preprocessor:
                 for opponent_player in opponent_players:
                     df_opponent_player = goal_data.loc[goal_data['player_name'] == opponent_player]
                     df_opponent_player['p_kick_off_date'] = df_opponent_player["kick_off_date"].shift(1)
-                    last_game_date =  df_opponent_player.loc[df_opponent_player['game_id'] == game_id]["p_kick_off_date"].iloc[0]
+                    last_game_date = cls._last_game_date(player_elo_dict, opponent_player, kick_off_date,
+                                                         df_opponent_player.loc[df_opponent_player['game_id'] == game_id]["p_kick_off_date"].iloc[0])
                     if player_elo_dict.get(opponent_player) is None: player_elo_dict[opponent_player] = dict()
                     if player_elo_dict.get(opponent_player).get(last_game_date) is None:
                         player_elo_dict[opponent_player][last_game_date] = dict()
@@ -568,15 +587,25 @@ class Preprocessor:
                 opponnent_elo = opponnent_elo/len(opponent_players)
 
             new_player_elo, new_opponnent_elo = EloCalculator.calculcate_new_elos(player_elo, opponnent_elo, home_goals, away_goals)
+            if player_elo_dict.get(player_name).get(kick_off_date) is None: player_elo_dict[player_name][kick_off_date] = dict()
             player_elo_dict[player_name][kick_off_date]["player_elo"] = new_player_elo
             elo_list.append({"game_id": game_id, "kick_off_date": kick_off_date, "player_name": player_name,
                              "old_player_elo": player_elo, "new_player_elo": new_player_elo,"opponnent_elo":opponnent_elo,"home_goals": home_goals,
                              "away_goals": away_goals, "indicator":indicator})
         df_elo = pd.DataFrame(elo_list)
-        df_elo = pd.concat(df_elo, df_player_elo)
+        df_elo = pd.concat([df_elo, df_player_elo])
         cls._write_parquet(df_elo, './data/silver/player_elo/player_elo.parquet')
 
     @classmethod
+    def _last_game_date(cls, player_elo_dict, player_name, kick_off_date, last_new_game_date):
+        # a player's first new game follows his latest game of the earlier output, not a fresh 1300
+        if not pd.isnull(last_new_game_date): return last_new_game_date
+        earlier_dates = [date for date in player_elo_dict.get(player_name, dict()).keys()
+                         if not pd.isnull(date) and date < kick_off_date]
+        return max(earlier_dates) if len(earlier_dates) > 0 else last_new_game_date
+
+    @classmethod
+    @StageMetrics.step
     def _coach_elo(cls):
         df_match_info = cls._read_parquet('./data/silver/match_info/*')[["game_id", "kick_off_date"]]
         df_coaches = cls._read_parquet('./data/silver/coaches/*')[["game_id","coach_name","indicator"]]
@@ -629,6 +658,7 @@ class Preprocessor:
         cls._write_parquet(df_elo, './data/silver/coach_elo/coach_elo.parquet')
 
     @classmethod
+    @StageMetrics.step
     def _relationships(cls):
         df_match_info = cls._read_parquet('./data/silver/match_info/*')[["game_id","kick_off_date"]]
         df_coaches = cls._read_parquet('./data/silver/coaches/*')[["game_id", "coach_name","indicator"]].rename(
@@ -636,36 +666,28 @@ class Preprocessor:
         df_player_stats = cls._read_parquet('./data/silver/player_stats/*')[["game_id", "player_name","indicator"]].rename(
             columns={"player_name": "name"})
 
-        df_relationships = pd.concat([df_coaches, df_player_stats])
-        df_relationships = df_match_info.merge(df_relationships, on=["game_id"],how="inner").sort_values(by=["kick_off_date"], ascending=True)
-        relationship_dict = {}
-        game_relationship_dict = {}
-        i = 0
-        for idx, row in tqdm(df_relationships.iterrows()):
-            game_id = row["game_id"]
-            player = row["name"]
-            indicator = row["indicator"]
-            if game_relationship_dict.get(game_id) is None:
-                game_relationship_dict[game_id] = {"home":0,"away":0}
-
-            if relationship_dict.get(player) is None: relationship_dict[player] = dict()
-            co_players = df_relationships[df_relationships["game_id"]==game_id]["name"].tolist()
-            for co_player in co_players:
-                if player == co_player: continue
-                if relationship_dict.get(player).get(co_player) is None: relationship_dict[player][co_player] = 0
-                relationship_dict[player][co_player] += 1
-                game_relationship_dict[game_id][indicator] += relationship_dict[player][co_player]
-
-        team_relationship_list = []
-        for game_id, indicator_dict in game_relationship_dict.items():
-            relationships_home = indicator_dict.get("home")
-            relationships_away = indicator_dict.get("away")
-            relationships_diff = indicator_dict.get("home") - indicator_dict.get("away")
-            team_relationship_list.append({"game_id": game_id, "relationships_home": relationships_home, "relationships_away": relationships_away, "relationships_diff": relationships_diff})
-
-        df_relationships = pd.DataFrame(team_relationship_list)
+        df_relationships = pd.concat([df_coaches, df_player_stats]).drop_duplicates(["game_id", "name", "indicator"])
+        df_relationships = df_match_info.merge(df_relationships, on=["game_id"],how="inner").sort_values(
+            by=["kick_off_date", "game_id"], ascending=True, kind="mergesort")
+
+        game_codes, game_ids = pd.factorize(df_relationships["game_id"])
+        person_codes, person_names = pd.factorize(df_relationships["name"], use_na_sentinel=False)
+        relationship_engine = RelationshipEngine(len(person_names))
+        relationships_home, relationships_away = relationship_engine.process(
+            game_codes, person_codes, (df_relationships["indicator"] == "home").to_numpy(),
+            (df_relationships["indicator"] == "away").to_numpy())
+
+        df_relationships = pd.DataFrame({"game_id": game_ids, "relationships_home": relationships_home,
+                                         "relationships_away": relationships_away,
+                                         "relationships_diff": relationships_home - relationships_away})
         cls._write_parquet(df_relationships, './data/silver/relationships/relationships.parquet')
 
+        # games together per pair of people after the latest game, for relationships of upcoming fixtures
+        df_pairs = relationship_engine.pair_frame()
+        df_pairs["person_a"] = person_names[df_pairs["person_a"].to_numpy()]
+        df_pairs["person_b"] = person_names[df_pairs["person_b"].to_numpy()]
+        cls._write_parquet(df_pairs, './data/silver/relationship_pairs/relationship_pairs.parquet')
+
     @classmethod
     def _clean_kicker_name_string(cls, df):
         df["player_name"] = df["player_name"].str.split(pat="/").str[0].str.strip()
@@ -0,0 +1,87 @@
+import pandas as pd
+import numpy as np
+
+MOMENTS = ["w", "wx", "wy", "wxx", "wxy", "n"]
+
+
+class RegressionEngine:
+    """
+    Point-in-time weighted linear regressions y ~ elo_diff per entity (team, referee).
+
+    For every entity and kick-off date the regression is fitted on all earlier games of the entity,
+    weighted by the days since the entity's first usable kick-off. The weights of a row never change once
+    the first kick-off is known (the normalisation by total_days cancels out in the fit), so running weighted
+    moments per entity give the same intercept and coefficient as refitting sklearn's LinearRegression.
+    """
+
+    @classmethod
+    def point_in_time(cls, df, group_col, y_cols, x_col="elo_diff", date_col="kick_off_date", entry_cols=None,
+                      min_samples=5, count_valid_only=True, round_digits=6):
+        if entry_cols is None: entry_cols = [group_col, date_col]
+        df, df_moments = cls._moments(df, group_col, y_cols, x_col, date_col)
+        keys = [df[group_col], df[date_col]]
+
+        # moments per entity and kick-off date, accumulated over all strictly earlier kick-off dates
+        df_moments = df_moments.groupby(keys, sort=True).sum()
+        df_moments = df_moments.groupby(level=0).cumsum() - df_moments
+        df_moments = df_moments.reindex(pd.MultiIndex.from_arrays(keys))
+
+        df_entry = df[entry_cols].copy()
+        result = cls._profiles(df_moments, y_cols, min_samples, count_valid_only, round_digits)
+        return pd.concat([df_entry, pd.DataFrame(result, index=df_entry.index)], axis=1)
+
+    @classmethod
+    def latest(cls, df, group_col, y_cols, x_col="elo_diff", date_col="kick_off_date", min_samples=5,
+               count_valid_only=True, round_digits=6):
+        # profile of every entity over all of its games, i.e. for a game after its last known kick-off
+        df, df_moments = cls._moments(df, group_col, y_cols, x_col, date_col)
+        df_moments = df_moments.groupby(df[group_col], sort=True).sum()
+        result = cls._profiles(df_moments, y_cols, min_samples, count_valid_only, round_digits)
+        return pd.DataFrame(result, index=df_moments.index).reset_index()
+
+    @classmethod
+    def _moments(cls, df, group_col, y_cols, x_col, date_col):
+        df = df[df[date_col].notnull() & df[group_col].notnull()]
+        df = df.sort_values(by=[group_col, date_col], ascending=True, kind="mergesort").reset_index(drop=True)
+
+        x = df[x_col].to_numpy(dtype="float64", na_value=np.nan)
+        moments = {}
+        for y_col in y_cols:
+            y = df[y_col].to_numpy(dtype="float64", na_value=np.nan)
+            valid = ~np.isnan(x) & ~np.isnan(y)
+            first_kick_off = df[date_col].where(valid).groupby(df[group_col]).transform("min")
+            weight = ((df[date_col] - first_kick_off).dt.days + 1).to_numpy(dtype="float64", na_value=0)
+            weight = np.where(valid, weight, 0)
+            x_valid = np.where(valid, x, 0)
+            y_valid = np.where(valid, y, 0)
+            moments[y_col + "_w"] = weight
+            moments[y_col + "_wx"] = weight * x_valid
+            moments[y_col + "_wy"] = weight * y_valid
+            moments[y_col + "_wxx"] = weight * x_valid * x_valid
+            moments[y_col + "_wxy"] = weight * x_valid * y_valid
+            moments[y_col + "_n"] = valid.astype("float64")
+        moments["rows_n"] = np.ones(len(df.index))
+        return df, pd.DataFrame(moments)
+
+    @classmethod
+    def _profiles(cls, df_moments, y_cols, min_samples, count_valid_only, round_digits):
+        result = {}
+        for y_col in y_cols:
+            w, wx, wy, wxx, wxy, n = [df_moments[y_col + "_" + moment].to_numpy() for moment in MOMENTS]
+            if not count_valid_only: n = df_moments["rows_n"].to_numpy()
+            intercept, coefficient = cls._solve(w, wx, wy, wxx, wxy)
+            skip = (n <= min_samples) | (w <= 0)
+            result[y_col + "_intercept"] = np.where(skip, np.nan, intercept).round(round_digits)
+            result[y_col + "_coefficient"] = np.where(skip, np.nan, coefficient).round(round_digits)
+        return result
+
+    @classmethod
+    def _solve(cls, w, wx, wy, wxx, wxy):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sxx = w * wxx - wx * wx
+            sxy = w * wxy - wx * wy
+            # constant elo_diff: least squares falls back to a flat line through the weighted mean
+            flat = np.abs(sxx) <= 1e-12 * np.abs(w * wxx)
+            coefficient = np.where(flat, 0.0, sxy / np.where(flat, 1.0, sxx))
+            intercept = (wy - coefficient * wx) / w
+        return intercept, coefficient
@@ -0,0 +1,121 @@
+import pandas as pd
+import numpy as np
+from tqdm import tqdm
+
+MAX_CHUNK_PAIRS = 5000000
+
+
+class RelationshipEngine:
+    """
+    Counts how often two people (players and coaches) have been on the pitch in the same game.
+
+    People are integer ids and the counts are kept as a sorted array of pair keys (id_a * n_people + id_b) with a
+    parallel count array. Games are processed chronologically in chunks: every pair of a game adds its number of
+    games together so far (including this one) to the sides of both people.
+    """
+
+    def __init__(self, n_people):
+        self.n_people = n_people
+        self.pair_keys = np.empty(0, dtype="int64")
+        self.pair_counts = np.empty(0, dtype="int64")
+
+    def process(self, game_codes, person_codes, is_home, is_away):
+        # rows have to be sorted by game code in chronological order
+        n_games = int(game_codes.max()) + 1 if len(game_codes) > 0 else 0
+        relationships_home = np.zeros(n_games, dtype="int64")
+        relationships_away = np.zeros(n_games, dtype="int64")
+        if n_games == 0: return relationships_home, relationships_away
+
+        game_starts = np.flatnonzero(np.r_[True, game_codes[1:] != game_codes[:-1]])
+        game_ends = np.r_[game_starts[1:], len(game_codes)]
+        game_pairs = (game_ends - game_starts) * (game_ends - game_starts - 1) // 2
+
+        chunk_of_game = (np.cumsum(game_pairs) - game_pairs) // MAX_CHUNK_PAIRS
+        chunk_starts = np.r_[0, np.flatnonzero(np.diff(chunk_of_game)) + 1, len(game_starts)]
+
+        for c in tqdm(range(len(chunk_starts) - 1)):
+            row_start = game_starts[chunk_starts[c]]
+            row_end = game_ends[chunk_starts[c + 1] - 1]
+            a, b = self._game_pairs(game_codes[row_start:row_end])
+            a += row_start
+            b += row_start
+            other_person = person_codes[a] != person_codes[b]
+            a, b = a[other_person], b[other_person]
+            together = self._count_and_update(person_codes[a], person_codes[b])
+            for side, is_side in [(relationships_home, is_home), (relationships_away, is_away)]:
+                side += np.bincount(game_codes[a], weights=together * is_side[a], minlength=n_games).astype("int64")
+                side += np.bincount(game_codes[b], weights=together * is_side[b], minlength=n_games).astype("int64")
+        return relationships_home, relationships_away
+
+    def score(self, game_codes, person_codes, is_home, is_away):
+        # relationships of upcoming games from the current counts, without counting the games themselves;
+        # person codes >= n_people are people without any earlier game
+        n_games = int(game_codes.max()) + 1 if len(game_codes) > 0 else 0
+        relationships_home = np.zeros(n_games, dtype="int64")
+        relationships_away = np.zeros(n_games, dtype="int64")
+        if n_games == 0: return relationships_home, relationships_away
+
+        a, b = self._game_pairs(game_codes)
+        other_person = person_codes[a] != person_codes[b]
+        a, b = a[other_person], b[other_person]
+        person_a, person_b = person_codes[a], person_codes[b]
+        keys = np.minimum(person_a, person_b).astype("int64") * self.n_people + np.maximum(person_a, person_b)
+        together = self._known_counts(keys, np.maximum(person_a, person_b) < self.n_people) + 1
+        for side, is_side in [(relationships_home, is_home), (relationships_away, is_away)]:
+            side += np.bincount(game_codes[a], weights=together * is_side[a], minlength=n_games).astype("int64")
+            side += np.bincount(game_codes[b], weights=together * is_side[b], minlength=n_games).astype("int64")
+        return relationships_home, relationships_away
+
+    @classmethod
+    def from_pairs(cls, person_a, person_b, games_together, n_people):
+        relationship_engine = cls(n_people)
+        keys = np.minimum(person_a, person_b).astype("int64") * n_people + np.maximum(person_a, person_b)
+        order = np.argsort(keys, kind="stable")
+        relationship_engine.pair_keys = keys[order]
+        relationship_engine.pair_counts = np.asarray(games_together, dtype="int64")[order]
+        return relationship_engine
+
+    def pair_frame(self):
+        return pd.DataFrame({"person_a": self.pair_keys // self.n_people, "person_b": self.pair_keys % self.n_people,
+                             "games_together": self.pair_counts})
+
+    @classmethod
+    def _game_pairs(cls, game_codes):
+        # every row is paired with all following rows of its game
+        game_end = np.r_[np.flatnonzero(game_codes[1:] != game_codes[:-1]) + 1, len(game_codes)]
+        row_end = np.repeat(game_end, np.diff(np.r_[0, game_end]))
+        partners = row_end - np.arange(len(game_codes)) - 1
+        a = np.repeat(np.arange(len(game_codes)), partners)
+        offset = np.arange(len(a)) - np.repeat(np.cumsum(partners) - partners, partners)
+        return a, a + 1 + offset
+
+    def _count_and_update(self, person_a, person_b):
+        keys = np.minimum(person_a, person_b).astype("int64") * self.n_people + np.maximum(person_a, person_b)
+        # games together before this chunk
+        together = self._known_counts(keys, np.ones(len(keys), dtype=bool))
+
+        # games together earlier in this chunk: pairs are generated in game order, so a stable sort keeps it
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        key_start = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+        first_of_key = np.maximum.accumulate(np.where(key_start, np.arange(len(keys)), 0))
+        earlier = np.empty(len(keys), dtype="int64")
+        earlier[order] = np.arange(len(keys)) - first_of_key
+        together = together + earlier + 1
+
+        chunk_keys, chunk_counts = np.unique(keys, return_counts=True)
+        position = np.searchsorted(self.pair_keys, chunk_keys)
+        known = position < len(self.pair_keys)
+        known[known] = self.pair_keys[position[known]] == chunk_keys[known]
+        self.pair_counts[position[known]] += chunk_counts[known]
+        self.pair_keys = np.insert(self.pair_keys, position[~known], chunk_keys[~known])
+        self.pair_counts = np.insert(self.pair_counts, position[~known], chunk_counts[~known])
+        return together
+
+    def _known_counts(self, keys, known):
+        position = np.searchsorted(self.pair_keys, keys)
+        known = known & (position < len(self.pair_keys))
+        known[known] = self.pair_keys[position[known]] == keys[known]
+        counts = np.zeros(len(keys), dtype="int64")
+        counts[known] = self.pair_counts[position[known]]
+        return counts
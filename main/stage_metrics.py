@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import time
+import uuid
+import resource
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+
+METRICS_PATH = './data/metrics/'
+METRICS_FILE = 'stage_metrics.jsonl'
+TEXTFILE = 'stage_metrics.prom'
+RUN_ENV = 'KRAKE_PAUL_RUN_ID'
+# record field: (prometheus gauge, help text), a step that ran several times in a run is summed, its peak is the max
+PROMETHEUS_GAUGES = {"wall_seconds": ("krake_paul_step_wall_seconds", "wall time of the step"),
+                     "cpu_seconds": ("krake_paul_step_cpu_seconds", "cpu time of the step and its waited for children"),
+                     "rows_in": ("krake_paul_step_rows_in", "rows read by the step"),
+                     "rows_out": ("krake_paul_step_rows_out", "rows written by the step"),
+                     "bytes_read": ("krake_paul_step_bytes_read", "parquet bytes read by the step"),
+                     "bytes_written": ("krake_paul_step_bytes_written", "parquet bytes written by the step"),
+                     "peak_rss_bytes": ("krake_paul_step_peak_rss_bytes", "peak resident set size during the step")}
+
+
+class StageMetrics:
+    """
+    Instrumentation of pipeline steps. Every measured step (an Executor stage or a Preprocessor, Ingestor, model or
+    BetMaker step) appends one JSON line to data/metrics/stage_metrics.jsonl with wall time, cpu time, rows and parquet
+    bytes read and written (counted by the _read_parquet/_write_parquet helpers) and the peak RSS of the process while
+    the step ran. Records carry the run id, so steps can be trended across runs, and Executor.execute writes the
+    latest run as a Prometheus textfile next to it.
+    """
+
+    _active = []
+
+    @classmethod
+    def start_run(cls):
+        # stage processes spawned by the Executor inherit the run id through the environment
+        os.environ[RUN_ENV] = datetime.now().strftime("%Y%m%dT%H%M%S") + "_" + uuid.uuid4().hex[:6]
+        return os.environ[RUN_ENV]
+
+    @classmethod
+    def run_id(cls):
+        if RUN_ENV not in os.environ: cls.start_run()
+        return os.environ[RUN_ENV]
+
+    @classmethod
+    @contextmanager
+    def measure(cls, step, **labels):
+        # the kernel's peak RSS is reset for every step, open outer steps keep the peak seen so far
+        peak_rss = cls._peak_rss()
+        for record in cls._active: record["peak_rss_bytes"] = max(record["peak_rss_bytes"], peak_rss)
+        cls._reset_peak_rss()
+        record = {"run_id": cls.run_id(), "step": step, "parent": cls._active[-1]["step"] if cls._active else None,
+                  "pid": os.getpid(), "start": str(datetime.now()), "rows_in": 0, "rows_out": 0, "bytes_read": 0,
+                  "bytes_written": 0, "peak_rss_bytes": cls._peak_rss()}
+        record.update(labels)
+        cls._active.append(record)
+        start_time = time.perf_counter()
+        start_cpu = cls._cpu_seconds()
+        status = "failed"
+        try:
+            yield record
+            status = "ok"
+        finally:
+            cls._active.remove(record)
+            record["wall_seconds"] = time.perf_counter() - start_time
+            record["cpu_seconds"] = cls._cpu_seconds() - start_cpu
+            record["peak_rss_bytes"] = max(record["peak_rss_bytes"], cls._peak_rss())
+            record["status"] = status
+            for outer in cls._active: outer["peak_rss_bytes"] = max(outer["peak_rss_bytes"], record["peak_rss_bytes"])
+            cls._append(record)
+
+    @classmethod
+    def step(cls, func):
+        # decorator, measures every call of func under its qualified name, e.g. Preprocessor._player_elo
+        @functools.wraps(func)
+        def measured(*args, **kwargs):
+            with cls.measure(func.__qualname__):
+                return func(*args, **kwargs)
+        return measured
+
+    @classmethod
+    def count_read(cls, rows, n_bytes):
+        for record in cls._active:
+            record["rows_in"] += int(rows)
+            record["bytes_read"] += int(n_bytes)
+
+    @classmethod
+    def count_write(cls, rows, n_bytes):
+        for record in cls._active:
+            record["rows_out"] += int(rows)
+            record["bytes_written"] += int(n_bytes)
+
+    @classmethod
+    def read_records(cls, run_id=None):
+        metrics_path = os.path.join(METRICS_PATH, METRICS_FILE)
+        if not os.path.exists(metrics_path): return []
+        with open(metrics_path, 'r') as metrics_file:
+            records = [json.loads(line) for line in metrics_file if line.strip() != ""]
+        return [record for record in records if run_id is None or record["run_id"] == run_id]
+
+    @classmethod
+    def history(cls, field="wall_seconds", runs=10):
+        # step x run table of one field over the latest runs, for spotting the step that regressed
+        import pandas as pd
+        df_records = pd.DataFrame(cls.read_records())
+        if len(df_records.index) == 0: return df_records
+        run_ids = df_records.groupby("run_id")["start"].min().sort_values().index[-runs:]
+        aggregation = "max" if field == "peak_rss_bytes" else "sum"
+        df_history = df_records[df_records["run_id"].isin(run_ids)].pivot_table(index="step", columns="run_id",
+                                                                                values=field, aggfunc=aggregation)
+        return df_history[[run_id for run_id in run_ids if run_id in df_history.columns]]
+
+    @classmethod
+    def write_textfile(cls, run_id=None):
+        # node_exporter textfile collector format, written to a temporary file and renamed so it is never read half
+        if run_id is None: run_id = cls.run_id()
+        steps = dict()
+        for record in cls.read_records(run_id):
+            step = steps.setdefault(record["step"], {field: 0 for field in PROMETHEUS_GAUGES.keys()})
+            for field in PROMETHEUS_GAUGES.keys():
+                if field == "peak_rss_bytes": step[field] = max(step[field], record.get(field, 0))
+                else: step[field] += record.get(field, 0)
+        if len(steps) == 0: return
+        lines = ["# HELP krake_paul_run_timestamp_seconds end of the run the step gauges belong to",
+                 "# TYPE krake_paul_run_timestamp_seconds gauge",
+                 'krake_paul_run_timestamp_seconds{run_id="' + run_id + '"} ' + str(round(time.time(), 3))]
+        for field, (gauge, help_text) in PROMETHEUS_GAUGES.items():
+            lines += ["# HELP " + gauge + " " + help_text, "# TYPE " + gauge + " gauge"]
+            lines += [gauge + '{step="' + step + '"} ' + str(round(values[field], 6)) for step, values in sorted(steps.items())]
+        textfile_path = os.path.join(METRICS_PATH, TEXTFILE)
+        with open(textfile_path + ".tmp", 'w') as textfile:
+            textfile.write("\n".join(lines) + "\n")
+        os.replace(textfile_path + ".tmp", textfile_path)
+        print("finished writing ", textfile_path, " with ", len(steps), " steps")
+
+    @classmethod
+    def _append(cls, record):
+        # one write per line in append mode, so stage processes running in parallel do not interleave records
+        os.makedirs(METRICS_PATH, exist_ok=True)
+        with open(os.path.join(METRICS_PATH, METRICS_FILE), 'a') as metrics_file:
+            metrics_file.write(json.dumps(record) + "\n")
+
+    @classmethod
+    def _cpu_seconds(cls):
+        times = os.times()
+        return times.user + times.system + times.children_user + times.children_system
+
+    @classmethod
+    def _peak_rss(cls):
+        try:
+            with open('/proc/self/status', 'r') as status_file:
+                for line in status_file:
+                    if line.startswith("VmHWM:"): return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        # without /proc the peak is the one of the whole process, in bytes on macOS and kilobytes elsewhere
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+    @classmethod
+    def _reset_peak_rss(cls):
+        try:
+            with open('/proc/self/clear_refs', 'w') as clear_refs: clear_refs.write("5")
+        except OSError:
+            pass
@@ -0,0 +1,270 @@
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta
+import pandas as pd
+import numpy as np
+
+BRONZE_PATH = './data/bronze/'
+# name parts of the generated people, the umlauts and accents are the ones the fifa name cleaning transliterates
+FIRST_NAMES = ["Jonas", "Lukas", "Leon", "Felix", "Paul", "Elias", "Noah", "Tim", "Jan", "Nico", "Max", "David",
+               "Marco", "Luca", "Mateo", "Diego", "Pablo", "Hugo", "Theo", "Enzo", "Kai", "Emre", "Arda", "Milan",
+               "Luka", "Ivan", "Jakub", "Mats", "Sven", "Timo", "Joël", "André", "Sérgio", "Nuno", "Iñaki", "Ömer"]
+LAST_NAME_STARTS = ["Bern", "Hof", "Schmi", "Kl", "Wag", "Mül", "Schä", "Brö", "Hart", "Lind", "Rosen", "Stein",
+                    "Wald", "Kra", "Fisch", "Bäck", "Gün", "Yıl", "Nov", "Petr", "Kovač", "Mar", "Fer", "Gar",
+                    "Lop", "San", "Mor", "Ros", "Ben", "Dub", "Lef", "Jans", "De Vr", "Van Di", "Sil"]
+LAST_NAME_ENDS = ["hardt", "mann", "dt", "inger", "ner", "ler", "fer", "ker", "berg", "ström", "feld", "meier",
+                  "ić", "ović", "ski", "ez", "es", "ini", "etti", "ard", "ois", "sen", "ijk", "a", "os", "doğan"]
+# transliteration of the kicker url slugs, same replacements as Preprocessor._clean_fifa_name_string
+SLUG_REPLACEMENTS = {"ü": "ue", "ä": "ae", "ö": "oe", "ç": "c", "á": "a", "à": "a", "è": "e", "é": "e", "ć": "c",
+                     "č": "c", "š": "s", "ð": "d", "í": "i", "ï": "i", "ø": "oe", "ğ": "g", "ş": "s", "ñ": "n",
+                     "ł": "l", "ó": "o", "ã": "a", "ă": "a", "ë": "e", "ı": "i"}
+POSITIONS = {"GK": 3, "CB": 5, "LB": 2, "RB": 2, "CDM": 2, "CM": 3, "LM": 1, "RM": 1, "CAM": 1, "LW": 1, "RW": 1,
+             "ST": 2}
+LINE_UP = ["GK", "LB", "CB", "CB", "RB", "CDM", "CM", "CM", "LW", "ST", "RW"]
+RATING_COLUMNS = ["ball_control", "dribbling", "slide_tackle", "stand_tackle", "aggression", "reactions",
+                  "att_position", "interceptions", "vision", "composure", "crossing", "short_pass", "long_pass",
+                  "acceleration", "stamina", "strength", "balance", "sprint_speed", "agility", "jumping", "heading",
+                  "shot_power", "finishing", "long_shots", "curve", "fk_acc", "penalties", "volleys", "gk_positioning",
+                  "gk_diving", "gk_handling", "gk_kicking", "gk_reflexes"]
+
+
+class SyntheticData:
+    """
+    Generates bronze match_info, team_stats, player_stats, coaches and player_ratings tables in the format of the
+    kicker and fifa scrapers for N leagues x S seasons x matchdays (a double round robin of the league's teams).
+    Squads, coaches and referees are consistent over the matchdays and seasons of a league, with transfers and coach
+    changes between and within seasons, so every preprocessing step sees the entity histories it would see on
+    scraped data. Results follow the team strengths, so elos, profiles and relationships are not pure noise.
+    """
+
+    @classmethod
+    def generate(cls, leagues=1, seasons=2, teams=10, matchdays=None, squad_size=24, start_year=13, seed=0,
+                 bronze_path=BRONZE_PATH):
+        rng = np.random.default_rng(seed)
+        names = cls._name_pool(rng)
+        rows = {"match_info": 0, "team_stats": 0, "player_stats": 0, "coaches": 0, "player_ratings": 0}
+        ratings = {start_year + s: [] for s in range(seasons)}
+        for league_index in range(leagues):
+            league = "synthetic-league-" + str(league_index + 1).zfill(2)
+            league_code = "SYN" + str(league_index + 1).zfill(2)
+            squads, coaches, strengths = cls._teams(rng, names, teams, squad_size)
+            referees = [cls._person(names, "schiedsrichter") for _ in range(max(teams, 8))]
+            for s in range(seasons):
+                year = start_year + s
+                if s > 0: cls._transfers(rng, names, squads, coaches, strengths)
+                tables = cls._season(rng, names, league, league_code, year, squads, coaches, strengths, referees,
+                                     matchdays)
+                for table_name, data_list in tables.items():
+                    cls._write(pd.DataFrame(data_list), bronze_path, table_name, league + "_" + str(year) + "_" +
+                               str(year + 1) + "_1_" + str(max(row["match_day"] for row in tables["match_info"])))
+                    rows[table_name] += len(data_list)
+                ratings[year] += cls._player_ratings(rng, year, squads)
+        for year, rating_list in ratings.items():
+            cls._write(pd.DataFrame(rating_list), bronze_path, "player_ratings", "players_fifa" + str(year))
+            rows["player_ratings"] += len(rating_list)
+        print("finished generating ", leagues, " leagues x ", seasons, " seasons: ", json.dumps(rows))
+        return rows
+
+    @classmethod
+    def _name_pool(cls, rng):
+        # every person is drawn once from the shuffled first x last name combinations, then from double last names
+        last_names = list(dict.fromkeys(start + end for start in LAST_NAME_STARTS for end in LAST_NAME_ENDS))
+        for name in rng.permutation([first + " " + last for first in FIRST_NAMES for last in last_names]).tolist():
+            yield name
+        while True:
+            yield (FIRST_NAMES[int(rng.integers(len(FIRST_NAMES)))] + " " + last_names[int(rng.integers(len(last_names)))]
+                   + "-" + last_names[int(rng.integers(len(last_names)))])
+
+    @classmethod
+    def _person(cls, names, role):
+        name = next(names)
+        slug = name.lower()
+        for special_char, replace_char in SLUG_REPLACEMENTS.items(): slug = slug.replace(special_char, replace_char)
+        return {"name": name, "slug": slug.replace(" ", "-") + "/" + role}
+
+    @classmethod
+    def _new_player(cls, rng, names, position, strength):
+        player = cls._person(names, "spieler")
+        player.update({"position": position, "quality": float(np.clip(rng.normal(62 + 8 * strength, 7), 40, 94)),
+                       "birth_year": int(rng.integers(1984, 2004)), "height": int(rng.normal(182, 6)),
+                       "in_fifa": bool(rng.random() < 0.93), "short_name": bool(rng.random() < 0.05)})
+        return player
+
+    @classmethod
+    def _teams(cls, rng, names, teams, squad_size):
+        squads, coaches, strengths = dict(), dict(), dict()
+        for _ in range(teams):
+            team_name = next(names).split(" ")[1] + " " + ["FC", "SV", "United", "City", "Athletic"][int(rng.integers(5))]
+            while team_name in squads: team_name = team_name + " II"
+            strengths[team_name] = float(rng.normal(0, 1))
+            positions = [position for position, count in POSITIONS.items() for _ in range(count)]
+            positions += rng.choice(list(POSITIONS.keys())[1:], max(0, squad_size - len(positions))).tolist()
+            squads[team_name] = [cls._new_player(rng, names, position, strengths[team_name])
+                                 for position in positions[:max(squad_size, len(LINE_UP))]]
+            coaches[team_name] = cls._person(names, "trainer")
+        return squads, coaches, strengths
+
+    @classmethod
+    def _transfers(cls, rng, names, squads, coaches, strengths):
+        # about a fifth of every squad is replaced between seasons, some players move within the league
+        team_names = list(squads.keys())
+        for team_name in team_names:
+            strengths[team_name] = float(0.7 * strengths[team_name] + 0.3 * rng.normal(0, 1))
+            for p, player in enumerate(squads[team_name]):
+                if rng.random() >= 0.2: continue
+                other_team = team_names[int(rng.integers(len(team_names)))]
+                candidates = [q for q, other in enumerate(squads[other_team]) if other["position"] == player["position"]]
+                if other_team != team_name and rng.random() < 0.3 and len(candidates) > 0:
+                    q = candidates[int(rng.integers(len(candidates)))]
+                    squads[team_name][p], squads[other_team][q] = squads[other_team][q], player
+                else:
+                    squads[team_name][p] = cls._new_player(rng, names, player["position"], strengths[team_name])
+            if rng.random() < 0.25: coaches[team_name] = cls._person(names, "trainer")
+
+    @classmethod
+    def _schedule(cls, rng, team_names):
+        # circle method round robin, the second half of the season repeats the first with home and away swapped
+        team_list = list(rng.permutation(team_names))
+        if len(team_list) % 2 == 1: team_list.append(None)
+        rounds = []
+        for r in range(len(team_list) - 1):
+            pairs = [(team_list[i], team_list[-1 - i]) for i in range(len(team_list) // 2)]
+            rounds.append([(home, away) if r % 2 == 0 else (away, home) for home, away in pairs
+                           if home is not None and away is not None])
+            team_list = [team_list[0]] + [team_list[-1]] + team_list[1:-1]
+        return rounds + [[(away, home) for home, away in pairs] for pairs in rounds]
+
+    @classmethod
+    def _season(cls, rng, names, league, league_code, year, squads, coaches, strengths, referees, matchdays):
+        season = str(year) + "-" + str(year + 1)
+        rounds = cls._schedule(rng, list(squads.keys()))
+        if matchdays is not None: rounds = rounds[:matchdays]
+        ranking = {team: rank + 1 for rank, team in enumerate(sorted(strengths, key=strengths.get, reverse=True))}
+        season_start = datetime(2000 + year, 8, 15)
+        yellow_cards = dict()
+        tables = {"match_info": [], "team_stats": [], "player_stats": [], "coaches": []}
+        for m, pairs in enumerate(rounds):
+            match_day = m + 1
+            for g, (home, away) in enumerate(pairs):
+                game_id = hashlib.md5((league + season + str(match_day) + home + away).encode('utf-8')).hexdigest()
+                kick_off = season_start + timedelta(days=7 * m + int(rng.integers(0, 3)),
+                                                    hours=int(rng.choice([15, 18, 20])), minutes=int(rng.choice([0, 30])))
+                referee = referees[int(rng.integers(len(referees)))]
+                tables["match_info"].append({"game_id": game_id, "season": season, "match_day": match_day,
+                                             "weekday": ["Mo", "Di", "Mi", "Do", "Fr", "Sa", "So"][kick_off.weekday()],
+                                             "kick_off_time": kick_off.strftime("%d.%m.%Y, %H:%M"),
+                                             "referee": referee["slug"]})
+                home_goals = int(rng.poisson(np.exp(0.35 + 0.3 * (strengths[home] - strengths[away]))))
+                away_goals = int(rng.poisson(np.exp(0.1 + 0.3 * (strengths[away] - strengths[home]))))
+                possession = int(np.clip(rng.normal(50 + 6 * (strengths[home] - strengths[away]), 6), 25, 75))
+                for indicator, team, goals, share in [("home", home, home_goals, possession),
+                                                      ("away", away, away_goals, 100 - possession)]:
+                    tables["team_stats"].append(cls._team_stats(rng, game_id, season, match_day, indicator, team,
+                                                                goals, share, ranking[team]))
+                    # one coach change in about every tenth team season, at a random matchday
+                    if rng.random() < 0.1 / max(len(rounds), 1): coaches[team] = cls._person(names, "trainer")
+                    tables["coaches"].append({"game_id": game_id, "season": season, "matchday": match_day,
+                                              "indicator": indicator, "coach_name": coaches[team]["slug"]})
+                    tables["player_stats"] += cls._line_up(rng, game_id, season, match_day, indicator, squads[team],
+                                                           goals, yellow_cards)
+        for data_list in tables.values():
+            for row in data_list: row["league_code"] = league_code
+        return tables
+
+    @classmethod
+    def _team_stats(cls, rng, game_id, season, match_day, indicator, team, goals, possession, rank):
+        passes = int(rng.normal(300 + 6 * possession, 40))
+        tackles = int(rng.normal(110, 15))
+        return {"game_id": game_id, "season": season, "match_day": match_day, "indicator": indicator,
+                "team_name": team, "ht_goals": str(int(rng.binomial(goals, 0.45))), "position": str(rank) + ". Platz",
+                "goals": str(goals), "shots_on_goal": str(goals + int(rng.poisson(3 + possession / 25))),
+                "distance": str(round(float(rng.normal(114, 4)), 1)).replace(".", ",") + " km",
+                "total_passes": str(passes), "pass_ratio": str(int(np.clip(rng.normal(70 + possession / 5, 4), 50, 95))) + "%",
+                "crosses": str(int(rng.poisson(15))), "cross_ratio": str(int(rng.integers(15, 40))) + "%",
+                "dribblings": str(int(rng.poisson(14))), "dribble_reatio": str(int(rng.integers(35, 65))) + "%",
+                "possession": str(possession) + "%", "tackles": str(tackles),
+                "tackle_ratio": str(int(np.clip(rng.normal(50, 5), 30, 70))) + "%",
+                "air_tackles": str(int(rng.poisson(30))), "air_tackle_ratio": str(int(rng.integers(35, 65))) + "%",
+                "fouls": str(int(rng.poisson(12))), "got_fouled": str(int(rng.poisson(12))),
+                "offside": str(int(rng.poisson(2))), "corners": str(int(rng.poisson(4 + possession / 25)))}
+
+    @classmethod
+    def _line_up(cls, rng, game_id, season, matchday, indicator, squad, goals, yellow_cards):
+        # the best available player per line up slot starts, form decides between players of similar quality
+        form = {player["slug"]: player["quality"] + rng.normal(0, 5) for player in squad}
+        starters = []
+        for position in LINE_UP:
+            candidates = [player for player in squad if player not in starters and
+                          (player["position"] == position or position not in [p["position"] for p in squad])]
+            if len(candidates) == 0: candidates = [player for player in squad if player not in starters]
+            starters.append(max(candidates, key=lambda player: form[player["slug"]]))
+        bench = [player for player in squad if player not in starters and player["position"] != "GK"]
+        substitutions = []
+        for minute in sorted(rng.integers(46, 89, 3).tolist()):
+            if len(bench) == 0: break
+            substitutions.append((starters[int(rng.integers(1, len(starters)))], bench.pop(int(rng.integers(len(bench)))), minute))
+
+        entries = {player["slug"]: {"goals": None, "sub_in": None, "sub_out": None} for player in starters}
+        for player_out, player_in, minute in substitutions:
+            if entries.get(player_out["slug"], {}).get("sub_out") is not None: continue
+            entries[player_out["slug"]]["sub_out"] = str(minute) + "'"
+            entries[player_in["slug"]] = {"goals": None, "sub_in": str(minute) + "'", "sub_out": None}
+        on_pitch = [slug for slug in entries.keys() if slug != starters[0]["slug"]]
+        for _ in range(goals):
+            scorer = on_pitch[int(rng.integers(len(on_pitch)))]
+            entries[scorer]["goals"] = (entries[scorer]["goals"] or 0) + 1
+
+        line_up = []
+        for slug, entry in entries.items():
+            row = {"game_id": game_id, "season": season, "matchday": matchday, "indicator": indicator,
+                   "player_name": slug, "goals": entry["goals"], "sub_in": entry["sub_in"], "sub_out": entry["sub_out"],
+                   "card_time": None, "card_description": None, "yellow_card": None, "yellow_red_card": None,
+                   "red_card": None}
+            card = rng.random()
+            if card < 0.1:
+                yellow_cards[(season, slug)] = yellow_cards.get((season, slug), 0) + 1
+                row.update({"card_time": str(int(rng.integers(1, 91))) + "'", "yellow_card": 1, "yellow_red_card": 0,
+                            "red_card": 0, "card_description": "Gelbe Karte (" + str(yellow_cards[(season, slug)]) + ".)"})
+            elif card < 0.105:
+                row.update({"card_time": str(int(rng.integers(30, 91))) + "'", "yellow_card": 0, "yellow_red_card": 1,
+                            "red_card": 0})
+            elif card < 0.108:
+                row.update({"card_time": str(int(rng.integers(1, 91))) + "'", "yellow_card": 0, "yellow_red_card": 0,
+                            "red_card": 1})
+            line_up.append(row)
+        return line_up
+
+    @classmethod
+    def _player_ratings(cls, rng, year, squads):
+        # one fifa edition per season, with the squad at the start of the season and a few players not covered
+        rating_list = []
+        for team_name, squad in squads.items():
+            for player in squad:
+                if not player["in_fifa"]: continue
+                first_name, last_name = player["name"].split(" ", 1)
+                name = first_name[0] + ". " + last_name if player["short_name"] else player["name"]
+                is_gk = player["position"] == "GK"
+                ratings = np.clip(rng.normal(player["quality"], 8, len(RATING_COLUMNS)), 10, 99).astype(int)
+                if not is_gk: ratings[-5:] = rng.integers(5, 16, 5)
+                else: ratings[:-5] = np.clip(ratings[:-5] - 30, 10, 99)
+                row = {"fifa": year, "player_id": hashlib.md5(player["slug"].encode('utf-8')).hexdigest()[:8],
+                       "preferred_position_1": player["position"], "preferred_position_2": None,
+                       "preferred_position_3": None, "preferred_position_4": None, "team_link": "/teams/" + team_name,
+                       "team_name": team_name, "national_team_link": None, "national_team_name": None,
+                       "height": str(player["height"]) + "cm", "weight": str(int(player["height"] - 105 + rng.normal(0, 5))) + "kg",
+                       "preferred_foot": "Left" if rng.random() < 0.25 else "Right",
+                       "birth_date": "Jan 1, " + str(player["birth_year"]), "age": str(2000 + year - player["birth_year"]),
+                       "player_work_rate": "Medium/ Medium", "weak_foot": int(rng.integers(2, 6)),
+                       "skill_moves": 1 if is_gk else int(rng.integers(2, 6)), "nationality_id": None,
+                       "nationality": None, "name": name}
+                if not is_gk and rng.random() < 0.3:
+                    row["preferred_position_2"] = list(POSITIONS.keys())[int(rng.integers(1, len(POSITIONS)))]
+                row.update({column: str(rating) for column, rating in zip(RATING_COLUMNS, ratings)})
+                rating_list.append(row)
+        return rating_list
+
+    @classmethod
+    def _write(cls, df, bronze_path, table_name, file_name):
+        os.makedirs(os.path.join(bronze_path, table_name), exist_ok=True)
+        df.to_parquet(os.path.join(bronze_path, table_name, file_name + ".parquet"), index=False)
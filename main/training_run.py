@@ -0,0 +1,80 @@
+import os
+import json
+import time
+import shutil
+from datetime import datetime
+import pandas as pd
+
+RUNS_PATH = './models/runs/'
+CHECKPOINT_PATH = './models/checkpoints/'
+MONITOR = "val_loss"
+PATIENCE = 10
+MIN_DELTA = 1e-4
+
+
+class TrainingRun:
+    """
+    Fits a compiled model on a validation split with early stopping instead of a fixed number of epochs.
+
+    Every epoch is backed up to models/checkpoints/<run_name>, so a killed job resumes from its last finished epoch
+    on the next train call, and the weights with the best validation loss are kept separately and restored at the
+    end. The per-epoch history of all attempts, the test metrics and the wall time are written to
+    models/runs/<run_name>.json, the checkpoints are deleted once the run has finished.
+    """
+
+    @classmethod
+    def fit(cls, model, run_name, ds_train, ds_validation, ds_test=None, epochs=100, patience=PATIENCE,
+            monitor=MONITOR):
+        import tensorflow as tf
+        checkpoint_dir = os.path.join(CHECKPOINT_PATH, run_name)
+        backup_dir = os.path.join(checkpoint_dir, "backup")
+        best_weights_path = os.path.join(checkpoint_dir, "best.weights.h5")
+        history_path = os.path.join(checkpoint_dir, "history.csv")
+        resumed = os.path.isdir(backup_dir)
+        best_value = cls._best_value(history_path, monitor) if resumed else None
+        if not resumed: shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        if resumed: print("resuming training run ", run_name, " best ", monitor, "=", best_value)
+
+        callbacks = [tf.keras.callbacks.BackupAndRestore(backup_dir),
+                     tf.keras.callbacks.CSVLogger(history_path, append=resumed),
+                     tf.keras.callbacks.ModelCheckpoint(best_weights_path, monitor=monitor, save_best_only=True,
+                                                        save_weights_only=True, initial_value_threshold=best_value),
+                     tf.keras.callbacks.EarlyStopping(monitor=monitor, patience=patience, min_delta=MIN_DELTA)]
+        # restoring a backup needs the weights to exist before fit
+        if not model.built: model.build(ds_train.element_spec[0].shape)
+        start_time = time.perf_counter()
+        model.fit(ds_train, validation_data=ds_validation, epochs=epochs, callbacks=callbacks)
+        wall_seconds = time.perf_counter() - start_time
+
+        if os.path.exists(best_weights_path): model.load_weights(best_weights_path)
+        df_history = pd.read_csv(history_path).drop_duplicates(subset=["epoch"], keep="last")
+        best_row = df_history.loc[df_history[monitor].idxmin()]
+        run_record = {"run_name": run_name, "finished": str(datetime.now()), "resumed": resumed,
+                      "max_epochs": epochs, "epochs": len(df_history.index), "stopped_early": len(df_history.index) < epochs,
+                      "best_epoch": int(best_row["epoch"]) + 1, "monitor": monitor, "best_value": float(best_row[monitor]),
+                      "wall_seconds": round(wall_seconds, 3),
+                      "test_metrics": model.evaluate(ds_test, return_dict=True) if ds_test is not None else None,
+                      "history": df_history.to_dict(orient="list")}
+        cls._write_run_record(run_record, os.path.join(RUNS_PATH, run_name + ".json"))
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        print("finished training run ", run_name, " epochs=", run_record["epochs"], " best_epoch=",
+              run_record["best_epoch"], " ", monitor, "=", round(run_record["best_value"], 4), " in ",
+              run_record["wall_seconds"], "s")
+        return run_record
+
+    @classmethod
+    def _best_value(cls, history_path, monitor):
+        if not os.path.exists(history_path): return None
+        df_history = pd.read_csv(history_path)
+        if len(df_history.index) == 0: return None
+        return float(df_history[monitor].min())
+
+    @classmethod
+    def _write_run_record(cls, run_record, file_path):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        run_record["test_metrics"] = None if run_record["test_metrics"] is None else \
+            {name: float(value) for name, value in run_record["test_metrics"].items()}
+        with open(file_path, 'w') as run_file:
+            json.dump(run_record, run_file, indent=2)
+        print("finished writing ", file_path)
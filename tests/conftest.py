@@ -0,0 +1,16 @@
+import os
+import sys
+import shutil
+import pytest
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_PATH)
+
+
+@pytest.fixture
+def work_path(tmp_path, monkeypatch):
+    # the pipeline reads and writes relative to the working directory, like a run from the repository root
+    shutil.copytree(os.path.join(REPOSITORY_PATH, "config"), str(tmp_path / "config"))
+    os.makedirs(str(tmp_path / "job_bookmark"))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
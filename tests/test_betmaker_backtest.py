@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+from main import betmaker
+from main.betmaker import BetMaker
+
+EDGE_THRESHOLDS = [0.0, 0.02, 0.05, 0.1]
+STAKINGS = [["flat", 0.01], ["flat", 0.05], ["kelly", 0.25], ["kelly", 1.0]]
+LEAGUE_FILTERS = [None, ["GER1"], ["GER1", "ENG1"]]
+MAX_STAKE = 0.25
+
+
+def games(seed=0, n_games=300):
+    rng = np.random.default_rng(seed)
+    probabilities = rng.dirichlet([4, 2.5, 3], size=n_games)
+    odds = 1 / (rng.dirichlet([4, 2.5, 3], size=n_games) * 1.05)
+    # games without odds or with broken odds are never bet
+    odds[rng.choice(n_games, size=10, replace=False), 1] = np.nan
+    odds[rng.choice(n_games, size=5, replace=False), 2] = 0.9
+    outcomes = np.array([rng.choice(3, p=p) for p in probabilities])
+    league_codes = rng.choice(["GER1", "ENG1", "ESP1"], size=n_games)
+    return probabilities, odds, outcomes, league_codes
+
+
+def loop_backtest(probabilities, odds, outcomes, league_codes, edge_threshold, staking, league_filter):
+    # one bet after the other on a running bankroll
+    bankroll, peak, turnover, bets, hits, max_drawdown = 1.0, 1.0, 0.0, 0, 0, 0.0
+    for game in range(len(outcomes)):
+        if not (np.isfinite(odds[game]).all() and (odds[game] > 1).all() and np.isfinite(probabilities[game]).all()):
+            continue
+        edges = probabilities[game] * odds[game] - 1
+        pick = int(np.argmax(edges))
+        if edges[pick] < edge_threshold or (league_filter is not None and league_codes[game] not in league_filter):
+            continue
+        if staking[0] == "kelly":
+            amount = min(staking[1] * max(edges[pick] / (odds[game][pick] - 1), 0), MAX_STAKE) * bankroll
+        else:
+            amount = staking[1]
+        won = pick == outcomes[game]
+        bankroll += amount * (odds[game][pick] - 1) if won else -amount
+        turnover += amount
+        bets += 1
+        hits += int(won)
+        peak = max(peak, bankroll)
+        max_drawdown = max(max_drawdown, 1 - bankroll / peak)
+    return {"bets": bets, "hit_rate": hits / max(bets, 1), "turnover": turnover, "profit": bankroll - 1,
+            "roi": (bankroll - 1) / turnover if turnover > 0 else np.nan, "max_drawdown": max_drawdown,
+            "final_bankroll": bankroll}
+
+
+def test_backtest_matches_the_loop(monkeypatch):
+    # a small strategy chunk runs the strategies over several chunks
+    monkeypatch.setattr(betmaker, "STRATEGY_CHUNK", 5)
+    probabilities, odds, outcomes, league_codes = games()
+    df_backtest, curves = BetMaker.backtest(probabilities, odds, outcomes, league_codes, EDGE_THRESHOLDS, STAKINGS,
+                                            LEAGUE_FILTERS, max_stake=MAX_STAKE, return_curves=True)
+    assert len(df_backtest.index) == len(EDGE_THRESHOLDS) * len(STAKINGS) * len(LEAGUE_FILTERS) == len(curves)
+
+    row = 0
+    for edge_threshold in EDGE_THRESHOLDS:
+        for staking in STAKINGS:
+            for league_filter in LEAGUE_FILTERS:
+                expected = loop_backtest(probabilities, odds, outcomes, league_codes, edge_threshold, staking, league_filter)
+                actual = df_backtest.iloc[row]
+                assert actual["edge_threshold"] == edge_threshold and actual["staking"] == staking[0]
+                assert actual["league_filter"] == ("all" if league_filter is None else ",".join(league_filter))
+                assert actual["bets"] == expected["bets"]
+                for metric in ["hit_rate", "turnover", "profit", "roi", "max_drawdown", "final_bankroll"]:
+                    np.testing.assert_allclose(actual[metric], expected[metric], rtol=1e-9, atol=1e-12, err_msg=metric)
+                np.testing.assert_allclose(curves[row][-1], expected["final_bankroll"], rtol=1e-6)
+                row += 1
+    assert (df_backtest["bets"] > 0).all()
+
+
+def test_backtest_without_games():
+    df_backtest = BetMaker.backtest(np.empty((0, 3)), np.empty((0, 3)), np.empty(0, dtype=int), np.empty(0, dtype=object),
+                                    EDGE_THRESHOLDS, STAKINGS, LEAGUE_FILTERS, max_stake=MAX_STAKE)
+    assert (df_backtest["bets"] == 0).all() and (df_backtest["final_bankroll"] == 1.0).all()
+    assert df_backtest["roi"].isna().all()
+    pd.testing.assert_series_equal(df_backtest["max_drawdown"], pd.Series(0.0, index=df_backtest.index), check_names=False)
@@ -0,0 +1,75 @@
+import os
+from main import build_cache
+from main.build_cache import BuildCache
+
+STAGE = "coaches"
+VERSION = {"start_year": 13, "end_year": 24}
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as open_file:
+        open_file.write(content)
+
+
+def set_mtime(path, offset_seconds):
+    file_stat = os.stat(path)
+    os.utime(path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + offset_seconds * 10 ** 9))
+
+
+def run_stage():
+    write_file("./data/silver/coaches/coaches.parquet", "silver coaches")
+    BuildCache.record(STAGE, VERSION)
+
+
+def test_stage_is_fresh_until_an_input_changes(work_path):
+    write_file("./data/bronze/coaches/coaches_13.csv", "coach;team")
+    assert not BuildCache.is_fresh(STAGE, VERSION)
+    run_stage()
+    assert BuildCache.is_fresh(STAGE, VERSION)
+
+    # a new mtime with the same content is hashed again and still fresh
+    set_mtime("./data/bronze/coaches/coaches_13.csv", 60)
+    assert BuildCache.is_fresh(STAGE, VERSION)
+
+    # same size and new content
+    write_file("./data/bronze/coaches/coaches_13.csv", "coach;club")
+    assert not BuildCache.is_fresh(STAGE, VERSION)
+    run_stage()
+    assert BuildCache.is_fresh(STAGE, VERSION)
+
+    write_file("./data/bronze/coaches/coaches_14.csv", "coach;team")
+    assert not BuildCache.is_fresh(STAGE, VERSION)
+    run_stage()
+    os.remove("./data/bronze/coaches/coaches_14.csv")
+    assert not BuildCache.is_fresh(STAGE, VERSION)
+
+
+def test_stage_is_stale_when_its_output_or_version_changes(work_path, monkeypatch):
+    write_file("./data/bronze/coaches/coaches_13.csv", "coach;team")
+    run_stage()
+    write_file("./data/silver/coaches/coaches.parquet", "edited by hand")
+    assert not BuildCache.is_fresh(STAGE, VERSION)
+    run_stage()
+    os.remove("./data/silver/coaches/coaches.parquet")
+    assert not BuildCache.is_fresh(STAGE, VERSION)
+
+    run_stage()
+    assert not BuildCache.is_fresh(STAGE, dict(VERSION, end_year=25))
+    monkeypatch.setattr(build_cache, "CACHE_VERSION", build_cache.CACHE_VERSION + 1)
+    assert not BuildCache.is_fresh(STAGE, VERSION)
+
+
+def test_unchanged_files_are_not_hashed_again(work_path, monkeypatch):
+    write_file("./data/bronze/coaches/coaches_13.csv", "coach;team")
+    write_file("./data/bronze/coaches/coaches_14.csv", "coach;team")
+    run_stage()
+    hashed = []
+    md5 = BuildCache._md5
+    monkeypatch.setattr(BuildCache, "_md5", classmethod(lambda cls, file: hashed.append(file) or md5(file)))
+    assert BuildCache.is_fresh(STAGE, VERSION)
+    assert hashed == []
+
+    set_mtime("./data/bronze/coaches/coaches_14.csv", 60)
+    assert BuildCache.is_fresh(STAGE, VERSION)
+    assert hashed == ["./data/bronze/coaches/coaches_14.csv"]
@@ -0,0 +1,96 @@
+import os
+import json
+import pandas as pd
+from main import feature_store
+from main.feature_store import FeatureStore
+
+FEATURE_CONFIG = './config/mapping_features_v3.json'
+
+
+def write_silver(table_name, df, parts=1):
+    os.makedirs("./data/silver/" + table_name, exist_ok=True)
+    for part in range(parts):
+        df.iloc[part::parts].to_parquet("./data/silver/" + table_name + "/part_" + str(part) + ".parquet", index=False)
+
+
+def silver_tables(games=6):
+    df_team_elo = pd.DataFrame({"game_id": ["game_" + str(game) for game in range(games)],
+                                "home_elo": [1300.0 + game for game in range(games)], "away_elo": 1300.0})
+    df_team_stats = pd.DataFrame({"game_id": ["game_" + str(game // 2) for game in range(2 * games)],
+                                  "indicator": ["home", "away"] * games, "corners": list(range(2 * games))})
+    return df_team_elo, df_team_stats
+
+
+def test_feature_version_is_stable(work_path, monkeypatch):
+    version = FeatureStore.feature_version(FEATURE_CONFIG)
+    assert version == FeatureStore.feature_version(FEATURE_CONFIG)
+
+    # the same config written in another key order is the same version
+    feature_columns = json.load(open(FEATURE_CONFIG, 'r'))
+    with open("reordered.json", 'w') as fp:
+        json.dump(dict(reversed(list(feature_columns.items()))), fp, indent=2)
+    assert FeatureStore.feature_version("reordered.json") == version
+
+    feature_columns[list(feature_columns.keys())[0]] = []
+    with open("changed.json", 'w') as fp:
+        json.dump(feature_columns, fp)
+    assert FeatureStore.feature_version("changed.json") != version
+
+    monkeypatch.setattr(feature_store, "FEATURE_CODE_VERSION", feature_store.FEATURE_CODE_VERSION + 1)
+    assert FeatureStore.feature_version(FEATURE_CONFIG) != version
+
+
+def test_source_hashes_are_stable(work_path):
+    df_team_elo, df_team_stats = silver_tables()
+    write_silver("team_elo", df_team_elo.assign(modify_timestamp="2024-01-01"))
+    write_silver("team_stats", df_team_stats)
+    df_hashes = FeatureStore._source_hashes().set_index("game_id")["source_hash"]
+
+    # row order, the split into files and the modify_timestamp do not change a game's hash
+    for table_name in ["team_elo", "team_stats"]:
+        for file in os.listdir("./data/silver/" + table_name): os.remove("./data/silver/" + table_name + "/" + file)
+    write_silver("team_elo", df_team_elo.iloc[::-1].assign(modify_timestamp="2025-06-30"), parts=2)
+    write_silver("team_stats", df_team_stats.sample(frac=1, random_state=0), parts=3)
+    pd.testing.assert_series_equal(FeatureStore._source_hashes().set_index("game_id")["source_hash"].loc[df_hashes.index],
+                                   df_hashes)
+
+    # a changed row only changes the hash of its game
+    df_team_stats.loc[df_team_stats["game_id"] == "game_2", "corners"] += 1
+    write_silver("team_stats", df_team_stats, parts=3)
+    df_changed = FeatureStore._source_hashes().set_index("game_id")["source_hash"].loc[df_hashes.index]
+    assert (df_changed != df_hashes).tolist() == [game_id == "game_2" for game_id in df_hashes.index]
+
+    # the same rows in another silver table hash differently
+    for file in os.listdir("./data/silver/team_stats"): os.remove("./data/silver/team_stats/" + file)
+    write_silver("coach_elo", df_team_stats)
+    assert (FeatureStore._source_hashes().set_index("game_id")["source_hash"].loc[df_hashes.index] != df_changed).all()
+
+
+def test_update_rebuilds_changed_games_only(work_path):
+    built = []
+
+    def build_features(feature_columns, game_ids=None):
+        built.append(sorted(game_ids))
+        df_team_elo = pd.read_parquet("./data/silver/team_elo")
+        df_team_elo = df_team_elo[df_team_elo["game_id"].isin(game_ids)]
+        return pd.DataFrame({"game_id": df_team_elo["game_id"], "elo_diff": df_team_elo["home_elo"] - df_team_elo["away_elo"]})
+
+    df_team_elo, df_team_stats = silver_tables()
+    write_silver("team_elo", df_team_elo)
+    write_silver("team_stats", df_team_stats)
+    version = FeatureStore.update(FEATURE_CONFIG, build_features)
+    assert built[-1] == sorted(df_team_elo["game_id"])
+
+    FeatureStore.update(FEATURE_CONFIG, build_features)
+    assert len(built) == 1
+
+    df_team_elo.loc[df_team_elo["game_id"] == "game_3", "home_elo"] = 1500.0
+    write_silver("team_elo", df_team_elo.iloc[:-1])
+    assert FeatureStore.update(FEATURE_CONFIG, build_features) == version
+    # game_5 left team_elo but still has team_stats rows, so it is a changed game that builds to nothing
+    assert built[-1] == ["game_3", "game_5"]
+    df_features = FeatureStore.read_features(FEATURE_CONFIG).set_index("game_id")
+    assert sorted(df_features.index) == ["game_" + str(game) for game in range(5)]
+    assert df_features.loc["game_3", "elo_diff"] == 200.0
+    manifest = json.load(open(os.path.dirname(FeatureStore.features_path(version)) + "/manifest.json", 'r'))
+    assert manifest["feature_code_version"] == feature_store.FEATURE_CODE_VERSION and manifest["games"] == 5
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+from main.regression_engine import RegressionEngine
+
+linear_model = pytest.importorskip("sklearn.linear_model")
+
+Y_COLS = ["corners", "goals"]
+
+
+def team_stats(seed=0, teams=3, games=24):
+    rng = np.random.default_rng(seed)
+    df_list = []
+    for team in range(teams):
+        # a few games share a kick off date, so the strictly earlier filter matters
+        days = np.sort(rng.choice(np.arange(0, 400, 4), size=games - 4, replace=False))
+        days = np.sort(np.concatenate([days, rng.choice(days, size=4)]))
+        df_team = pd.DataFrame({"game_id": ["g" + str(team) + "_" + str(game) for game in range(games)],
+                                "team_name": "team_" + str(team),
+                                "kick_off_date": pd.Timestamp("2020-08-01") + pd.to_timedelta(days, unit="D"),
+                                "elo_diff": rng.normal(0, 80, size=games)})
+        df_team["corners"] = 5 + 0.01 * df_team["elo_diff"] + rng.normal(0, 1, size=games)
+        df_team["goals"] = 1.4 + 0.004 * df_team["elo_diff"] + rng.normal(0, 0.5, size=games)
+        df_team.loc[rng.choice(games, size=5, replace=False), "corners"] = np.nan
+        df_list.append(df_team)
+    return pd.concat(df_list, ignore_index=True)
+
+
+def sklearn_point_in_time(df_team_stats, y_cols):
+    # the per kick off date refit the team profiles were built with before RegressionEngine
+    entry_list = []
+    for _, df_team_stat in df_team_stats.groupby("team_name"):
+        for kick_off_date in df_team_stat["kick_off_date"].drop_duplicates().sort_values().tolist():
+            df_pit = df_team_stat[df_team_stat["kick_off_date"] < kick_off_date]
+            df_entry = df_team_stat[df_team_stat["kick_off_date"] == kick_off_date][["game_id", "team_name"]].copy()
+            for y_col in y_cols:
+                df_pit_col = df_pit[df_pit[y_col].notnull()]
+                if len(df_pit_col.index) <= 5:
+                    df_entry[y_col + "_intercept"] = np.nan
+                    df_entry[y_col + "_coefficient"] = np.nan
+                    continue
+                first_matchday = df_pit_col["kick_off_date"].min()
+                total_days = (df_pit_col["kick_off_date"].max() - first_matchday + pd.to_timedelta(1, unit='D')).days
+                weights = (df_pit_col["kick_off_date"] - first_matchday + pd.to_timedelta(1, unit='D')).dt.days / total_days
+                reg = linear_model.LinearRegression().fit(df_pit_col["elo_diff"].values.reshape((-1, 1)),
+                                                          df_pit_col[y_col], weights)
+                df_entry[y_col + "_intercept"] = round(reg.intercept_, 6)
+                df_entry[y_col + "_coefficient"] = round(reg.coef_[0], 6)
+            entry_list.append(df_entry)
+    return pd.concat(entry_list)
+
+
+def test_point_in_time_matches_sklearn():
+    df_team_stats = team_stats()
+    df_engine = RegressionEngine.point_in_time(df_team_stats, "team_name", Y_COLS, entry_cols=["game_id", "team_name"])
+    df_sklearn = sklearn_point_in_time(df_team_stats, Y_COLS)
+
+    df_compare = df_sklearn.merge(df_engine, on=["game_id", "team_name"], how="outer", suffixes=("_sklearn", "_engine"))
+    assert len(df_compare.index) == len(df_team_stats.index)
+    for y_col in Y_COLS:
+        for term in ["_intercept", "_coefficient"]:
+            expected = df_compare[y_col + term + "_sklearn"].to_numpy(dtype="float64")
+            actual = df_compare[y_col + term + "_engine"].to_numpy(dtype="float64")
+            np.testing.assert_array_equal(np.isnan(actual), np.isnan(expected))
+            np.testing.assert_allclose(actual, expected, rtol=0, atol=2e-6, equal_nan=True)
+    # the first games of every team have no profile, later ones do
+    assert df_compare["goals_intercept_engine"].isna().any() and df_compare["goals_intercept_engine"].notna().any()
+
+
+def test_latest_matches_sklearn_on_all_games():
+    df_team_stats = team_stats(seed=1)
+    df_latest = RegressionEngine.latest(df_team_stats, "team_name", Y_COLS).set_index("team_name")
+    # the latest profile is the point in time profile of a game after the last kick off date
+    df_next = df_team_stats.groupby("team_name").tail(1).copy()
+    df_next["game_id"] = df_next["team_name"] + "_next"
+    df_next["kick_off_date"] = df_next["kick_off_date"] + pd.to_timedelta(1, unit="D")
+    df_sklearn = sklearn_point_in_time(pd.concat([df_team_stats, df_next], ignore_index=True), Y_COLS)
+    df_sklearn = df_sklearn[df_sklearn["game_id"].str.endswith("_next")].set_index("team_name")
+    for column in [y_col + term for y_col in Y_COLS for term in ["_intercept", "_coefficient"]]:
+        np.testing.assert_allclose(df_latest.loc[df_sklearn.index, column].to_numpy(dtype="float64"),
+                                   df_sklearn[column].to_numpy(dtype="float64"), rtol=0, atol=2e-6)
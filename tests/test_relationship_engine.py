@@ -0,0 +1,76 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from main import relationship_engine
+from main.preprocessor import Preprocessor
+
+
+def write_silver(table_name, df):
+    os.makedirs("./data/silver/" + table_name, exist_ok=True)
+    df.to_parquet("./data/silver/" + table_name + "/" + table_name + ".parquet", index=False)
+
+
+def lineups(seed=0, teams=6, games=40, squad=14, lineup=11):
+    rng = np.random.default_rng(seed)
+    squads = {team: ["player_" + str(team) + "_" + str(player) for player in range(squad)] for team in range(teams)}
+    match_list, coach_list, player_list = [], [], []
+    for game in range(games):
+        game_id = "game_" + str(game)
+        home_team, away_team = rng.choice(teams, size=2, replace=False)
+        match_list.append({"game_id": game_id, "kick_off_date": pd.Timestamp("2021-08-01") + pd.Timedelta(days=3 * game)})
+        for team, indicator in [(home_team, "home"), (away_team, "away")]:
+            coach_list.append({"game_id": game_id, "coach_name": "coach_" + str(team), "indicator": indicator})
+            player_list += [{"game_id": game_id, "player_name": player, "indicator": indicator}
+                            for player in rng.choice(squads[team], size=lineup, replace=False)]
+        # a transfer: players meet former team mates as opponents
+        if game == games // 2: squads[0][0], squads[1][0] = squads[1][0], squads[0][0]
+    # the match info is not ordered by kick off date
+    return pd.DataFrame(match_list).sample(frac=1, random_state=seed), pd.DataFrame(coach_list), pd.DataFrame(player_list)
+
+
+def loop_relationships(df_match_info, df_coaches, df_player_stats):
+    # the row by row count the relationships were built with before RelationshipEngine
+    df_relationships = pd.concat([df_coaches.rename(columns={"coach_name": "name"}),
+                                  df_player_stats.rename(columns={"player_name": "name"})])
+    df_relationships = df_match_info.merge(df_relationships, on=["game_id"], how="inner").sort_values(by=["kick_off_date"])
+    relationship_dict = {}
+    game_relationship_dict = {}
+    for _, row in df_relationships.iterrows():
+        game_id, player, indicator = row["game_id"], row["name"], row["indicator"]
+        if game_relationship_dict.get(game_id) is None: game_relationship_dict[game_id] = {"home": 0, "away": 0}
+        if relationship_dict.get(player) is None: relationship_dict[player] = dict()
+        for co_player in df_relationships[df_relationships["game_id"] == game_id]["name"].tolist():
+            if player == co_player: continue
+            if relationship_dict.get(player).get(co_player) is None: relationship_dict[player][co_player] = 0
+            relationship_dict[player][co_player] += 1
+            game_relationship_dict[game_id][indicator] += relationship_dict[player][co_player]
+    df_games = pd.DataFrame([{"game_id": game_id, "relationships_home": counts["home"], "relationships_away": counts["away"],
+                              "relationships_diff": counts["home"] - counts["away"]}
+                             for game_id, counts in game_relationship_dict.items()])
+    pair_counts = {tuple(sorted([player, co_player])): games for player, co_players in relationship_dict.items()
+                   for co_player, games in co_players.items()}
+    return df_games, pair_counts
+
+
+@pytest.mark.parametrize("max_chunk_pairs", [relationship_engine.MAX_CHUNK_PAIRS, 500])
+def test_relationships_match_the_loop(work_path, monkeypatch, max_chunk_pairs):
+    # a small chunk size splits the games over many chunks, pairs have to carry over between them
+    monkeypatch.setattr(relationship_engine, "MAX_CHUNK_PAIRS", max_chunk_pairs)
+    df_match_info, df_coaches, df_player_stats = lineups()
+    write_silver("match_info", df_match_info)
+    write_silver("coaches", df_coaches)
+    write_silver("player_stats", df_player_stats)
+    Preprocessor._relationships()
+
+    df_expected, pair_counts = loop_relationships(df_match_info, df_coaches, df_player_stats)
+    df_actual = pd.read_parquet("./data/silver/relationships/relationships.parquet").drop(columns=["modify_timestamp"])
+    df_compare = df_expected.merge(df_actual, on=["game_id"], how="outer", suffixes=("_loop", "_engine"))
+    assert len(df_compare.index) == len(df_match_info.index)
+    for column in ["relationships_home", "relationships_away", "relationships_diff"]:
+        np.testing.assert_array_equal(df_compare[column + "_engine"].to_numpy(), df_compare[column + "_loop"].to_numpy())
+
+    df_pairs = pd.read_parquet("./data/silver/relationship_pairs/relationship_pairs.parquet")
+    actual_pairs = {tuple(sorted([person_a, person_b])): games for person_a, person_b, games
+                    in zip(df_pairs["person_a"], df_pairs["person_b"], df_pairs["games_together"])}
+    assert actual_pairs == pair_counts